@@ -0,0 +1,17 @@
+import shop.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_alter_user_groups'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='logo',
+            field=models.ImageField(blank=True, null=True, storage=shop.storage.select_media_storage, upload_to='logos/'),
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 
+from shop.storage import select_media_storage
+
 
 class User(AbstractUser):
     ROLE_CHOICES = (
@@ -11,7 +13,7 @@ class User(AbstractUser):
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='customer')
     phone = models.CharField(max_length=50, blank=True)
     company_name = models.CharField(max_length=255, blank=True)
-    logo = models.ImageField(upload_to='logos/', blank=True, null=True)
+    logo = models.ImageField(upload_to='logos/', storage=select_media_storage, blank=True, null=True)
 
     def __str__(self):
         return f"{self.username} ({self.role})"
\ No newline at end of file
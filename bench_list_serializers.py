@@ -0,0 +1,106 @@
+"""
+Compare ProductSerializer / OrderListSerializer with the .values() projections
+in shop.projections on 1k, 10k and 100k rows.
+
+Runs against a throwaway test database, so it is safe to point at any settings:
+
+    python bench_list_serializers.py [--sizes 1000,10000,100000]
+"""
+import argparse
+import os
+import time
+from decimal import Decimal
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecom.settings')
+django.setup()
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from rest_framework.test import APIRequestFactory
+
+from shop.models import Shop, Product, ProductImage, Order, OrderItem
+from shop.plans import PRODUCT_PLAN, ORDER_PLAN
+from shop.projections import ProductProjection, OrderProjection
+from shop.serializers import ProductSerializer, OrderListSerializer
+
+User = get_user_model()
+
+def seed(count):
+    Order.objects.all().delete()
+    Product.objects.all().delete()
+    vendor, _ = User.objects.get_or_create(username='bench-vendor', defaults={'role': 'vendor'})
+    shop, _ = Shop.objects.get_or_create(owner=vendor, defaults={'name': 'Bench Shop', 'logo': 'shop_logos/bench.png'})
+
+    products = Product.objects.bulk_create([
+        Product(vendor=vendor, shop=shop, title=f'Product {i}', price=Decimal('9.99'),
+                image=f'products/bench_{i}.png', stock=10)
+        for i in range(count)
+    ], batch_size=2000)
+    ProductImage.objects.bulk_create([
+        ProductImage(product=p, image=f'products/bench_{p.id}_{j}.png', order=j + 1)
+        for p in products for j in range(2)
+    ], batch_size=2000)
+
+    orders = Order.objects.bulk_create([
+        Order(guest_name='Bench', guest_email='bench@example.com', guest_phone='0', guest_address='-',
+              shipping_phone='0', shipping_address='-', total_amount=Decimal('19.98'))
+        for _ in range(count)
+    ], batch_size=2000)
+    OrderItem.objects.bulk_create([
+        OrderItem(order=o, product=products[i], vendor=vendor, product_title=products[i].title,
+                  quantity=2, price=Decimal('9.99'))
+        for i, o in enumerate(orders)
+    ], batch_size=2000)
+
+def timed(fn):
+    start = time.perf_counter()
+    data = fn()
+    return time.perf_counter() - start, data
+
+def bench(count):
+    request = APIRequestFactory().get('/')
+    products = PRODUCT_PLAN.apply(Product.objects.order_by('-id'))
+    orders = ORDER_PLAN.apply(Order.objects.order_by('-id'))
+
+    def context():
+        return {'request': request}
+
+    results = []
+    for label, run_serializer, run_projection in (
+        ('products',
+         lambda: ProductSerializer(products.all(), many=True, context=context()).data,
+         lambda: (p := ProductProjection(context())).serialize(p.values(products.all()))),
+        ('orders',
+         lambda: OrderListSerializer(orders.all(), many=True, context=context()).data,
+         lambda: (p := OrderProjection(context())).serialize(p.values(orders.all()))),
+    ):
+        serializer_time, expected = timed(run_serializer)
+        projection_time, actual = timed(run_projection)
+        same = [dict(row) for row in expected] == actual
+        results.append((label, count, serializer_time, projection_time, same))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='1000,10000,100000')
+    args = parser.parse_args()
+    sizes = [int(s) for s in args.sizes.split(',')]
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        print(f"{'list':<10}{'rows':>8}{'serializer':>13}{'projection':>13}{'speedup':>9}  same output")
+        for count in sizes:
+            seed(count)
+            for label, rows, serializer_time, projection_time, same in bench(count):
+                print(f'{label:<10}{rows:>8}{serializer_time:>12.2f}s{projection_time:>12.2f}s'
+                      f'{serializer_time / projection_time:>8.1f}x  {same}')
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+if __name__ == '__main__':
+    main()
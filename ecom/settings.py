@@ -2,6 +2,7 @@ import os
 from pathlib import Path
 import dj_database_url
 from dotenv import load_dotenv
+from corsheaders.defaults import default_headers
 
 # Load environment variables from backend/.env when running locally
 load_dotenv()
@@ -76,6 +77,11 @@ if DEBUG and not os.getenv("DATABASE_URL"):
         "NAME": BASE_DIR / "db.sqlite3",
     }
 
+# The early migrations patch the production schema with raw PostgreSQL SQL and
+# cannot rebuild it from scratch, so test databases are created from the models.
+# shop.tests.MigrationTests unapplies and reapplies the migrations from 0010 on.
+DATABASES["default"]["TEST"] = {"MIGRATE": False}
+
 AUTH_USER_MODEL = 'accounts.User'
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -99,10 +105,59 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Seconds to share media existence checks across requests (0 = per-request only)
+MEDIA_EXISTS_CACHE_TTL = int(os.getenv('MEDIA_EXISTS_CACHE_TTL', '0'))
+# Store uploaded images by content hash, once per unique file (see shop.storage); read at startup
+MEDIA_CONTENT_ADDRESSED = os.getenv('MEDIA_CONTENT_ADDRESSED', 'true').lower() == 'true'
+# Serve MEDIA_URL with cache headers, ETags, ranges and precompressed files (see shop.serving);
+# without it media is only served by django.conf.urls.static in DEBUG
+SERVE_MEDIA = os.getenv('SERVE_MEDIA', 'true' if DEBUG else 'false').lower() == 'true'
+# Cache lifetime of media whose name is not content-addressed
+MEDIA_MAX_AGE = int(os.getenv('MEDIA_MAX_AGE', '3600'))
+# Derivatives written next to each product image / shop logo (see shop.thumbnails)
+THUMBNAIL_WIDTHS = (160, 480, 960)
+THUMBNAIL_WORKERS = int(os.getenv('THUMBNAIL_WORKERS', '2'))
+
+# Stream uploads to temporary files instead of memory; product image batches
+# are validated and stored in a pool of IMAGE_UPLOAD_WORKERS threads (see shop.uploads)
+FILE_UPLOAD_HANDLERS = ['django.core.files.uploadhandler.TemporaryFileUploadHandler']
+IMAGE_UPLOAD_WORKERS = int(os.getenv('IMAGE_UPLOAD_WORKERS', '4'))
+# Larger batches are answered right away and processed in the background
+IMAGE_UPLOAD_SYNC_LIMIT = int(os.getenv('IMAGE_UPLOAD_SYNC_LIMIT', '4'))
+
+# Responses of POST /api/shop/orders/ sent with an Idempotency-Key are replayed for this many
+# seconds (see shop.idempotency); duplicates of a request in progress wait up to IDEMPOTENCY_WAIT
+IDEMPOTENCY_KEY_TTL = int(os.getenv('IDEMPOTENCY_KEY_TTL', '86400'))
+IDEMPOTENCY_WAIT = float(os.getenv('IDEMPOTENCY_WAIT', '5'))
+# Unfinished claims older than this are taken over as abandoned; keep it above the worker timeout
+IDEMPOTENCY_CLAIM_TIMEOUT = int(os.getenv('IDEMPOTENCY_CLAIM_TIMEOUT', '120'))
+
+# Rows fetched per database round trip (and written per response chunk) by order exports
+ORDER_EXPORT_CHUNK_SIZE = int(os.getenv('ORDER_EXPORT_CHUNK_SIZE', '2000'))
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Local-memory cache by default; set CACHE_DIR to share a file-based cache
+# between worker processes (required for the catalog cache with several workers)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+if os.getenv('CACHE_DIR'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('CACHE_DIR'),
+    }
+
+# Anonymous catalog responses (see shop.cache)
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', '300'))
+# Serve product and order lists from .values() rows (see shop.projections)
+LIST_PROJECTIONS_ENABLED = os.getenv('LIST_PROJECTIONS_ENABLED', 'true').lower() == 'true'
+
 CORS_ALLOW_ALL_ORIGINS = True
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
@@ -1,8 +1,12 @@
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from shop.serving import serve_media
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/auth/', include('ecom.jwt_urls')),
@@ -10,5 +14,9 @@ urlpatterns = [
     path('api/shop/', include('shop.urls')),
 ]
 
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+if settings.SERVE_MEDIA:
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')), serve_media),
+    ]
+elif settings.DEBUG:
+    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,96 @@
+"""
+Response cache for anonymous catalog reads.
+
+Cached responses are keyed by the view, the full request URL and the current
+value of every version counter the response depends on (``catalog``, ``shops``,
+``vendor:<id>``, ``dropshipper:<id>``). The model signals in ``shop.signals``
+bump the counters when catalog data changes, so a stale entry is simply never
+looked up again and expires on its own.
+
+With several worker processes, point ``CATALOG_CACHE_ALIAS`` at a cache they
+share (file-based, Redis, ...); a local-memory cache only sees the bumps made by
+its own process.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+from .conditional import not_modified, set_validators
+
+VERSION_KEY_PREFIX = 'catalog-version:'
+RESPONSE_KEY_PREFIX = 'catalog-response:'
+
+def get_cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+def _new_version():
+    # Never restart from a small number after eviction, or an old entry
+    # cached under that number could be served again
+    return time.time_ns()
+
+def get_versions(scopes):
+    cache = get_cache()
+    keys = [VERSION_KEY_PREFIX + scope for scope in scopes]
+    versions = cache.get_many(keys)
+    missing = {key: _new_version() for key in keys if key not in versions}
+    for key, version in missing.items():
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+        versions[key] = version
+    return [versions[key] for key in keys]
+
+def bump_versions(*scopes):
+    cache = get_cache()
+    for scope in set(scopes):
+        key = VERSION_KEY_PREFIX + scope
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _new_version(), None)
+
+def response_cache_key(request, view_name, scopes):
+    versions = get_versions(scopes)
+    renderer = getattr(request, 'accepted_renderer', None)
+    raw = '|'.join(
+        [view_name, request.build_absolute_uri(), renderer.format if renderer else '']
+        + [str(v) for v in versions]
+    )
+    return RESPONSE_KEY_PREFIX + view_name + ':' + hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+class AnonymousResponseCacheMixin:
+    """
+    Serve anonymous GETs of a list view from the catalog cache.
+    Views override ``get_cache_scopes()`` to name the versions their data depends on.
+    """
+
+    def get_cache_scopes(self):
+        return ['catalog']
+
+    def list(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().list(request, *args, **kwargs)
+
+        cache = get_cache()
+        key = response_cache_key(request, type(self).__name__, self.get_cache_scopes())
+        cached = cache.get(key)
+        if cached is not None:
+            # Validators were stored with the entry, so a matching conditional
+            # request is answered without touching the database
+            etag = cached['etag']
+            if etag:
+                response = not_modified(request, etag)
+                if response is not None:
+                    return response
+                return set_validators(Response(cached['data']), etag)
+            return Response(cached['data'])
+
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, {
+                'data': response.data,
+                'etag': response.get('ETag'),
+            }, getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300))
+        return response
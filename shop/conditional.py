@@ -0,0 +1,74 @@
+"""
+Conditional GET support for catalog endpoints.
+
+Each endpoint derives a cheap validator from one aggregate query over the rows
+it would serialize (``MAX(updated_at)`` plus the row count and id sum, which
+catch deletions and swapped rows). When the client's ``If-None-Match``
+matches, we answer 304 without serializing anything.
+
+Only an ``ETag`` is sent: deleting a row or changing which rows a list
+contains (e.g. a dropship import) leaves ``MAX(updated_at)`` unchanged, so a
+``Last-Modified`` date could not tell those lists apart and
+``If-Modified-Since`` would get false 304s.
+
+Changes that don't touch ``updated_at`` (e.g. a vendor renaming their account)
+are not reflected until the rows themselves change.
+"""
+import hashlib
+
+from django.db.models import Count, Max, Sum
+from django.utils.cache import get_conditional_response
+
+def aggregate_validator(queryset, *extra_fields):
+    """
+    ``(MAX(updated_at), row count, id sum)`` for ``queryset`` in one query, plus
+    ``MAX(<field>)`` for each related timestamp in ``extra_fields``.
+    """
+    aggregates = {'updated': Max('updated_at'), 'count': Count('id'), 'ids': Sum('id')}
+    for i, field in enumerate(extra_fields):
+        aggregates[f'extra_{i}'] = Max(field)
+    values = queryset.order_by().aggregate(**aggregates)
+    timestamps = [values['updated']] + [values[f'extra_{i}'] for i in range(len(extra_fields))]
+    return timestamps, (values['count'], values['ids'])
+
+def compute_validators(request, timestamps, counts):
+    """
+    Build the ETag. It also covers the request URL and the negotiated format,
+    since the body depends on both.
+    """
+    renderer = getattr(request, 'accepted_renderer', None)
+    parts = [
+        request.build_absolute_uri(),
+        renderer.format if renderer else '',
+        *(ts.isoformat() for ts in timestamps if ts is not None),
+        *counts,
+    ]
+    digest = hashlib.md5('|'.join(str(p) for p in parts).encode('utf-8')).hexdigest()
+    return f'"{digest}"'
+
+def not_modified(request, etag):
+    """A 304 (or 412) response if the client's ``If-None-Match`` matches, else None."""
+    django_request = getattr(request, '_request', request)
+    return get_conditional_response(django_request, etag=etag)
+
+def set_validators(response, etag):
+    response['ETag'] = etag
+    return response
+
+class ConditionalListMixin:
+    """
+    Adds an ETag to a list view and answers 304 when it matches.
+    Views override ``get_validator_parts(queryset)`` to return
+    ``(timestamps, counts)``; the default uses ``aggregate_validator``.
+    """
+
+    def get_validator_parts(self, queryset):
+        return aggregate_validator(queryset)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        etag = compute_validators(request, *self.get_validator_parts(queryset))
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        return set_validators(super().list(request, *args, **kwargs), etag)
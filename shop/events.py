@@ -0,0 +1,84 @@
+"""
+Append-only order event log behind the dashboard change feed.
+
+Creating an order or changing its status inserts one ``OrderEvent`` per
+recipient (each vendor with lines in the order, and the dropshipper shop it
+was made through) in the transaction making the change, so the feed never
+shows a change that was rolled back. Dashboards poll
+``GET /api/shop/orders/events/?after=<id>``; when nothing happened that is a
+single range scan of the (recipient, id) index.
+
+Ids are assigned at insert but become visible at commit, so two transactions
+could commit them out of order and a poller that had already moved past the
+larger id would never see the smaller one. On PostgreSQL writers therefore
+take a transaction-level advisory lock per recipient right before inserting,
+which makes commit order follow id order within each feed. The locks are held
+until commit, which is not always right after the insert (creating an order
+still stores its idempotent response), so only writers to the same feeds wait
+for each other. SQLite serializes writers anyway.
+"""
+from collections import defaultdict
+
+from django.db import connection
+
+from .models import OrderItem, OrderEvent
+
+# First pg_advisory_xact_lock key of a feed's lock; the second is the recipient's id
+VENDOR_LOCK_ID = 0x6f726465
+SHOP_LOCK_ID = 0x6f726466
+
+def _lock(events):
+    if connection.vendor != 'postgresql':
+        return
+    # Sorted, so writers locking several feeds cannot deadlock. Ids are folded
+    # into the int4 key; a collision only makes two feeds share a lock.
+    keys = sorted({
+        (VENDOR_LOCK_ID, event.vendor_id % 2**31) if event.vendor_id else (SHOP_LOCK_ID, event.shop_id % 2**31)
+        for event in events
+    })
+    with connection.cursor() as cursor:
+        for key in keys:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', key)
+
+def _events(order_id, vendor_ids, shop_id, **fields):
+    events = [OrderEvent(order_id=order_id, vendor_id=vendor_id, **fields) for vendor_id in sorted(vendor_ids)]
+    if shop_id:
+        events.append(OrderEvent(order_id=order_id, shop_id=shop_id, **fields))
+    return events
+
+def _write(events):
+    if events:
+        _lock(events)
+        OrderEvent.objects.bulk_create(events)
+
+def record_created(order, items):
+    """Record a new order with its ``items`` (OrderItem instances). Call inside the order's transaction."""
+    _write(_events(
+        order.pk, {item.vendor_id for item in items}, order.dropshipper_shop_id,
+        type='created', status=order.status,
+    ))
+
+def record_status_changes(previous, status):
+    """
+    Record that the orders in ``previous`` (``{order id: previous status}``)
+    now have ``status``, with one query for their recipients. Call inside the
+    transaction that changed them.
+    """
+    previous = {order_id: old for order_id, old in previous.items() if old != status}
+    if not previous:
+        return
+    vendors = defaultdict(set)
+    shops = {}
+    rows = OrderItem.objects.filter(order_id__in=previous).order_by().values_list(
+        'order_id', 'vendor_id', 'order__dropshipper_shop_id',
+    ).distinct()
+    for order_id, vendor_id, shop_id in rows:
+        vendors[order_id].add(vendor_id)
+        shops[order_id] = shop_id
+    events = []
+    for order_id, old in sorted(previous.items()):
+        events += _events(
+            order_id, vendors[order_id], shops.get(order_id),
+            type='status', status=status, previous_status=old,
+        )
+    _write(events)
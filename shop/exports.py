@@ -0,0 +1,105 @@
+"""
+Streaming order exports (CSV or JSON Lines), one row per order line.
+
+Rows are read with ``.iterator(chunk_size=ORDER_EXPORT_CHUNK_SIZE)`` (a
+server-side cursor on PostgreSQL) and written to the response as they arrive,
+a chunk at a time, so memory use does not depend on the size of the export.
+"""
+import csv
+import io
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import OrderItem
+
+# (column, lookup) in output order; line_total is computed from price and quantity
+COLUMNS = (
+    ('order_id', 'order_id'),
+    ('created_at', 'order__created_at'),
+    ('status', 'order__status'),
+    ('customer_name', 'order__customer_name'),
+    ('customer_email', 'order__customer_email'),
+    ('guest_name', 'order__guest_name'),
+    ('guest_email', 'order__guest_email'),
+    ('dropshipper_shop', 'order__dropshipper_shop_id'),
+    ('dropshipper_shop_name', 'order__dropshipper_shop_name'),
+    ('product_id', 'product_id'),
+    ('product_title', 'product_title'),
+    ('quantity', 'quantity'),
+    ('price', 'price'),
+)
+FIELDS = [name for name, _ in COLUMNS] + ['line_total']
+
+# Spreadsheet applications run cells starting with these as formulas
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+def order_lines(user, start=None, end=None, statuses=None):
+    """The order lines ``user`` may export: a vendor's own lines, or every line of a dropshipper's orders."""
+    if user.role == 'vendor':
+        lines = OrderItem.objects.filter(vendor=user)
+    else:
+        lines = OrderItem.objects.filter(order__dropshipper_shop__owner=user)
+    if start is not None:
+        lines = lines.filter(order__created_at__gte=start)
+    if end is not None:
+        lines = lines.filter(order__created_at__lt=end)
+    if statuses:
+        lines = lines.filter(order__status__in=statuses)
+    return lines.order_by('order_id', 'pk').values_list(*[lookup for _, lookup in COLUMNS])
+
+def _rows(lines):
+    chunk_size = getattr(settings, 'ORDER_EXPORT_CHUNK_SIZE', 2000)
+    for values in lines.iterator(chunk_size=chunk_size):
+        row = dict(zip(FIELDS, values))
+        row['line_total'] = row['price'] * row['quantity']
+        yield row
+
+def _chunked(rows, write, flush):
+    """Yield what ``flush()`` returns after every chunk of rows passed to ``write``."""
+    chunk_size = getattr(settings, 'ORDER_EXPORT_CHUNK_SIZE', 2000)
+    count = 0
+    for row in rows:
+        write(row)
+        count += 1
+        if count % chunk_size == 0:
+            yield flush()
+    yield flush()
+
+def _csv_value(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+def csv_stream(lines):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        data = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    writer.writerow(FIELDS)
+    yield from _chunked(
+        _rows(lines),
+        lambda row: writer.writerow([_csv_value(row[name]) for name in FIELDS]),
+        flush,
+    )
+
+def jsonl_stream(lines):
+    parts = []
+
+    def flush():
+        data = ''.join(parts)
+        parts.clear()
+        return data
+
+    encoder = DjangoJSONEncoder()
+    yield from _chunked(_rows(lines), lambda row: parts.append(encoder.encode(row) + '\n'), flush)
+
+STREAMS = {
+    'csv': (csv_stream, 'text/csv; charset=utf-8'),
+    'jsonl': (jsonl_stream, 'application/x-ndjson; charset=utf-8'),
+}
@@ -0,0 +1,53 @@
+"""
+Sparse fieldsets: ``?fields=id,title,price`` keeps only the listed fields,
+``?omit=all_images,images`` drops fields. Omitted fields are removed from the
+serializer before it runs, so their ``get_<field>`` methods never execute, and
+views pass the selection to their QueryPlan so unused relations aren't loaded.
+"""
+from rest_framework import serializers
+
+def parse_fieldset(params, available):
+    """The set of fields requested by ``fields``/``omit``, or None for all of them."""
+    fields = params.get('fields')
+    omit = params.get('omit')
+    if not fields and not omit:
+        return None
+
+    selected = [f.strip() for f in fields.split(',') if f.strip()] if fields else list(available)
+    omitted = [f.strip() for f in omit.split(',') if f.strip()] if omit else []
+    unknown = sorted(set(selected + omitted) - set(available))
+    if unknown:
+        raise serializers.ValidationError({'fields': f"Unknown field(s): {', '.join(unknown)}"})
+    return set(selected) - set(omitted)
+
+class SparseFieldsetSerializerMixin:
+    """
+    Drops fields the view did not select. Only applies to the serializer class
+    the view was asked to render, not to serializers nested inside it.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        sparse = self.context.get('sparse_fieldset')
+        if sparse and type(self) is sparse[0]:
+            for name in list(fields):
+                if name not in sparse[1]:
+                    fields.pop(name)
+        return fields
+
+class SparseFieldsetViewMixin:
+    """Parses ``fields``/``omit`` for the view's serializer class and hands the selection to it."""
+
+    def get_requested_fields(self):
+        if not hasattr(self, '_requested_fields'):
+            self._requested_fields = parse_fieldset(
+                self.request.query_params, self.get_serializer_class().Meta.fields,
+            )
+        return self._requested_fields
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        requested = self.get_requested_fields()
+        if requested is not None:
+            context['sparse_fieldset'] = (self.get_serializer_class(), requested)
+        return context
@@ -0,0 +1,138 @@
+"""
+``Idempotency-Key`` support for create endpoints.
+
+The first request with a key inserts an ``IdempotencyKey`` row before doing any
+work; the unique ``(scope, key)`` constraint makes that insert the lock, so a
+concurrent duplicate fails it instead of creating a second object. The
+response is stored in the same transaction as the object it describes, and
+later requests with the key within ``IDEMPOTENCY_KEY_TTL`` get it back
+(with ``Idempotent-Replayed: true``) without running the view again.
+
+A duplicate that arrives while the first request is still running waits up to
+``IDEMPOTENCY_WAIT`` seconds for its response, then gets 409. Reusing a key
+with a different body is a 422. Failed requests (4xx/5xx) are not stored, so
+the client may retry them with the same key. Expired rows are removed by
+``manage.py purge_idempotency_keys``.
+
+A claim still without a response after ``IDEMPOTENCY_CLAIM_TIMEOUT`` seconds
+belongs to a worker that died before it could release the key (killed, out of
+memory, request timeout), so the next request with the key takes it over. Keep
+the timeout above the server's request timeout: should the first request still
+finish, it finds its claim gone and rolls back instead of storing a response.
+"""
+import hashlib
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+POLL_INTERVAL = 0.1
+
+def request_fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f'{request.method} {request.path}\n{body}'.encode('utf-8')).hexdigest()
+
+class ClaimLost(Exception):
+    """The request's claim was taken over as abandoned while it was running."""
+
+def _abandoned(record, now):
+    lease = getattr(settings, 'IDEMPOTENCY_CLAIM_TIMEOUT', 120)
+    return record.status_code is None and record.created_at <= now - timedelta(seconds=lease)
+
+def _claim(scope, key, fingerprint):
+    """Insert the row for ``key``; returns ``(record, created)``, the record being None if it keeps changing."""
+    ttl = getattr(settings, 'IDEMPOTENCY_KEY_TTL', 86400)
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(
+                    scope=scope, key=key, request_hash=fingerprint,
+                    expires_at=timezone.now() + timedelta(seconds=ttl),
+                )
+            return record, True
+        except IntegrityError:
+            record = IdempotencyKey.objects.filter(scope=scope, key=key).first()
+            if record is None:
+                continue  # purged in between
+            now = timezone.now()
+            if record.expires_at > now and not _abandoned(record, now):
+                return record, False
+            # An expired key may be used again, and an abandoned claim taken over
+            IdempotencyKey.objects.filter(pk=record.pk, status_code=record.status_code).delete()
+    return None, False
+
+def _wait_for_response(record):
+    deadline = time.monotonic() + getattr(settings, 'IDEMPOTENCY_WAIT', 5)
+    while record is not None and record.status_code is None and time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        record = IdempotencyKey.objects.filter(pk=record.pk).first()
+    return record
+
+def replay(record):
+    response = Response(record.response_body, status=record.status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+class IdempotentCreateMixin:
+    """
+    Makes ``create()`` honour the ``Idempotency-Key`` header. Views set
+    ``idempotency_scope`` to keep their keys apart from other endpoints'.
+    """
+    idempotency_scope = None
+
+    def create(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return super().create(request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {'detail': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        fingerprint = request_fingerprint(request)
+        record, created = _claim(self.idempotency_scope, key, fingerprint)
+        if not created:
+            if record is not None and record.request_hash != fingerprint:
+                return Response(
+                    {'detail': f'This {HEADER} was already used with a different request.'},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                )
+            record = _wait_for_response(record)
+            if record is not None and record.status_code is not None:
+                return replay(record)
+            response = Response(
+                {'detail': f'A request with this {HEADER} is still being processed.'},
+                status=status.HTTP_409_CONFLICT,
+            )
+            response['Retry-After'] = '1'
+            return response
+
+        try:
+            with transaction.atomic():
+                response = super().create(request, *args, **kwargs)
+                stored = IdempotencyKey.objects.filter(pk=record.pk, status_code=None).update(
+                    status_code=response.status_code, response_body=response.data,
+                )
+                if not stored:
+                    raise ClaimLost
+        except ClaimLost:
+            # A retry took the key over: it creates the object, this request must not
+            return Response(
+                {'detail': f'This request took too long and was superseded by a retry with the same {HEADER}.'},
+                status=status.HTTP_409_CONFLICT,
+            )
+        except BaseException:
+            # Nothing was created: release the key so the client can retry
+            IdempotencyKey.objects.filter(pk=record.pk).delete()
+            raise
+        return response
@@ -0,0 +1,290 @@
+import os
+import queue
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from accounts.models import User
+from shop.models import Shop, Product, ProductImage, MediaBlob, ImageMetadata
+from shop.serving import ENCODINGS
+from shop.thumbnails import DERIVATIVE_RE, derivative_names
+
+MEDIA_SOURCES = [(Product, 'image'), (ProductImage, 'image'), (Shop, 'logo'), (User, 'logo')]
+
+# Directories no field uploads to any more, whose files are all unreferenced
+LEGACY_DIRS = ('shops',)
+
+BATCH_SIZE = 2000
+
+def blob_filter(name):
+    """
+    The MediaBlob rows whose references keep ``name``: its own, and for a
+    thumbnail or precompressed variant the original's.
+    """
+    source = name
+    for _, suffix in ENCODINGS:
+        if source.endswith(suffix):
+            source = source[:-len(suffix)]
+    query = Q(name=name) | Q(name=source)
+    stem = DERIVATIVE_RE.sub('', source)
+    if stem != source:
+        query |= Q(name__startswith=stem + '.')
+    return query
+
+def _put(out, item, stop):
+    while not stop.is_set():
+        try:
+            out.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+def _scan_dir(root, path, out, stop):
+    """Pool worker: report the files of one directory in chunks and queue its subdirectories."""
+    try:
+        chunk = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if stop.is_set():
+                    break
+                if entry.is_dir(follow_symlinks=False):
+                    _put(out, ('dir', entry.path), stop)
+                elif entry.is_file(follow_symlinks=False) and not entry.name.startswith('.upload-'):
+                    # .upload-* are files ContentAddressedStorage is still writing
+                    stat = entry.stat(follow_symlinks=False)
+                    name = os.path.relpath(entry.path, root).replace(os.sep, '/')
+                    chunk.append((name, stat.st_size, stat.st_mtime))
+                    if len(chunk) >= BATCH_SIZE:
+                        _put(out, ('files', chunk), stop)
+                        chunk = []
+        if chunk:
+            _put(out, ('files', chunk), stop)
+    except OSError as e:
+        _put(out, ('error', f'{path}: {e}'), stop)
+    finally:
+        _put(out, ('done', None), stop)
+
+def scan_media(root, dirs, workers, skip=()):
+    """
+    Yield ``[(name, size, mtime), ...]`` chunks for every file below ``dirs`` of
+    ``root``, and ``str`` error messages; directories are listed in parallel.
+    """
+    out = queue.Queue(maxsize=workers * 4)
+    stop = threading.Event()
+    skip = {os.path.realpath(path) for path in skip}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='gc-media') as executor:
+        pending = 0
+        try:
+            for directory in dirs:
+                path = os.path.join(root, directory)
+                if os.path.isdir(path):
+                    executor.submit(_scan_dir, root, path, out, stop)
+                    pending += 1
+            while pending:
+                kind, payload = out.get()
+                if kind == 'files':
+                    yield payload
+                elif kind == 'dir':
+                    if os.path.realpath(payload) not in skip:
+                        executor.submit(_scan_dir, root, payload, out, stop)
+                        pending += 1
+                elif kind == 'error':
+                    yield payload
+                else:
+                    pending -= 1
+        finally:
+            # Unblock workers if the consumer stopped early
+            stop.set()
+
+
+class Command(BaseCommand):
+    help = (
+        'Find media files no model references (orphans) and references to files that are missing '
+        '(dangling), and optionally remove them. Thumbnails of referenced images are kept.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--delete',
+            action='store_true',
+            help='Delete orphaned files with their MediaBlob/ImageMetadata rows (default: only report)',
+        )
+        parser.add_argument(
+            '--clear-dangling',
+            action='store_true',
+            help='Clear image fields (delete product images) whose file is missing',
+        )
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=3600,
+            help='Ignore files modified in the last N seconds, which may belong to uploads in progress (default: 3600)',
+        )
+        parser.add_argument(
+            '--dir',
+            action='append',
+            dest='dirs',
+            help='Media subdirectory to scan (repeatable; default: every upload directory)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=8,
+            help='Number of directories listed in parallel (default: 8)',
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        root = str(settings.MEDIA_ROOT)
+        dirs = options['dirs'] or self.default_dirs()
+        prefixes = tuple(directory.rstrip('/') + '/' for directory in dirs)
+
+        # Both sides of the diff live in an on-disk SQLite file, so memory use
+        # does not grow with the number of files or rows
+        with tempfile.TemporaryDirectory(prefix='gc-media-') as tmp:
+            db = sqlite3.connect(os.path.join(tmp, 'gc.sqlite3'))
+            try:
+                db.execute('PRAGMA journal_mode=OFF')
+                db.execute('PRAGMA synchronous=OFF')
+                db.execute('CREATE TABLE ref (name TEXT NOT NULL, model TEXT NOT NULL, pk INTEGER NOT NULL, field TEXT NOT NULL)')
+                db.execute('CREATE TABLE keep (name TEXT PRIMARY KEY) WITHOUT ROWID')
+                db.execute('CREATE TABLE disk (name TEXT PRIMARY KEY, size INTEGER, mtime REAL) WITHOUT ROWID')
+
+                self.load_references(db, prefixes)
+                self.load_disk(db, root, dirs, max(1, options['workers']))
+                db.execute('CREATE INDEX ref_name ON ref (name)')
+
+                cutoff = time.time() - options['min_age']
+                orphans = self.report_orphans(db, cutoff)
+                dangling = self.report_dangling(db)
+
+                if options['delete']:
+                    self.delete_orphans(db, root, cutoff)
+                if options['clear_dangling']:
+                    self.clear_dangling(db)
+            finally:
+                db.close()
+
+        verb = 'Removed' if options['delete'] else 'Found'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {orphans[0]} orphaned file(s) ({orphans[1]} bytes); '
+            f'{dangling} dangling reference(s){" cleared" if options["clear_dangling"] else ""}'
+        ))
+
+    def default_dirs(self):
+        dirs = {model._meta.get_field(field).upload_to.strip('/').split('/')[0] for model, field in MEDIA_SOURCES}
+        return sorted(dirs | set(LEGACY_DIRS))
+
+    def load_references(self, db, prefixes):
+        for model, field in MEDIA_SOURCES:
+            rows = (
+                model.objects.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''})
+                .order_by().values_list('pk', field).iterator(chunk_size=BATCH_SIZE)
+            )
+            label = model._meta.label
+            refs = []
+            for pk, name in rows:
+                if not name.startswith(prefixes):
+                    continue
+                refs.append((name, label, pk, field))
+                if len(refs) >= BATCH_SIZE:
+                    self.insert_references(db, refs)
+                    refs = []
+            self.insert_references(db, refs)
+
+    def insert_references(self, db, refs):
+        db.executemany('INSERT INTO ref VALUES (?, ?, ?, ?)', refs)
+        keep = []
+        for name, *_ in refs:
+            for kept in [name] + [derivative for _, _, derivative in derivative_names(name)]:
+                # Precompressed variants served by shop.serving belong to their file
+                keep.extend([(kept,)] + [(kept + suffix,) for _, suffix in ENCODINGS])
+        db.executemany('INSERT OR IGNORE INTO keep VALUES (?)', keep)
+        db.commit()
+
+    def load_disk(self, db, root, dirs, workers):
+        spool = getattr(settings, 'IMAGE_UPLOAD_SPOOL_DIR', None)
+        for chunk in scan_media(root, dirs, workers, skip=[spool] if spool else []):
+            if isinstance(chunk, str):
+                self.stderr.write(f'Cannot scan {chunk}')
+                continue
+            db.executemany('INSERT OR REPLACE INTO disk VALUES (?, ?, ?)', chunk)
+            db.commit()
+
+    def orphans(self, db, cutoff):
+        return db.execute(
+            'SELECT name, size FROM disk WHERE mtime < ? '
+            'AND NOT EXISTS (SELECT 1 FROM keep WHERE keep.name = disk.name) ORDER BY name',
+            (cutoff,),
+        )
+
+    def report_orphans(self, db, cutoff):
+        count = size = 0
+        for name, file_size in self.orphans(db, cutoff):
+            count += 1
+            size += file_size
+            if self.verbosity >= 1:
+                self.stdout.write(f'orphan {name} ({file_size} bytes)')
+        return count, size
+
+    def dangling(self, db):
+        return db.execute(
+            'SELECT name, model, pk, field FROM ref '
+            'WHERE NOT EXISTS (SELECT 1 FROM disk WHERE disk.name = ref.name) ORDER BY model, pk'
+        )
+
+    def report_dangling(self, db):
+        count = 0
+        for name, model, pk, field in self.dangling(db):
+            count += 1
+            if self.verbosity >= 1:
+                self.stdout.write(f'dangling {model} {pk} {field}: {name}')
+        return count
+
+    def delete_orphans(self, db, root, cutoff):
+        names = []
+        for name, _ in self.orphans(db, cutoff):
+            names.append(name)
+            if len(names) >= BATCH_SIZE:
+                self.delete_files(root, names)
+                names = []
+        self.delete_files(root, names)
+
+    def delete_files(self, root, names):
+        for name in names:
+            with transaction.atomic():
+                # The scan may be stale: an identical upload since then reuses the
+                # content-addressed name. Lock its blob as storage._delete_unreferenced does.
+                blobs = list(MediaBlob.objects.select_for_update().filter(blob_filter(name)))
+                if any(blob.ref_count or blob.pending for blob in blobs):
+                    if self.verbosity >= 1:
+                        self.stdout.write(f'kept {name} (referenced since the scan)')
+                    continue
+                try:
+                    os.unlink(os.path.join(root, name))
+                except FileNotFoundError:
+                    pass
+                # Nothing references the file, so its bookkeeping rows are stale too
+                MediaBlob.objects.filter(name=name).delete()
+                ImageMetadata.objects.filter(name=name).delete()
+
+    def clear_dangling(self, db):
+        models = {model._meta.label: model for model, _ in MEDIA_SOURCES}
+        for name, label, pk, field in self.dangling(db):
+            instance = models[label].objects.filter(pk=pk).first()
+            if instance is None or getattr(instance, field).name != name:
+                continue  # changed since the scan
+            # Saving/deleting instances keeps reference counts and caches in step
+            if models[label] is ProductImage:
+                instance.delete()
+            else:
+                setattr(instance, field, None)
+                instance.save(update_fields=[field])
+            ImageMetadata.objects.filter(name=name).delete()
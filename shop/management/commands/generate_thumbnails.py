@@ -0,0 +1,50 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from shop.models import Shop, Product, ProductImage
+from shop.thumbnails import generate_derivatives, generate_in_worker
+
+THUMBNAIL_SOURCES = [(Product, 'image'), (ProductImage, 'image'), (Shop, 'logo')]
+
+
+class Command(BaseCommand):
+    help = 'Create missing thumbnail derivatives and image metadata for product images and shop logos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Regenerate derivatives that already exist',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Number of images processed in parallel (default: 4; 1 processes them in this thread)',
+        )
+
+    def handle(self, *args, **options):
+        force = options['force']
+        written = 0
+        originals = 0
+
+        workers = max(1, options['workers'])
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            run = generate_in_worker if workers > 1 else generate_derivatives
+            map_ = executor.map if workers > 1 else map
+            for model, field in THUMBNAIL_SOURCES:
+                storage = model._meta.get_field(field).storage
+                names = (
+                    model.objects.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''})
+                    .order_by().values_list(field, flat=True).distinct().iterator()
+                )
+                results = map_(lambda name: run(storage, name, force=force), names)
+                count = 0
+                for result in results:
+                    count += 1
+                    written += len(result)
+                originals += count
+                self.stdout.write(f'{model.__name__}.{field}: {count} image(s) checked')
+
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} derivative(s) for {originals} image(s)'))
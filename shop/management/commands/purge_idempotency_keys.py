@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from shop.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = 'Delete expired Idempotency-Key records (run periodically, e.g. hourly from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Rows deleted per statement (default: 5000)',
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        expired = IdempotencyKey.objects.filter(expires_at__lt=now).order_by('pk')
+        deleted = 0
+        while True:
+            # Small batches keep each delete short on a busy table
+            ids = list(expired.values_list('pk', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            deleted += IdempotencyKey.objects.filter(pk__in=ids).delete()[0]
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired idempotency key(s)'))
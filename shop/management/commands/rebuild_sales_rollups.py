@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from shop.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily sales rollups used by the analytics endpoint from all order lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Orders aggregated per query (default: 5000)',
+        )
+
+    def handle(self, *args, **options):
+        chunks = rebuild(
+            chunk_size=max(1, options['chunk_size']),
+            stdout=self.stdout if options['verbosity'] >= 2 else None,
+        )
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt sales rollups in {chunks} chunk(s)'))
@@ -0,0 +1,52 @@
+import os
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from shop.models import ImageUpload
+from shop.uploads import process_batch, spool_path
+
+INTERRUPTED = 'Upload was interrupted; upload the image again'
+
+
+class Command(BaseCommand):
+    help = (
+        'Finish image uploads left pending by a restart or deploy: images whose spooled file survived '
+        'are processed again, the others are marked failed. Run after deploys or periodically.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=3600,
+            help='Only touch uploads pending for at least N seconds, which no worker is still processing (default: 3600)',
+        )
+        parser.add_argument(
+            '--fail',
+            action='store_true',
+            help='Mark every stale pending upload failed instead of processing it again',
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(seconds=options['min_age'])
+        stale = ImageUpload.objects.filter(status='pending', created_at__lt=cutoff)
+
+        lost = [item.pk for item in stale if options['fail'] or not os.path.exists(spool_path(item))]
+        failed = ImageUpload.objects.filter(pk__in=lost, status='pending').update(status='failed', error=INTERRUPTED)
+        for item in ImageUpload.objects.filter(pk__in=lost).only('batch', 'position'):
+            # Spooled files of uploads given up with --fail
+            try:
+                os.unlink(spool_path(item))
+            except FileNotFoundError:
+                pass
+
+        batches = list(stale.values_list('batch', flat=True).distinct())
+        for batch in batches:
+            process_batch(batch)
+            if options['verbosity'] >= 2:
+                self.stdout.write(f'Processed batch {batch}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {len(batches)} interrupted batch(es); marked {failed} upload(s) failed'
+        ))
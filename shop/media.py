@@ -0,0 +1,162 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import ImageMetadata
+
+EXISTS_CACHE_PREFIX = 'media-exists:'
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'MEDIA_EXISTS_WORKERS', 8),
+            thread_name_prefix='media-exists',
+        )
+    return _executor
+
+
+def _cache_key(name):
+    # File names may contain spaces or non-ASCII characters, which some cache
+    # backends reject as keys
+    return EXISTS_CACHE_PREFIX + hashlib.md5(name.encode('utf-8')).hexdigest()
+
+
+class MediaResolver:
+    """
+    Resolves stored files to absolute URLs, checking storage at most once per
+    file name.
+
+    Serializers share one resolver per request through the serializer context.
+    List serializers call ``prime()`` with every file on the page so the
+    lookups run as one batch; later lookups are served from memory.
+
+    Existence and dimensions come from ``ImageMetadata`` (one query per batch).
+    Only files without a metadata row yet are checked against storage; when
+    ``MEDIA_EXISTS_CACHE_TTL`` is set, those results are also kept in the
+    Django cache and shared across requests for that many seconds.
+    """
+
+    def __init__(self, request=None, ttl=None):
+        self.request = request
+        self.ttl = getattr(settings, 'MEDIA_EXISTS_CACHE_TTL', 0) if ttl is None else ttl
+        self._exists = {}
+        self._metadata = {}
+        self._urls = {}
+
+    def prime(self, files):
+        """Check existence of every file in ``files`` in one batch."""
+        self.prime_names((f.storage, f.name) for f in files if f)
+
+    def prime_names(self, pairs):
+        """Like ``prime()``, for ``(storage, name)`` pairs."""
+        pending = {}
+        for storage, name in pairs:
+            if name and name not in self._exists:
+                pending[name] = storage
+        if not pending:
+            return
+
+        for metadata in ImageMetadata.objects.filter(name__in=list(pending)):
+            self._metadata[metadata.name] = metadata
+            self._exists[metadata.name] = metadata.exists
+            pending.pop(metadata.name)
+        if not pending:
+            return
+
+        if self.ttl:
+            keys = {_cache_key(name): name for name in pending}
+            for key, exists in cache.get_many(list(keys)).items():
+                name = keys[key]
+                self._exists[name] = exists
+                pending.pop(name, None)
+            if not pending:
+                return
+
+        names = list(pending)
+        if len(names) == 1:
+            results = [self._check(pending[names[0]], names[0])]
+        else:
+            results = list(_get_executor().map(lambda n: self._check(pending[n], n), names))
+        checked = dict(zip(names, results))
+        self._exists.update(checked)
+
+        if self.ttl:
+            cache.set_many({_cache_key(name): exists for name, exists in checked.items()}, self.ttl)
+
+    def exists(self, f):
+        if not f:
+            return False
+        return self.name_exists(f.storage, f.name)
+
+    def url(self, f):
+        """Absolute URL of ``f``, or None if it is empty or missing from storage."""
+        if not f:
+            return None
+        return self.name_url(f.storage, f.name)
+
+    def name_exists(self, storage, name):
+        if not name:
+            return False
+        if name not in self._exists:
+            self.prime_names([(storage, name)])
+        return self._exists[name]
+
+    def metadata(self, f):
+        """The ImageMetadata of ``f``, or None if it has not been recorded."""
+        if not f:
+            return None
+        return self.name_metadata(f.storage, f.name)
+
+    def name_metadata(self, storage, name):
+        if not name:
+            return None
+        if name not in self._exists:
+            self.prime_names([(storage, name)])
+        return self._metadata.get(name)
+
+    def name_url(self, storage, name):
+        if not self.name_exists(storage, name):
+            return None
+        return self.stored_url(storage, name)
+
+    def stored_url(self, storage, name):
+        """Absolute URL of a file known to exist (e.g. a recorded derivative), without checking storage."""
+        url = self._urls.get(name)
+        if url is None:
+            try:
+                url = storage.url(name)
+            except Exception:
+                return None
+            if self.request:
+                url = self.request.build_absolute_uri(url)
+            self._urls[name] = url
+        return url
+
+    @staticmethod
+    def _check(storage, name):
+        try:
+            return storage.exists(name)
+        except Exception:
+            return False
+
+
+def get_media_resolver(context):
+    """Return the resolver stored in a serializer context, creating it on first use."""
+    resolver = context.get('media_resolver')
+    if resolver is None:
+        resolver = MediaResolver(context.get('request'))
+        context['media_resolver'] = resolver
+    return resolver
+
+def image_info(resolver, storage, name):
+    """Recorded ``width``, ``height`` and blur ``placeholder`` of an image; None where unknown."""
+    metadata = resolver.name_metadata(storage, name)
+    if metadata is None or not metadata.exists:
+        return {'width': None, 'height': None, 'placeholder': None}
+    return {'width': metadata.width, 'height': metadata.height, 'placeholder': metadata.placeholder or None}
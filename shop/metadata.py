@@ -0,0 +1,75 @@
+"""
+Stored facts about image files: existence, dimensions, byte size, SHA-256 and
+a tiny blurred placeholder.
+
+Rows are written by the thumbnail worker (see ``shop.thumbnails``) once a file
+is saved, for the original and each derivative, and read by ``MediaResolver``
+so serializers can emit URLs and dimensions without touching storage.
+"""
+import base64
+import hashlib
+from io import BytesIO
+
+from PIL import Image, ImageFilter
+
+from .models import ImageMetadata
+
+PLACEHOLDER_WIDTH = 16
+
+def missing_metadata(names):
+    """The subset of ``names`` with no metadata row yet."""
+    names = set(names)
+    return names - set(ImageMetadata.objects.filter(name__in=names).values_list('name', flat=True))
+
+def make_placeholder(image):
+    """A ~16px wide blurred JPEG as a data URI, to show while the real image loads."""
+    small = image.convert('RGB')
+    small.thumbnail((PLACEHOLDER_WIDTH, PLACEHOLDER_WIDTH * 4))
+    small = small.filter(ImageFilter.GaussianBlur(1))
+    buf = BytesIO()
+    small.save(buf, 'JPEG', quality=50)
+    return 'data:image/jpeg;base64,' + base64.b64encode(buf.getvalue()).decode('ascii')
+
+def _hash_file(storage, name):
+    digest = hashlib.sha256()
+    with storage.open(name, 'rb') as fh:
+        for chunk in fh.chunks():
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def record_metadata(storage, name, image=None, placeholder=True):
+    """
+    Store the metadata of ``name``. ``image`` is the already decoded image, if
+    the caller has it; a file that cannot be read is recorded as missing.
+    """
+    try:
+        if image is None:
+            with storage.open(name, 'rb') as fh:
+                image = Image.open(fh)
+                image.load()
+        values = {
+            'exists': True,
+            'width': image.width,
+            'height': image.height,
+            'size': storage.size(name),
+            'sha256': _hash_file(storage, name),
+            'placeholder': make_placeholder(image) if placeholder else '',
+        }
+    except (FileNotFoundError, OSError):
+        return record_missing(name)
+    metadata, _ = ImageMetadata.objects.update_or_create(name=name, defaults=values)
+    return metadata
+
+def recorded_derivatives(name):
+    """The ``[[width, format], ...]`` recorded for the original ``name``, or None."""
+    return ImageMetadata.objects.filter(name=name).values_list('derivatives', flat=True).first()
+
+def record_derivatives(name, derivatives):
+    ImageMetadata.objects.filter(name=name).update(derivatives=derivatives)
+
+def record_missing(name):
+    metadata, _ = ImageMetadata.objects.update_or_create(name=name, defaults={
+        'exists': False, 'width': None, 'height': None, 'size': 0, 'sha256': '', 'placeholder': '',
+        'derivatives': None,
+    })
+    return metadata
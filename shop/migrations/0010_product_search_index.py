@@ -0,0 +1,59 @@
+from django.db import migrations, models
+
+
+def create_search_index(apps, schema_editor):
+    """
+    Full-text index over product title and description.
+    PostgreSQL: tsvector column with a GIN index. SQLite: FTS5 table keyed by product id.
+    """
+    vendor = schema_editor.connection.vendor
+    with schema_editor.connection.cursor() as cursor:
+        if vendor == 'postgresql':
+            cursor.execute("ALTER TABLE shop_product ADD COLUMN IF NOT EXISTS search_vector tsvector")
+            cursor.execute("""
+                UPDATE shop_product SET search_vector =
+                    setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+                    setweight(to_tsvector('english', coalesce(description, '')), 'B')
+            """)
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS shop_product_search_vector_idx "
+                "ON shop_product USING GIN (search_vector)"
+            )
+        elif vendor == 'sqlite':
+            cursor.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS shop_product_fts "
+                "USING fts5(title, description, tokenize='porter unicode61')"
+            )
+            cursor.execute(
+                "INSERT INTO shop_product_fts(rowid, title, description) "
+                "SELECT id, title, description FROM shop_product"
+            )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    with schema_editor.connection.cursor() as cursor:
+        if vendor == 'postgresql':
+            cursor.execute("DROP INDEX IF EXISTS shop_product_search_vector_idx")
+            cursor.execute("ALTER TABLE shop_product DROP COLUMN IF EXISTS search_vector")
+        elif vendor == 'sqlite':
+            cursor.execute("DROP TABLE IF EXISTS shop_product_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0009_auto_20250922_2231'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category'], name='shop_product_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price'], name='shop_product_price_idx'),
+        ),
+    ]
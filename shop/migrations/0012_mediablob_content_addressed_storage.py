@@ -0,0 +1,38 @@
+import shop.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0011_shop_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('sha256', models.CharField(db_index=True, max_length=64)),
+                ('size', models.BigIntegerField(default=0)),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=shop.storage.select_media_storage, upload_to='products/'),
+        ),
+        migrations.AlterField(
+            model_name='productimage',
+            name='image',
+            field=models.ImageField(storage=shop.storage.select_media_storage, upload_to='products/'),
+        ),
+        migrations.AlterField(
+            model_name='shop',
+            name='logo',
+            field=models.ImageField(blank=True, null=True, storage=shop.storage.select_media_storage, upload_to='shop_logos/'),
+        ),
+    ]
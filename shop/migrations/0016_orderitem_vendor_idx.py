@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0015_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['vendor', 'order'], name='shop_orderitem_vendor_idx'),
+        ),
+    ]
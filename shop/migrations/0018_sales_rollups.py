@@ -0,0 +1,44 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0017_alter_order_status'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VendorSalesDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('orders', models.IntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_daily', to='shop.product')),
+                ('vendor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_daily', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['vendor', 'day'], name='shop_vendorsales_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('vendor', 'product', 'day'), name='shop_vendorsales_key')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ShopSalesDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('orders', models.IntegerField(default=0)),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_daily', to='shop.shop')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('shop', 'day'), name='shop_shopsales_key')],
+            },
+        ),
+    ]
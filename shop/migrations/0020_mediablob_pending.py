@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0019_orderevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediablob',
+            name='pending',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0020_mediablob_pending'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagemetadata',
+            name='derivatives',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -1,5 +1,8 @@
 from django.db import models
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .storage import select_media_storage
 
 User = settings.AUTH_USER_MODEL
 
@@ -12,8 +15,9 @@ class Shop(models.Model):
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='shops')
     name = models.CharField(max_length=255)
     company_name = models.CharField(max_length=255, blank=True)
-    logo = models.ImageField(upload_to='shop_logos/', blank=True, null=True)
+    logo = models.ImageField(upload_to='shop_logos/', storage=select_media_storage, blank=True, null=True)
     shop_type = models.CharField(max_length=20, choices=SHOP_TYPE_CHOICES, default='vendor')
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.name} (owner={self.owner}, type={self.shop_type})"
@@ -32,13 +36,20 @@ class Product(models.Model):
     title = models.CharField(max_length=255)
     description = models.TextField(blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
-    image = models.ImageField(upload_to='products/', blank=True, null=True)  # Keep for backward compatibility
+    image = models.ImageField(upload_to='products/', storage=select_media_storage, blank=True, null=True)  # Keep for backward compatibility
     category = models.CharField(max_length=100, blank=True)
     stock = models.IntegerField(default=0)
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # Catalog facet filters; full-text search has its own index (see shop.search)
+        indexes = [
+            models.Index(fields=['category'], name='shop_product_category_idx'),
+            models.Index(fields=['price'], name='shop_product_price_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
@@ -70,7 +81,7 @@ class Product(models.Model):
 
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='product_images')
-    image = models.ImageField(upload_to='products/')
+    image = models.ImageField(upload_to='products/', storage=select_media_storage)
     is_primary = models.BooleanField(default=False)
     order = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -99,8 +110,19 @@ class DropshipImport(models.Model):
 class Order(models.Model):
     STATUS_CHOICES = (
         ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('shipped', 'Shipped'),
         ('completed', 'Completed'),
+        ('cancelled', 'Cancelled'),
     )
+    # Statuses each status may change to; completed orders can still be reopened
+    ALLOWED_TRANSITIONS = {
+        'pending': {'processing', 'shipped', 'completed', 'cancelled'},
+        'processing': {'pending', 'shipped', 'completed', 'cancelled'},
+        'shipped': {'completed'},
+        'completed': {'pending'},
+        'cancelled': set(),
+    }
     # Customer fields (main customer info) - can be empty, guest fields are used instead
     customer_name = models.CharField(max_length=255, default='')
     customer_email = models.EmailField(default='')
@@ -141,6 +163,12 @@ class OrderItem(models.Model):
 
     vendor = models.ForeignKey(User, on_delete=models.PROTECT, related_name='order_items')
 
+    class Meta:
+        # Serves "orders containing this vendor's products" (EXISTS per order) and their lines
+        indexes = [
+            models.Index(fields=['vendor', 'order'], name='shop_orderitem_vendor_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         # snapshot product title and vendor at time of ordering
         if not self.product_title:
@@ -149,4 +177,148 @@ class OrderItem(models.Model):
             self.price = self.product.price
         if not self.vendor_id:
             self.vendor = self.product.vendor
-        super().save(*args, **kwargs)
\ No newline at end of file
+        super().save(*args, **kwargs)
+
+class MediaBlob(models.Model):
+    """A content-addressed media file and how many model fields reference it (see shop.storage)."""
+    name = models.CharField(max_length=255, unique=True)
+    sha256 = models.CharField(max_length=64, db_index=True)
+    size = models.BigIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0)
+    # Stores of the content whose reference has not been counted yet; the blob is kept while any are pending
+    pending = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} (refs={self.ref_count})"
+
+class ImageMetadata(models.Model):
+    """What is known about a stored image file, so reads never touch storage (see shop.metadata)."""
+    name = models.CharField(max_length=255, unique=True)
+    exists = models.BooleanField(default=True)
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    size = models.BigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True)
+    placeholder = models.TextField(blank=True)
+    # [[width, format], ...] of the derivatives written for an original; null until generated
+    derivatives = models.JSONField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.width}x{self.height})" if self.exists else f"{self.name} (missing)"
+
+class ImageUpload(models.Model):
+    """Processing status of one image of a multi-image upload (see shop.uploads)."""
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('stored', 'Stored'),
+        ('failed', 'Failed'),
+    )
+    batch = models.UUIDField(db_index=True)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='image_uploads')
+    uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='image_uploads')
+    position = models.PositiveIntegerField()
+    original_name = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    error = models.CharField(max_length=255, blank=True)
+    image = models.ForeignKey(ProductImage, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.original_name} ({self.status})"
+
+class IdempotencyKey(models.Model):
+    """The stored response of a request sent with an ``Idempotency-Key`` header (see shop.idempotency)."""
+    scope = models.CharField(max_length=50)
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    # Null while the first request is still being processed
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key'], name='shop_idempotencykey_scope_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.scope}:{self.key} ({self.status_code or 'in progress'})"
+
+class VendorSalesDaily(models.Model):
+    """Sales of one vendor's product on one day, kept up to date by shop.rollups."""
+    vendor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sales_daily')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='sales_daily')
+    day = models.DateField()
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    # Orders containing the product
+    orders = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['vendor', 'product', 'day'], name='shop_vendorsales_key'),
+        ]
+        indexes = [
+            models.Index(fields=['vendor', 'day'], name='shop_vendorsales_day_idx'),
+        ]
+
+class VendorOrdersDaily(models.Model):
+    """Orders with lines of one vendor's products on one day, kept up to date by shop.rollups."""
+    vendor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders_daily')
+    day = models.DateField()
+    orders = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['vendor', 'day'], name='shop_vendororders_key'),
+        ]
+
+class ShopSalesDaily(models.Model):
+    """Sales made through one dropshipper shop on one day, kept up to date by shop.rollups."""
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name='sales_daily')
+    day = models.DateField()
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    orders = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['shop', 'day'], name='shop_shopsales_key'),
+        ]
+
+class OrderEvent(models.Model):
+    """
+    One change of an order as delivered to one recipient, a vendor with lines
+    in it or the dropshipper shop it was made through (see shop.events).
+    Append-only; the ``id`` is the feed cursor.
+    """
+    TYPE_CHOICES = (
+        ('created', 'Created'),
+        ('status', 'Status changed'),
+    )
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='events')
+    type = models.CharField(max_length=20, choices=TYPE_CHOICES)
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    previous_status = models.CharField(max_length=20, blank=True)
+    vendor = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='order_events')
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE, null=True, blank=True, related_name='order_events')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(vendor__isnull=False, shop__isnull=True) | models.Q(vendor__isnull=True, shop__isnull=False),
+                name='shop_orderevent_one_recipient',
+            ),
+        ]
+        # A feed page is a range scan of one recipient's events after the cursor
+        indexes = [
+            models.Index(fields=['vendor', 'id'], name='shop_orderevent_vendor_idx'),
+            models.Index(fields=['shop', 'id'], name='shop_orderevent_shop_idx'),
+        ]
+
+    def __str__(self):
+        return f"Order {self.order_id} {self.type} ({self.status})"
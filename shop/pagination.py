@@ -0,0 +1,32 @@
+from rest_framework.pagination import CursorPagination
+
+class IdCursorPagination(CursorPagination):
+    """
+    Keyset pagination over ``id``, newest first.
+
+    Pages are selected with ``WHERE id < <last id>`` rather than OFFSET, so a
+    deep page costs the same as the first one. Clients pass ``limit`` and the
+    opaque ``cursor`` from the previous page's ``next``/``previous`` links.
+    Requests that send neither parameter get the unpaginated list, as before,
+    unless ``allow_unpaginated`` is off.
+    """
+    ordering = '-id'
+    page_size = 50
+    page_size_query_param = 'limit'
+    max_page_size = 200
+    cursor_query_param = 'cursor'
+    allow_unpaginated = True
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if (
+            self.allow_unpaginated
+            and self.page_size_query_param not in params
+            and self.cursor_query_param not in params
+        ):
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+class RequiredIdCursorPagination(IdCursorPagination):
+    """IdCursorPagination for endpoints that were paginated from the start."""
+    allow_unpaginated = False
@@ -0,0 +1,71 @@
+from django.db.models import Prefetch
+
+from .models import Product, ProductImage, OrderItem
+
+
+class QueryPlan:
+    """
+    Declares the related rows a serializer reads, and which of its fields need
+    them, so every view that returns those objects loads them the same way.
+
+    ``select_related`` and ``prefetch_related`` are sequences of
+    ``(lookup, fields)`` pairs. ``apply(queryset, fields)`` adds each lookup
+    whose fields intersect ``fields``; with ``fields=None`` everything is loaded.
+    """
+
+    def __init__(self, select_related=(), prefetch_related=()):
+        self.select_related = list(select_related)
+        self.prefetch_related = list(prefetch_related)
+
+    def apply(self, queryset, fields=None):
+        selects = [lookup for lookup, needed_by in self.select_related if self._needed(needed_by, fields)]
+        prefetches = [lookup for lookup, needed_by in self.prefetch_related if self._needed(needed_by, fields)]
+        if selects:
+            queryset = queryset.select_related(*selects)
+        if prefetches:
+            queryset = queryset.prefetch_related(*prefetches)
+        return queryset
+
+    @staticmethod
+    def _needed(needed_by, fields):
+        return fields is None or bool(set(needed_by) & set(fields))
+
+
+PRODUCT_PLAN = QueryPlan(
+    select_related=[
+        ('vendor', ['vendor_name']),
+        ('shop', ['shop_name', 'shop_logo_url']),
+    ],
+    prefetch_related=[
+        (
+            Prefetch('product_images', queryset=ProductImage.objects.order_by('order', 'created_at')),
+            ['images', 'all_images'],
+        ),
+    ],
+)
+
+SHOP_PLAN = QueryPlan(
+    select_related=[
+        ('owner', ['owner']),
+    ],
+    prefetch_related=[
+        (
+            Prefetch('products', queryset=PRODUCT_PLAN.apply(Product.objects.all())),
+            ['products'],
+        ),
+    ],
+)
+
+ORDER_PLAN = QueryPlan(
+    prefetch_related=[
+        (Prefetch('items', queryset=OrderItem.objects.order_by('id')), ['items']),
+    ],
+)
+
+def vendor_order_plan(vendor):
+    """ORDER_PLAN listing only ``vendor``'s lines of each order."""
+    return QueryPlan(
+        prefetch_related=[
+            (Prefetch('items', queryset=OrderItem.objects.filter(vendor=vendor).order_by('id')), ['items']),
+        ],
+    )
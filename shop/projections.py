@@ -0,0 +1,215 @@
+"""
+Read-only fast path for large list endpoints.
+
+``ProductSerializer`` and ``OrderListSerializer`` build a model instance and
+walk a tree of field objects for every row. The projections here produce the
+same JSON from ``.values()`` rows: plain columns go through the serializer's
+own field ``to_representation()`` (so formatting is identical), related rows
+are fetched once per page, and image URLs come from the shared MediaResolver.
+The tests in ``shop.tests`` compare both paths field for field.
+"""
+from django.conf import settings
+from rest_framework.response import Response
+
+from .media import get_media_resolver, image_info
+from .models import Shop, Product, ProductImage, OrderItem
+from .serializers import ProductSerializer, OrderListSerializer, get_dropshipper_shop
+from .thumbnails import thumbnail_urls
+
+def projections_enabled():
+    return getattr(settings, 'LIST_PROJECTIONS_ENABLED', True)
+
+class Projection:
+    """
+    Base class. Subclasses list the ``.values()`` columns to load and implement
+    ``serialize(rows)``; ``fields`` restricts output like a sparse fieldset.
+    """
+    serializer_class = None
+    value_fields = ()
+
+    def __init__(self, context, fields=None):
+        self.context = context
+        self.fields = [
+            name for name in self.serializer_class.Meta.fields
+            if fields is None or name in fields
+        ]
+        self._field_objects = self.serializer_class(context=context).fields
+
+    def values(self, queryset):
+        # Prefetches and select_related only apply to model instances
+        return queryset.prefetch_related(None).select_related(None).values(*self.value_fields)
+
+    def to_representation(self, name, value):
+        if value is None:
+            return None
+        return self._field_objects[name].to_representation(value)
+
+class ProductProjection(Projection):
+    serializer_class = ProductSerializer
+    value_fields = (
+        'id', 'title', 'description', 'price', 'image', 'category', 'stock', 'is_active',
+        'shop_id', 'shop__name', 'shop__logo', 'vendor__company_name', 'vendor__username',
+    )
+    plain_fields = ('id', 'title', 'description', 'price', 'category', 'stock', 'is_active')
+
+    def serialize(self, rows):
+        rows = list(rows)
+        resolver = get_media_resolver(self.context)
+        fields = set(self.fields)
+        product_storage = Product._meta.get_field('image').storage
+        image_storage = ProductImage._meta.get_field('image').storage
+        logo_storage = Shop._meta.get_field('logo').storage
+
+        images_by_product = {}
+        if {'images', 'all_images'} & fields and rows:
+            image_rows = ProductImage.objects.filter(
+                product_id__in=[row['id'] for row in rows],
+            ).order_by('order', 'created_at').values_list('product_id', 'id', 'image', 'is_primary', 'order')
+            for product_id, image_id, name, is_primary, order in image_rows:
+                images_by_product.setdefault(product_id, []).append((image_id, name, is_primary, order))
+
+        # One existence check batch for the page, as MediaPrimingListSerializer does
+        pairs = []
+        if {'image_url', 'image_width', 'image_height', 'image_placeholder', 'thumbnails', 'all_images'} & fields:
+            pairs.extend((product_storage, row['image']) for row in rows)
+        for images in images_by_product.values():
+            pairs.extend((image_storage, name) for _, name, _, _ in images)
+        dropshipper_shop = None
+        if {'shop_name', 'shop_logo_url'} & fields:
+            dropshipper_shop = get_dropshipper_shop(self.context)
+        if 'shop_logo_url' in fields:
+            pairs.extend((logo_storage, row['shop__logo']) for row in rows if row['shop_id'])
+            if dropshipper_shop:
+                pairs.append((logo_storage, dropshipper_shop.logo.name))
+        resolver.prime_names(pairs)
+
+        data = []
+        for row in rows:
+            item = {}
+            images = images_by_product.get(row['id'], [])
+            for name in self.fields:
+                if name in self.plain_fields:
+                    item[name] = self.to_representation(name, row[name])
+                elif name == 'image_url':
+                    item[name] = resolver.name_url(product_storage, row['image'])
+                elif name in ('image_width', 'image_height', 'image_placeholder'):
+                    item[name] = image_info(resolver, product_storage, row['image'])[name[len('image_'):]]
+                elif name == 'thumbnails':
+                    item[name] = thumbnail_urls(resolver, product_storage, row['image'])
+                elif name == 'images':
+                    item[name] = [
+                        {
+                            'id': image_id,
+                            'image_url': resolver.name_url(image_storage, image_name),
+                            **image_info(resolver, image_storage, image_name),
+                            'thumbnails': thumbnail_urls(resolver, image_storage, image_name),
+                            'is_primary': is_primary,
+                            'order': order,
+                        }
+                        for image_id, image_name, is_primary, order in images
+                    ]
+                elif name == 'all_images':
+                    item[name] = self._all_images(resolver, product_storage, image_storage, row, images)
+                elif name == 'shop_name':
+                    if dropshipper_shop:
+                        item[name] = dropshipper_shop.name
+                    else:
+                        item[name] = row['shop__name'] if row['shop_id'] else None
+                elif name == 'shop_logo_url':
+                    url = resolver.url(dropshipper_shop.logo) if dropshipper_shop else None
+                    if not url and row['shop_id']:
+                        url = resolver.name_url(logo_storage, row['shop__logo'])
+                    item[name] = url
+                elif name == 'vendor_name':
+                    item[name] = row['vendor__company_name'] or row['vendor__username']
+            data.append(item)
+        return data
+
+    @staticmethod
+    def _all_images(resolver, product_storage, image_storage, row, images):
+        # Mirrors ProductSerializer.get_all_images
+        result = []
+        url = resolver.name_url(product_storage, row['image'])
+        if url:
+            result.append({
+                'id': 'main', 'image_url': url,
+                **image_info(resolver, product_storage, row['image']),
+                'thumbnails': thumbnail_urls(resolver, product_storage, row['image']),
+                'is_primary': True, 'order': 0,
+            })
+        for idx, (image_id, name, is_primary, order) in enumerate(images, start=1):
+            url = resolver.name_url(image_storage, name)
+            if url:
+                result.append({
+                    'id': image_id, 'image_url': url,
+                    **image_info(resolver, image_storage, name),
+                    'thumbnails': thumbnail_urls(resolver, image_storage, name),
+                    'is_primary': is_primary, 'order': order or idx,
+                })
+        return sorted(result, key=lambda x: x['order'])
+
+class OrderProjection(Projection):
+    serializer_class = OrderListSerializer
+    value_fields = (
+        'id', 'status', 'total_amount', 'created_at',
+        'customer_name', 'customer_email', 'customer_phone', 'customer_address',
+        'guest_name', 'guest_email', 'guest_phone', 'guest_address',
+        'dropshipper_shop_id', 'dropshipper_shop_name',
+    )
+
+    def __init__(self, context, fields=None, items_queryset=None):
+        super().__init__(context, fields)
+        # Restricts which order lines are listed, like a filtered items prefetch
+        self.items_queryset = items_queryset if items_queryset is not None else OrderItem.objects.all()
+
+    def serialize(self, rows):
+        rows = list(rows)
+        items_by_order = {}
+        if 'items' in self.fields and rows:
+            item_rows = self.items_queryset.filter(
+                order_id__in=[row['id'] for row in rows],
+            ).order_by('id').values_list('order_id', 'id', 'product_id', 'product_title', 'quantity', 'price')
+            for order_id, item_id, product_id, title, quantity, price in item_rows:
+                items_by_order.setdefault(order_id, []).append({
+                    'id': item_id,
+                    'product': product_id,
+                    'product_title': title,
+                    'quantity': quantity,
+                    'price': str(price),
+                })
+
+        data = []
+        for row in rows:
+            item = {}
+            for name in self.fields:
+                if name == 'items':
+                    item[name] = items_by_order.get(row['id'], [])
+                elif name == 'dropshipper_shop':
+                    item[name] = row['dropshipper_shop_id']
+                else:
+                    item[name] = self.to_representation(name, row[name])
+            data.append(item)
+        return data
+
+class ProjectionListMixin:
+    """
+    Serve a list view through ``projection_class`` instead of its serializer.
+    Pagination works on the ``.values()`` rows; CursorPagination reads the
+    ordering key from dicts as well as instances.
+    """
+    projection_class = None
+
+    def get_projection(self):
+        requested = self.get_requested_fields() if hasattr(self, 'get_requested_fields') else None
+        return self.projection_class(self.get_serializer_context(), requested)
+
+    def list(self, request, *args, **kwargs):
+        if not projections_enabled():
+            return super().list(request, *args, **kwargs)
+
+        projection = self.get_projection()
+        rows = projection.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(projection.serialize(page))
+        return Response(projection.serialize(rows))
@@ -0,0 +1,162 @@
+"""
+Daily sales rollups for the analytics endpoint.
+
+``VendorSalesDaily`` holds units, revenue and order counts per (vendor,
+product, day), ``VendorOrdersDaily`` the number of orders per (vendor, day)
+(an order with several of a vendor's products counts once), and
+``ShopSalesDaily`` units, revenue and orders per (dropshipper shop, day), so
+date-range reports read a few hundred rows instead of every order line.
+Cancelled orders are not counted.
+
+Rows are adjusted incrementally: a new order adds its lines once its
+transaction commits, and an order entering (or leaving) ``cancelled`` subtracts
+(or adds back) its lines. Each adjustment is a single
+``INSERT ... ON CONFLICT DO UPDATE`` that adds to the existing counters, so
+concurrent orders never overwrite each other. ``manage.py rebuild_sales_rollups``
+recomputes everything from ``OrderItem``.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, DecimalField, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Order, OrderItem, VendorSalesDaily, VendorOrdersDaily, ShopSalesDaily
+
+COUNTERS = ('units', 'revenue', 'orders')
+
+def _upsert(model, key_fields, rows, counters=COUNTERS):
+    """Add ``rows`` (``{key field: value, ..., 'units', 'revenue', 'orders'}``) to ``model``'s ``counters``."""
+    if not rows:
+        return
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    keys = [qn(model._meta.get_field(name).column) for name in key_fields]
+    columns = keys + [qn(name) for name in counters]
+    updates = ', '.join(f'{qn(name)} = {table}.{qn(name)} + excluded.{qn(name)}' for name in counters)
+    sql = (
+        f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join(["%s"] * len(columns))}) '
+        f'ON CONFLICT ({", ".join(keys)}) DO UPDATE SET {updates}'
+    )
+    params = [[row[name] for name in key_fields] + [row[name] for name in counters] for row in rows]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+def _new_totals():
+    return {'units': 0, 'revenue': Decimal('0'), 'orders': set()}
+
+def _add(totals, key, units, revenue):
+    row = totals[key]
+    row['units'] += units
+    row['revenue'] += revenue
+
+def apply_lines(lines, sign=1):
+    """
+    Add (or with ``sign=-1`` subtract) order lines given as dicts with
+    ``order_id``, ``vendor_id``, ``product_id``, ``quantity``, ``price``,
+    ``day`` and ``shop_id`` (the order's dropshipper shop or None).
+    """
+    vendor_totals = defaultdict(_new_totals)
+    vendor_orders = defaultdict(set)
+    shop_totals = defaultdict(_new_totals)
+    for line in lines:
+        revenue = line['price'] * line['quantity']
+        key = (line['vendor_id'], line['product_id'], line['day'])
+        _add(vendor_totals, key, line['quantity'], revenue)
+        vendor_totals[key]['orders'].add(line['order_id'])
+        vendor_orders[(line['vendor_id'], line['day'])].add(line['order_id'])
+        if line['shop_id']:
+            key = (line['shop_id'], line['day'])
+            _add(shop_totals, key, line['quantity'], revenue)
+            shop_totals[key]['orders'].add(line['order_id'])
+
+    def rows(totals, key_fields):
+        return [
+            {
+                **dict(zip(key_fields, key)),
+                'units': sign * row['units'], 'revenue': sign * row['revenue'], 'orders': sign * len(row['orders']),
+            }
+            for key, row in totals.items()
+        ]
+
+    with transaction.atomic():
+        _upsert(VendorSalesDaily, ('vendor', 'product', 'day'), rows(vendor_totals, ('vendor', 'product', 'day')))
+        _upsert(VendorOrdersDaily, ('vendor', 'day'), [
+            {'vendor': vendor_id, 'day': day, 'orders': sign * len(orders)}
+            for (vendor_id, day), orders in vendor_orders.items()
+        ], counters=('orders',))
+        _upsert(ShopSalesDaily, ('shop', 'day'), rows(shop_totals, ('shop', 'day')))
+
+def record_order(order, items):
+    """Count a new order's ``items`` (OrderItem instances) once the order's transaction commits."""
+    if order.status == 'cancelled':
+        return
+    day = timezone.localdate(order.created_at)
+    lines = [
+        {
+            'order_id': order.pk, 'vendor_id': item.vendor_id, 'product_id': item.product_id,
+            'quantity': item.quantity, 'price': item.price, 'day': day, 'shop_id': order.dropshipper_shop_id,
+        }
+        for item in items
+    ]
+    transaction.on_commit(lambda: apply_lines(lines))
+
+def _order_lines(order_ids):
+    rows = OrderItem.objects.filter(order_id__in=order_ids).values(
+        'order_id', 'vendor_id', 'product_id', 'quantity', 'price',
+        created_at=F('order__created_at'), shop_id=F('order__dropshipper_shop_id'),
+    )
+    for row in rows:
+        row['day'] = timezone.localdate(row.pop('created_at'))
+        yield row
+
+def record_status_change(order_ids, old_status, new_status):
+    """Adjust the rollups for orders whose status changed from ``old_status`` to ``new_status``."""
+    if (old_status == 'cancelled') == (new_status == 'cancelled') or not order_ids:
+        return
+    sign = -1 if new_status == 'cancelled' else 1
+    order_ids = list(order_ids)
+    transaction.on_commit(lambda: apply_lines(list(_order_lines(order_ids)), sign))
+
+def rebuild(chunk_size=5000, stdout=None):
+    """
+    Recompute the rollups from ``OrderItem``, ``chunk_size`` orders at a
+    time; each chunk is aggregated by the database. Runs in one transaction,
+    so readers see either the old or the new figures.
+    """
+    with transaction.atomic():
+        VendorSalesDaily.objects.all().delete()
+        VendorOrdersDaily.objects.all().delete()
+        ShopSalesDaily.objects.all().delete()
+        orders = Order.objects.exclude(status='cancelled').order_by('pk').values_list('pk', flat=True)
+        last = 0
+        chunks = 0
+        while True:
+            ids = list(orders.filter(pk__gt=last)[:chunk_size])
+            if not ids:
+                break
+            # Whole orders per chunk, so per-chunk distinct order counts add up
+            lines = OrderItem.objects.filter(order_id__gte=ids[0], order_id__lte=ids[-1]).exclude(
+                order__status='cancelled',
+            ).annotate(day=TruncDate('order__created_at')).order_by()
+            revenue = Sum(F('price') * F('quantity'), output_field=DecimalField(max_digits=14, decimal_places=2))
+            _upsert(VendorSalesDaily, ('vendor', 'product', 'day'), list(
+                lines.values('vendor', 'product', 'day').annotate(
+                    units=Sum('quantity'), revenue=revenue, orders=Count('order', distinct=True),
+                )
+            ))
+            _upsert(VendorOrdersDaily, ('vendor', 'day'), list(
+                lines.values('vendor', 'day').annotate(orders=Count('order', distinct=True))
+            ), counters=('orders',))
+            _upsert(ShopSalesDaily, ('shop', 'day'), list(
+                lines.exclude(order__dropshipper_shop=None).values('day', shop=F('order__dropshipper_shop')).annotate(
+                    units=Sum('quantity'), revenue=revenue, orders=Count('order', distinct=True),
+                )
+            ))
+            last = ids[-1]
+            chunks += 1
+            if stdout:
+                stdout.write(f'Aggregated orders up to #{last}')
+        return chunks
@@ -0,0 +1,142 @@
+"""
+Product search and facet filters for the catalog endpoints.
+
+Full-text search over ``title`` and ``description`` uses an index kept next to
+``shop_product``: on PostgreSQL a ``search_vector`` tsvector column with a GIN
+index, on SQLite an FTS5 table whose rowid is the product id. Migration 0010
+creates them, and the Product signals in ``shop.signals`` keep them in sync.
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from rest_framework import serializers
+
+SEARCH_CONFIG = 'english'
+FTS_TABLE = 'shop_product_fts'
+
+PG_VECTOR_SQL = (
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(title, '')), 'A') || "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(description, '')), 'B')"
+)
+
+TRUE_VALUES = ('1', 'true', 'yes')
+FALSE_VALUES = ('0', 'false', 'no')
+
+def install_search_index(using=DEFAULT_DB_ALIAS):
+    """
+    Create the search index if it is missing and fill it for existing rows.
+    Used for databases built without running migrations (the test database).
+    """
+    using_connection = connections[using]
+    with using_connection.cursor() as cursor:
+        if using_connection.vendor == 'postgresql':
+            cursor.execute("ALTER TABLE shop_product ADD COLUMN IF NOT EXISTS search_vector tsvector")
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS shop_product_search_vector_idx "
+                "ON shop_product USING GIN (search_vector)"
+            )
+            cursor.execute(f"UPDATE shop_product SET search_vector = {PG_VECTOR_SQL} WHERE search_vector IS NULL")
+        elif using_connection.vendor == 'sqlite':
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+                f"USING fts5(title, description, tokenize='porter unicode61')"
+            )
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE}(rowid, title, description) "
+                f"SELECT id, title, description FROM shop_product "
+                f"WHERE id NOT IN (SELECT rowid FROM {FTS_TABLE})"
+            )
+
+def index_product(product):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f"UPDATE shop_product SET search_vector = {PG_VECTOR_SQL} WHERE id = %s", [product.pk])
+        elif connection.vendor == 'sqlite':
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [product.pk])
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE}(rowid, title, description) VALUES (%s, %s, %s)",
+                [product.pk, product.title, product.description],
+            )
+
+def unindex_product(product_id):
+    # The PostgreSQL tsvector lives on the product row and goes away with it
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [product_id])
+
+def _fts5_query(text):
+    # Quote each word so user input can't use FTS5 query syntax; words are ANDed
+    return ' '.join('"%s"' % word.replace('"', '""') for word in text.split())
+
+def search_products(queryset, text):
+    """Restrict ``queryset`` to products whose title or description match ``text``."""
+    text = text.strip()
+    if not text:
+        return queryset
+    if connection.vendor == 'postgresql':
+        matches = RawSQL(
+            f"SELECT id FROM shop_product WHERE search_vector @@ plainto_tsquery('{SEARCH_CONFIG}', %s)",
+            [text],
+        )
+        return queryset.filter(id__in=matches)
+    if connection.vendor == 'sqlite':
+        matches = RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [_fts5_query(text)])
+        return queryset.filter(id__in=matches)
+    return queryset.filter(Q(title__icontains=text) | Q(description__icontains=text))
+
+def _parse_bool(params, name):
+    value = params.get(name)
+    if value is None or value == '':
+        return None
+    if value.lower() in TRUE_VALUES:
+        return True
+    if value.lower() in FALSE_VALUES:
+        return False
+    raise serializers.ValidationError({name: 'Expected true or false'})
+
+def _parse_decimal(params, name):
+    value = params.get(name)
+    if value is None or value == '':
+        return None
+    try:
+        number = Decimal(value)
+    except InvalidOperation:
+        number = None
+    if number is None or not number.is_finite():
+        raise serializers.ValidationError({name: 'Expected a number'})
+    return number
+
+def filter_products(queryset, params):
+    """
+    Apply the catalog query parameters to a product queryset:
+    ``q`` (full-text), ``category`` (comma separated), ``min_price``,
+    ``max_price``, ``in_stock`` and ``is_active``.
+    """
+    text = params.get('q')
+    if text:
+        queryset = search_products(queryset, text)
+
+    categories = [c.strip() for c in params.get('category', '').split(',') if c.strip()]
+    if categories:
+        queryset = queryset.filter(category__in=categories)
+
+    min_price = _parse_decimal(params, 'min_price')
+    if min_price is not None:
+        queryset = queryset.filter(price__gte=min_price)
+    max_price = _parse_decimal(params, 'max_price')
+    if max_price is not None:
+        queryset = queryset.filter(price__lte=max_price)
+
+    in_stock = _parse_bool(params, 'in_stock')
+    if in_stock is True:
+        queryset = queryset.filter(stock__gt=0)
+    elif in_stock is False:
+        queryset = queryset.filter(stock__lte=0)
+
+    is_active = _parse_bool(params, 'is_active')
+    if is_active is not None:
+        queryset = queryset.filter(is_active=is_active)
+
+    return queryset
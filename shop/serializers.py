@@ -1,61 +1,201 @@
+from datetime import timedelta
+
+from PIL import Image
 from rest_framework import serializers
+from django.db import connection, models, transaction
 from django.contrib.auth import get_user_model
-from .models import Shop, Product, ProductImage, DropshipImport, Order, OrderItem
+from django.utils import timezone
+from .models import Shop, Product, ProductImage, DropshipImport, Order, OrderItem, OrderEvent
+from .media import get_media_resolver, image_info
+from .thumbnails import thumbnail_pairs, thumbnail_urls
+from .storage import upload_sha256, stored_sha256
+from .signals import product_images_changed, products_changed
+from .uploads import start_image_upload, batch_status
+from .rollups import record_order
+from .events import record_created
+from .plans import PRODUCT_PLAN
+from .fieldsets import SparseFieldsetSerializerMixin
 
 User = get_user_model()
 
+class MediaPrimingListSerializer(serializers.ListSerializer):
+    """
+    Checks every image (and thumbnail) on the page against storage in one batch
+    before the items are serialized, so the per-item URL lookups hit the
+    resolver's memo.
+    """
+
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        fields = self.child.fields
+        names = list(getattr(self.child, 'get_context_media_names', list)())
+        for item in items:
+            names.extend(self.child.get_media_names(item, fields))
+        get_media_resolver(self.context).prime_names(names)
+        return super().to_representation(items)
+
+def _file_pair(f):
+    return (f.storage, f.name)
+
+def set_dropshipper_shop(context, dropshipper_shop):
+    """Store the dropshipper storefront in a serializer context."""
+    context['dropshipper_shop'] = dropshipper_shop
+
+def get_dropshipper_shop(context):
+    """
+    The dropshipper storefront products are shown under. Views load it once in
+    get_serializer_context(); otherwise it is looked up on first use and kept
+    in the context for the rest of the request.
+    """
+    if 'dropshipper_shop' not in context:
+        dropshipper_shop = None
+        dropshipper_user = context.get('dropshipper_user')
+        if dropshipper_user:
+            dropshipper_shop = Shop.objects.filter(owner=dropshipper_user, shop_type='dropshipper').first()
+        set_dropshipper_shop(context, dropshipper_shop)
+    return context['dropshipper_shop']
+
+def _prefetched(obj, relation):
+    """Related objects already loaded by prefetch_related, or an empty list."""
+    return getattr(obj, '_prefetched_objects_cache', {}).get(relation, [])
+
 class UserMiniSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'company_name']
 
-class ShopSerializer(serializers.ModelSerializer):
+class ShopSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     owner = UserMiniSerializer(read_only=True)
     logo_url = serializers.SerializerMethodField()
+    logo_width = serializers.SerializerMethodField()
+    logo_height = serializers.SerializerMethodField()
+    logo_thumbnails = serializers.SerializerMethodField()
     products = serializers.SerializerMethodField()
 
     class Meta:
         model = Shop
-        fields = ['id', 'name', 'company_name', 'logo_url', 'owner', 'products']
+        fields = ['id', 'name', 'company_name', 'logo_url', 'logo_width', 'logo_height', 'logo_thumbnails', 'owner', 'products']
+        list_serializer_class = MediaPrimingListSerializer
+
+    @staticmethod
+    def get_logo_names(obj, fields):
+        names = [_file_pair(obj.logo)] if {'logo_url', 'logo_width', 'logo_height'} & set(fields) else []
+        if 'logo_thumbnails' in fields:
+            names.extend(thumbnail_pairs(obj.logo))
+        return names
+
+    @classmethod
+    def get_media_names(cls, obj, fields):
+        names = cls.get_logo_names(obj, fields)
+        if 'products' in fields:
+            for product in _prefetched(obj, 'products'):
+                names.extend(ProductSerializer.get_media_names(product))
+        return names
 
     def get_products(self, obj):
         # Expose vendor products attached to this shop
-        from .models import Product
-        prods = obj.products.all().select_related('vendor', 'shop')
+        if 'products' in getattr(obj, '_prefetched_objects_cache', {}):
+            prods = obj.products.all()
+        else:
+            prods = PRODUCT_PLAN.apply(obj.products.all())
         return ProductSerializer(prods, many=True, context=self.context).data
 
     def get_logo_url(self, obj):
-        request = self.context.get('request')
-        if obj.logo and hasattr(obj.logo, 'url'):
-            # Check if file actually exists
-            try:
-                if obj.logo.storage.exists(obj.logo.name):
-                    url = obj.logo.url
-                    return request.build_absolute_uri(url) if request else url
-            except:
-                pass
-        return None
+        return get_media_resolver(self.context).url(obj.logo)
+
+    def get_logo_width(self, obj):
+        return image_info(get_media_resolver(self.context), obj.logo.storage, obj.logo.name)['width']
+
+    def get_logo_height(self, obj):
+        return image_info(get_media_resolver(self.context), obj.logo.storage, obj.logo.name)['height']
+
+    def get_logo_thumbnails(self, obj):
+        return thumbnail_urls(get_media_resolver(self.context), obj.logo.storage, obj.logo.name)
+
+class ShopSummarySerializer(ShopSerializer):
+    """
+    Shop without its full product list: the annotated ``product_count`` and,
+    when the view sets ``preview_size`` in the context, the newest products
+    (``products_preview``) with ``has_more``.
+    """
+    product_count = serializers.IntegerField(read_only=True)
+    products_preview = serializers.SerializerMethodField()
+    has_more = serializers.SerializerMethodField()
+
+    class Meta(ShopSerializer.Meta):
+        fields = [
+            'id', 'name', 'company_name', 'logo_url', 'logo_width', 'logo_height', 'logo_thumbnails', 'owner',
+            'product_count', 'products_preview', 'has_more',
+        ]
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.context.get('preview_size') is None:
+            fields.pop('products_preview', None)
+            fields.pop('has_more', None)
+        return fields
+
+    @classmethod
+    def get_media_names(cls, obj, fields):
+        names = cls.get_logo_names(obj, fields)
+        if 'products_preview' in fields:
+            for product in getattr(obj, 'preview_products', []):
+                names.extend(ProductSerializer.get_media_names(product))
+        return names
+
+    def get_products_preview(self, obj):
+        # The view fetches one extra row per shop to know whether there are more
+        preview = obj.preview_products[:self.context['preview_size']]
+        return ProductSerializer(preview, many=True, context=self.context).data
+
+    def get_has_more(self, obj):
+        return len(obj.preview_products) > self.context['preview_size']
 
 class ProductImageSerializer(serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
+    width = serializers.SerializerMethodField()
+    height = serializers.SerializerMethodField()
+    placeholder = serializers.SerializerMethodField()
+    thumbnails = serializers.SerializerMethodField()
 
     class Meta:
         model = ProductImage
-        fields = ['id', 'image_url', 'is_primary', 'order']
+        fields = ['id', 'image_url', 'width', 'height', 'placeholder', 'thumbnails', 'is_primary', 'order']
+        list_serializer_class = MediaPrimingListSerializer
+
+    @staticmethod
+    def get_media_names(obj, fields):
+        names = []
+        if {'image_url', 'width', 'height', 'placeholder'} & set(fields):
+            names.append(_file_pair(obj.image))
+        if 'thumbnails' in fields:
+            names.extend(thumbnail_pairs(obj.image))
+        return names
 
     def get_image_url(self, obj):
-        request = self.context.get('request')
-        if obj.image and hasattr(obj.image, 'url'):
-            try:
-                if obj.image.storage.exists(obj.image.name):
-                    url = obj.image.url
-                    return request.build_absolute_uri(url) if request else url
-            except:
-                pass
-        return None
+        return get_media_resolver(self.context).url(obj.image)
+
+    def _image_info(self, obj):
+        return image_info(get_media_resolver(self.context), obj.image.storage, obj.image.name)
+
+    def get_width(self, obj):
+        return self._image_info(obj)['width']
+
+    def get_height(self, obj):
+        return self._image_info(obj)['height']
+
+    def get_placeholder(self, obj):
+        return self._image_info(obj)['placeholder']
 
-class ProductSerializer(serializers.ModelSerializer):
+    def get_thumbnails(self, obj):
+        return thumbnail_urls(get_media_resolver(self.context), obj.image.storage, obj.image.name)
+
+class ProductSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
+    image_width = serializers.SerializerMethodField()
+    image_height = serializers.SerializerMethodField()
+    image_placeholder = serializers.SerializerMethodField()
+    thumbnails = serializers.SerializerMethodField()
     images = ProductImageSerializer(source='product_images', many=True, read_only=True)
     all_images = serializers.SerializerMethodField()
     shop_name = serializers.SerializerMethodField()
@@ -64,60 +204,75 @@ class ProductSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Product
-        fields = ['id', 'title', 'description', 'price', 'image_url', 'images', 'all_images', 'category', 'stock', 'is_active', 'shop_name', 'shop_logo_url', 'vendor_name']
+        fields = ['id', 'title', 'description', 'price', 'image_url', 'image_width', 'image_height', 'image_placeholder', 'thumbnails', 'images', 'all_images', 'category', 'stock', 'is_active', 'shop_name', 'shop_logo_url', 'vendor_name']
+        list_serializer_class = MediaPrimingListSerializer
+
+    @staticmethod
+    def get_media_names(obj, fields=None):
+        def wanted(*names):
+            return fields is None or bool(set(names) & set(fields))
+
+        names = []
+        if wanted('image_url', 'image_width', 'image_height', 'image_placeholder', 'all_images'):
+            names.append(_file_pair(obj.image))
+        if wanted('thumbnails', 'all_images'):
+            names.extend(thumbnail_pairs(obj.image))
+        if wanted('images', 'all_images'):
+            for img in _prefetched(obj, 'product_images'):
+                names.append(_file_pair(img.image))
+                names.extend(thumbnail_pairs(img.image))
+        if wanted('shop_logo_url') and obj.shop:
+            names.append(_file_pair(obj.shop.logo))
+        return names
+
+    def get_context_media_names(self):
+        # The storefront logo shown on every product, primed with the page
+        dropshipper_shop = self.context.get('dropshipper_shop')
+        if dropshipper_shop and 'shop_logo_url' in self.fields:
+            return [_file_pair(dropshipper_shop.logo)]
+        return []
 
     def get_image_url(self, obj):
-        request = self.context.get('request')
-        if obj.image and hasattr(obj.image, 'url'):
-            # Check if file actually exists
-            try:
-                if obj.image.storage.exists(obj.image.name):
-                    url = obj.image.url
-                    return request.build_absolute_uri(url) if request else url
-            except:
-                pass
-        return None
+        return get_media_resolver(self.context).url(obj.image)
+
+    def _image_info(self, obj):
+        return image_info(get_media_resolver(self.context), obj.image.storage, obj.image.name)
+
+    def get_image_width(self, obj):
+        return self._image_info(obj)['width']
+
+    def get_image_height(self, obj):
+        return self._image_info(obj)['height']
+
+    def get_image_placeholder(self, obj):
+        return self._image_info(obj)['placeholder']
+
+    def get_thumbnails(self, obj):
+        return thumbnail_urls(get_media_resolver(self.context), obj.image.storage, obj.image.name)
+
+    def get_dropshipper_shop(self):
+        return get_dropshipper_shop(self.context)
 
     def get_shop_name(self, obj):
-        # Check if we have a dropshipper context for this product
-        dropshipper_user = self.context.get('dropshipper_user')
-        if dropshipper_user:
-            # Try to get the dropshipper's shop
-            try:
-                dropshipper_shop = Shop.objects.filter(owner=dropshipper_user, shop_type='dropshipper').first()
-                if dropshipper_shop:
-                    return dropshipper_shop.name
-            except:
-                pass
-        
+        # Products shown in a dropshipper storefront carry the dropshipper's shop name
+        dropshipper_shop = self.get_dropshipper_shop()
+        if dropshipper_shop:
+            return dropshipper_shop.name
+
         # Fallback to original vendor shop
         return obj.shop.name if obj.shop else None
 
     def get_shop_logo_url(self, obj):
-        request = self.context.get('request')
-        
-        # Check if we have a dropshipper context for this product
-        dropshipper_user = self.context.get('dropshipper_user')
-        if dropshipper_user:
-            # Try to get the dropshipper's shop logo
-            try:
-                dropshipper_shop = Shop.objects.filter(owner=dropshipper_user, shop_type='dropshipper').first()
-                if dropshipper_shop and dropshipper_shop.logo and hasattr(dropshipper_shop.logo, 'url'):
-                    if dropshipper_shop.logo.storage.exists(dropshipper_shop.logo.name):
-                        url = dropshipper_shop.logo.url
-                        return request.build_absolute_uri(url) if request else url
-            except:
-                pass
-        
+        resolver = get_media_resolver(self.context)
+        dropshipper_shop = self.get_dropshipper_shop()
+        if dropshipper_shop:
+            url = resolver.url(dropshipper_shop.logo)
+            if url:
+                return url
+
         # Fallback to original vendor shop logo
-        if obj.shop and obj.shop.logo and hasattr(obj.shop.logo, 'url'):
-            # Check if file actually exists
-            try:
-                if obj.shop.logo.storage.exists(obj.shop.logo.name):
-                    url = obj.shop.logo.url
-                    return request.build_absolute_uri(url) if request else url
-            except:
-                pass
+        if obj.shop:
+            return resolver.url(obj.shop.logo)
         return None
 
     def get_vendor_name(self, obj):
@@ -127,45 +282,60 @@ class ProductSerializer(serializers.ModelSerializer):
 
     def get_all_images(self, obj):
         """Get all images for this product including the main image"""
-        request = self.context.get('request')
+        resolver = get_media_resolver(self.context)
         images = []
-        
+
         # Add main image if exists
-        if obj.image and hasattr(obj.image, 'url'):
-            try:
-                if obj.image.storage.exists(obj.image.name):
-                    url = obj.image.url
-                    images.append({
-                        'id': 'main',
-                        'image_url': request.build_absolute_uri(url) if request else url,
-                        'is_primary': True,
-                        'order': 0
-                    })
-            except:
-                pass
-        
+        url = resolver.url(obj.image)
+        if url:
+            images.append({
+                'id': 'main',
+                'image_url': url,
+                **image_info(resolver, obj.image.storage, obj.image.name),
+                'thumbnails': thumbnail_urls(resolver, obj.image.storage, obj.image.name),
+                'is_primary': True,
+                'order': 0
+            })
+
         # Add additional images
         for idx, img in enumerate(obj.product_images.all(), start=1):
-            if img.image and hasattr(img.image, 'url'):
-                try:
-                    if img.image.storage.exists(img.image.name):
-                        url = img.image.url
-                        images.append({
-                            'id': img.id,
-                            'image_url': request.build_absolute_uri(url) if request else url,
-                            'is_primary': img.is_primary,
-                            'order': img.order or idx
-                        })
-                except:
-                    pass
-        
+            url = resolver.url(img.image)
+            if url:
+                images.append({
+                    'id': img.id,
+                    'image_url': url,
+                    **image_info(resolver, img.image.storage, img.image.name),
+                    'thumbnails': thumbnail_urls(resolver, img.image.storage, img.image.name),
+                    'is_primary': img.is_primary,
+                    'order': img.order or idx
+                })
+
         return sorted(images, key=lambda x: x['order'])
 
+class ImageHeaderField(serializers.FileField):
+    """
+    A file that Pillow recognises as an image from its header, which is cheap to
+    read; the full ``verify()`` runs in the upload pool (see shop.uploads).
+    """
+    default_error_messages = {
+        'invalid_image': serializers.ImageField.default_error_messages['invalid_image'],
+    }
+
+    def to_internal_value(self, data):
+        f = super().to_internal_value(data)
+        try:
+            Image.open(f)
+        except Exception:
+            self.fail('invalid_image')
+        finally:
+            f.seek(0)
+        return f
+
 class ProductCreateSerializer(serializers.ModelSerializer):
     # Allow product creation without an image; accept 'file' alias as well
     image = serializers.ImageField(required=False, allow_null=True)
     additional_images = serializers.ListField(
-        child=serializers.ImageField(),
+        child=ImageHeaderField(),
         required=False,
         allow_empty=True,
         write_only=True
@@ -188,37 +358,89 @@ class ProductCreateSerializer(serializers.ModelSerializer):
         additional_images = validated_data.pop('additional_images', [])
         product = super().create(validated_data)
         
-        # Create additional product images
-        for idx, image in enumerate(additional_images):
-            ProductImage.objects.create(
-                product=product,
-                image=image,
-                order=idx + 1,
-                is_primary=False
+        # Additional product images are validated and stored in parallel
+        if additional_images:
+            self.image_upload = start_image_upload(
+                product, additional_images, self.context['request'].user,
+                range(1, len(additional_images) + 1),
             )
         
         return product
 
     def update(self, instance, validated_data):
         additional_images = validated_data.pop('additional_images', None)
-        product = super().update(instance, validated_data)
-        
-        # Handle additional images if provided
-        if additional_images is not None:
-            # Remove existing additional images
-            instance.product_images.all().delete()
-            
-            # Create new additional images
-            for idx, image in enumerate(additional_images):
-                ProductImage.objects.create(
-                    product=instance,
-                    image=image,
-                    order=idx + 1,
-                    is_primary=False
-                )
-        
+        with transaction.atomic():
+            product = super().update(instance, validated_data)
+            # The list replaces the product's images, but only changed ones are touched
+            if additional_images is not None:
+                self.image_upload = sync_product_images(instance, additional_images, self.context['request'].user)
         return product
 
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if getattr(self, 'image_upload', None):
+            data['image_upload'] = batch_status(self.image_upload, self.context['request'].user, self.context['request'])
+        return data
+
+def sync_product_images(product, uploads, user):
+    """
+    Make ``uploads`` the product's additional images, in that order. Uploads
+    whose content matches an existing image keep that row and stored file;
+    only their ``order`` changes, in one bulk update. Other uploads go through
+    the upload pool and images no longer listed are deleted. Returns the
+    upload batch id, or None if nothing new was uploaded.
+    """
+    existing = list(product.product_images.all())
+    hashes = stored_sha256([img.image.name for img in existing])
+    by_hash = {}
+    for img in existing:
+        by_hash.setdefault(hashes.get(img.image.name), []).append(img)
+    by_hash.pop(None, None)
+
+    kept, reordered, new = set(), [], []
+    for order, upload in enumerate(uploads, start=1):
+        matches = by_hash.get(upload_sha256(upload))
+        if matches:
+            img = matches.pop(0)
+            kept.add(img.pk)
+            if img.order != order:
+                img.order = order
+                reordered.append(img)
+        else:
+            new.append((order, upload))
+
+    removed = [img.pk for img in existing if img.pk not in kept]
+    if removed:
+        ProductImage.objects.filter(pk__in=removed).delete()
+    if reordered:
+        ProductImage.objects.bulk_update(reordered, ['order'])
+        product_images_changed(product)
+    if new:
+        return start_image_upload(product, [upload for _, upload in new], user, [order for order, _ in new])
+    return None
+
+class ProductImageUploadSerializer(serializers.Serializer):
+    """New images for a product, appended after its current ones."""
+    images = serializers.ListField(child=ImageHeaderField(), allow_empty=False)
+
+    def to_internal_value(self, data):
+        # A single 'image' (or 'file') is accepted as a one-item list
+        if 'images' not in data:
+            single = data.get('image') or data.get('file')
+            if single is not None:
+                data = {'images': [single]}
+        return super().to_internal_value(data)
+
+class ProductImageOrderSerializer(serializers.Serializer):
+    """The ids of all of a product's images, in their new order."""
+    order = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+
+    def validate_order(self, value):
+        image_ids = set(self.context['product'].product_images.values_list('id', flat=True))
+        if len(value) != len(set(value)) or set(value) != image_ids:
+            raise serializers.ValidationError('Must list every image of the product exactly once')
+        return value
+
 class DropshipImportSerializer(serializers.ModelSerializer):
     class Meta:
         model = DropshipImport
@@ -226,7 +448,8 @@ class DropshipImportSerializer(serializers.ModelSerializer):
         read_only_fields = ['dropshipper', 'shop', 'created_at']
 
 class OrderItemInputSerializer(serializers.Serializer):
-    product = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all())
+    # Resolved to Product instances by OrderSerializer.validate_items, all in one query
+    product = serializers.IntegerField(source='product_id', min_value=1)
     quantity = serializers.IntegerField(min_value=1)
 
 class OrderSerializer(serializers.ModelSerializer):
@@ -251,6 +474,59 @@ class OrderSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['status', 'created_at', 'total_amount']
 
+    def validate_items(self, items):
+        ids = {item['product_id'] for item in items}
+        products = Product.objects.select_related('vendor').in_bulk(ids)
+        if len(products) < len(ids):
+            raise serializers.ValidationError([
+                {} if item['product_id'] in products
+                else {'product': [f'Invalid pk "{item["product_id"]}" - object does not exist.']}
+                for item in items
+            ])
+        for item in items:
+            item['product'] = products[item['product_id']]
+        return items
+
+    def reserve_stock(self, items_data):
+        """
+        Take the ordered quantities out of stock, or raise a ValidationError
+        naming the lines that cannot be fulfilled. Runs inside the order's
+        transaction, which the error rolls back.
+        """
+        wanted = {}
+        for item in items_data:
+            wanted[item['product'].pk] = wanted.get(item['product'].pk, 0) + item['quantity']
+        ids = sorted(wanted)
+        if connection.features.has_select_for_update:
+            # Lock the rows in primary key order, so concurrent checkouts of the
+            # same products queue up instead of deadlocking
+            list(Product.objects.select_for_update().filter(pk__in=ids).order_by('pk').values_list('pk', flat=True))
+
+        # Each row is only decremented if it still has enough stock
+        guard = models.Q()
+        for pk in ids:
+            guard |= models.Q(pk=pk, stock__gte=wanted[pk])
+        with transaction.atomic():
+            updated = Product.objects.filter(guard).update(
+                stock=models.Case(
+                    *[models.When(pk=pk, then=models.F('stock') - wanted[pk]) for pk in ids], default=models.F('stock'),
+                ),
+                updated_at=timezone.now(),
+            )
+            if updated < len(ids):
+                transaction.set_rollback(True)
+        if updated == len(ids):
+            products_changed([item['product'] for item in items_data])
+            return
+
+        stock = dict(Product.objects.filter(pk__in=ids).values_list('pk', 'stock'))
+        raise serializers.ValidationError({'items': [
+            {'quantity': [f'Only {max(stock[item["product"].pk], 0)} left in stock.']}
+            if stock[item['product'].pk] < wanted[item['product'].pk] else {}
+            for item in items_data
+        ]})
+
+    @transaction.atomic
     def create(self, validated_data):
         items_data = validated_data.pop('items', [])
         
@@ -262,12 +538,12 @@ class OrderSerializer(serializers.ModelSerializer):
         if not validated_data.get('dropshipper_shop'):
             # Check if any of the products being ordered have been imported by dropshippers
             product_ids = [item['product'].id for item in items_data]
-            dropship_imports = DropshipImport.objects.filter(product_id__in=product_ids).select_related('shop')
-            
-            if dropship_imports.exists():
+            first_import = (
+                DropshipImport.objects.filter(product_id__in=product_ids).select_related('shop').order_by('pk').first()
+            )
+            if first_import:
                 # If there are imports, use the first dropshipper shop found
                 # In a real system, you'd want the frontend to specify which dropshipper context
-                first_import = dropship_imports.first()
                 validated_data['dropshipper_shop'] = first_import.shop
         
         # Set guest fields from customer fields if guest fields are empty
@@ -297,21 +573,72 @@ class OrderSerializer(serializers.ModelSerializer):
         dropshipper_shop = validated_data.get('dropshipper_shop')
         if dropshipper_shop:
             validated_data['dropshipper_shop_name'] = dropshipper_shop.name
-            
+
+        self.reserve_stock(items_data)
         order = Order.objects.create(**validated_data)
-        for item in items_data:
-            product = item['product']
-            OrderItem.objects.create(
+        items = OrderItem.objects.bulk_create([
+            OrderItem(
                 order=order,
-                product=product,
-                product_title=product.title,
+                product=item['product'],
+                product_title=item['product'].title,
                 quantity=item['quantity'],
-                price=product.price,
-                vendor=product.vendor,
+                price=item['product'].price,
+                vendor=item['product'].vendor,
             )
+            for item in items_data
+        ])
+        record_order(order, items)
+        record_created(order, items)
         return order
 
-class OrderListSerializer(serializers.ModelSerializer):
+class OrderStatusBulkSerializer(serializers.Serializer):
+    """A target status for several of the vendor's orders."""
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=1000)
+    status = serializers.ChoiceField(choices=Order.STATUS_CHOICES)
+
+    def validate_ids(self, value):
+        # Duplicates are reported once
+        return list(dict.fromkeys(value))
+
+class SalesRangeSerializer(serializers.Serializer):
+    """An inclusive day range for sales analytics; the last 30 days by default."""
+    MAX_DAYS = 366
+
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+
+    def validate(self, attrs):
+        end = attrs.get('end') or timezone.localdate()
+        start = attrs.get('start') or end - timedelta(days=29)
+        if start > end:
+            raise serializers.ValidationError({'start': ['Must not be after end.']})
+        if (end - start).days >= self.MAX_DAYS:
+            raise serializers.ValidationError({'start': [f'The range may span at most {self.MAX_DAYS} days.']})
+        return {'start': start, 'end': end}
+
+class OrderExportSerializer(serializers.Serializer):
+    """Filters of an order export; ``output`` because DRF reserves ``format``."""
+    output = serializers.ChoiceField(choices=['csv', 'jsonl'], default='csv')
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    status = serializers.MultipleChoiceField(choices=Order.STATUS_CHOICES, required=False)
+
+    def validate(self, attrs):
+        if 'start' in attrs and 'end' in attrs and attrs['start'] > attrs['end']:
+            raise serializers.ValidationError({'start': ['Must not be after end.']})
+        return attrs
+
+class OrderEventFeedSerializer(serializers.Serializer):
+    """Query of the order event feed: events with an id above ``after``."""
+    after = serializers.IntegerField(min_value=0, default=0)
+    limit = serializers.IntegerField(min_value=1, max_value=500, default=100)
+
+class OrderEventSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OrderEvent
+        fields = ['id', 'order', 'type', 'status', 'previous_status', 'created_at']
+
+class OrderListSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     items = serializers.SerializerMethodField()
 
     class Meta:
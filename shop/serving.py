@@ -0,0 +1,170 @@
+"""
+Serving ``MEDIA_URL`` from ``MEDIA_ROOT``, modelled on WhiteNoise's static
+file handling (enabled with ``SERVE_MEDIA``).
+
+- Content-addressed files never change under the same name, so they are
+  cached for a year as ``immutable``. Other files, including thumbnails
+  (``generate_thumbnails --force`` rewrites them in place), get
+  ``MEDIA_MAX_AGE``.
+- ``ETag`` / ``Last-Modified`` come from the file's size and mtime, and
+  matching ``If-None-Match`` / ``If-Modified-Since`` requests get a 304.
+- ``<name>.br`` / ``<name>.gz`` next to a file are served to clients that
+  accept the encoding (create them with ``python -m whitenoise.compress media``).
+- A single ``Range: bytes=`` range is answered with 206.
+- Bodies are ``FileResponse``s over the open file, which WSGI servers with
+  ``wsgi.file_wrapper`` (gunicorn) send with ``sendfile()``.
+"""
+import mimetypes
+import os
+import re
+import stat
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe
+
+from .storage import is_content_addressed
+
+IMMUTABLE_MAX_AGE = 31536000  # one year
+
+# (Content-Encoding, file suffix), in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+def is_immutable(name):
+    """True for content-addressed names; their thumbnails can be regenerated and are not."""
+    return is_content_addressed(name)
+
+def file_etag(st):
+    return f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+def _stat_file(path):
+    try:
+        st = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    return st if stat.S_ISREG(st.st_mode) else None
+
+def _accepts(request, encoding):
+    accepted = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    return encoding in [part.split(';')[0].strip() for part in accepted.split(',')]
+
+def _choose_variant(request, path):
+    """``(path, stat, content encoding)`` of the best representation the client accepts."""
+    for encoding, suffix in ENCODINGS:
+        if _accepts(request, encoding):
+            st = _stat_file(path + suffix)
+            if st is not None:
+                return path + suffix, st, encoding
+    return path, _stat_file(path), None
+
+def parse_range(header, size):
+    """
+    ``(start, end)`` (inclusive) of a single ``bytes=`` range, ``None`` when the
+    header should be ignored, or ``False`` when it cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        # Several ranges or another unit: answering with the whole file is allowed
+        return None
+    first, last = match.groups()
+    if first == '':
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+class FileRange:
+    """
+    ``length`` bytes of an open file from its current position. Exposes
+    ``fileno()`` so ``wsgi.file_wrapper`` can still ``sendfile()`` the slice
+    (gunicorn bounds it by Content-Length).
+    """
+
+    def __init__(self, fh, length):
+        self.fh = fh
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.fh.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.fh.fileno()
+
+    def close(self):
+        self.fh.close()
+
+def _set_cache_headers(response, name, st):
+    if is_immutable(name):
+        response['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        response['Cache-Control'] = f'public, max-age={getattr(settings, "MEDIA_MAX_AGE", 3600)}'
+    response['ETag'] = file_etag(st)
+    response['Last-Modified'] = http_date(st.st_mtime)
+    response['Accept-Ranges'] = 'bytes'
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+def serve_media(request, path):
+    if request.method not in ('GET', 'HEAD'):
+        response = HttpResponse(status=405)
+        response['Allow'] = 'GET, HEAD'
+        return response
+    if any(part.startswith('.') for part in path.split('/')):
+        # Hidden files, e.g. ContentAddressedStorage's .upload-* temporaries
+        raise Http404
+    try:
+        full_path = safe_join(str(settings.MEDIA_ROOT), path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if _stat_file(full_path) is None:
+        raise Http404
+
+    range_header = request.META.get('HTTP_RANGE')
+    if range_header:
+        # Ranges are byte offsets into the identity encoding
+        file_path, st, encoding = full_path, _stat_file(full_path), None
+    else:
+        file_path, st, encoding = _choose_variant(request, full_path)
+    etag = file_etag(st)
+
+    response = get_conditional_response(request, etag=etag, last_modified=int(st.st_mtime))
+    if response is not None:
+        return _set_cache_headers(response, path, st)
+
+    byte_range = None
+    if range_header:
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if not if_range or if_range == etag or parse_http_date_safe(if_range) == int(st.st_mtime):
+            byte_range = parse_range(range_header, st.st_size)
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{st.st_size}'
+            return _set_cache_headers(response, path, st)
+
+    content_type, _ = mimetypes.guess_type(full_path)
+    fh = open(file_path, 'rb')
+    if byte_range:
+        start, end = byte_range
+        fh.seek(start)
+        response = FileResponse(FileRange(fh, end - start + 1), status=206, content_type=content_type or 'application/octet-stream')
+        response['Content-Range'] = f'bytes {start}-{end}/{st.st_size}'
+        response['Content-Length'] = end - start + 1
+    else:
+        response = FileResponse(fh, content_type=content_type or 'application/octet-stream')
+        if encoding:
+            response['Content-Encoding'] = encoding
+    return _set_cache_headers(response, path, st)
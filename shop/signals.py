@@ -0,0 +1,175 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Shop, Product, ProductImage, DropshipImport
+from . import search
+from .cache import bump_versions
+from .storage import retain_blob, release_blob
+from .thumbnails import schedule_derivatives
+
+User = get_user_model()
+
+@receiver(post_save, sender=Product)
+def index_saved_product(sender, instance, update_fields=None, raw=False, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and not {'title', 'description'} & set(update_fields):
+        return
+    search.index_product(instance)
+
+@receiver(post_delete, sender=Product)
+def unindex_deleted_product(sender, instance, **kwargs):
+    search.unindex_product(instance.pk)
+
+def install_search_index(sender, using, **kwargs):
+    search.install_search_index(using)
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def touch_product_for_image(sender, instance, raw=False, **kwargs):
+    # Images are part of the product payload; keep the product's updated_at
+    # (used for ETag / Last-Modified) moving with them
+    if raw:
+        return
+    Product.objects.filter(pk=instance.product_id).update(updated_at=timezone.now())
+
+# Image derivatives
+
+THUMBNAIL_FIELDS = {Product: 'image', ProductImage: 'image', Shop: 'logo'}
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_save, sender=Shop)
+def create_thumbnails(sender, instance, update_fields=None, raw=False, **kwargs):
+    field = THUMBNAIL_FIELDS[sender]
+    if raw or (update_fields is not None and field not in update_fields):
+        return
+    schedule_derivatives(getattr(instance, field))
+
+# Media blob reference counts (see shop.storage)
+
+MEDIA_FIELDS = {Product: 'image', ProductImage: 'image', Shop: 'logo', User: 'logo'}
+
+def _tracks_media(sender, update_fields):
+    return update_fields is None or MEDIA_FIELDS[sender] in update_fields
+
+@receiver(pre_save, sender=Product)
+@receiver(pre_save, sender=ProductImage)
+@receiver(pre_save, sender=Shop)
+@receiver(pre_save, sender=User)
+def remember_media_name(sender, instance, update_fields=None, raw=False, **kwargs):
+    instance._previous_media_name = None
+    if raw or instance._state.adding or not _tracks_media(sender, update_fields):
+        return
+    field = MEDIA_FIELDS[sender]
+    instance._previous_media_name = sender.objects.filter(pk=instance.pk).values_list(field, flat=True).first()
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_save, sender=Shop)
+@receiver(post_save, sender=User)
+def count_media_references(sender, instance, update_fields=None, raw=False, **kwargs):
+    if raw or not _tracks_media(sender, update_fields):
+        return
+    f = getattr(instance, MEDIA_FIELDS[sender])
+    previous = getattr(instance, '_previous_media_name', None) or ''
+    if (f.name or '') != previous:
+        retain_blob(f.storage, f.name)
+        release_blob(f.storage, previous)
+    instance._previous_media_name = f.name
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_delete, sender=Shop)
+@receiver(post_delete, sender=User)
+def release_media_reference(sender, instance, **kwargs):
+    f = getattr(instance, MEDIA_FIELDS[sender])
+    release_blob(f.storage, f.name)
+
+# Catalog response cache invalidation
+
+def bump_versions_on_commit(*scopes):
+    # Bumping before commit would let a concurrent read cache the old rows under
+    # the new version; in autocommit on_commit() runs right away
+    transaction.on_commit(lambda: bump_versions(*scopes))
+
+def product_cache_scopes(product_id, vendor_id=None):
+    scopes = ['catalog', 'shops']
+    if vendor_id:
+        scopes.append(f'vendor:{vendor_id}')
+    dropshipper_ids = DropshipImport.objects.filter(product_id=product_id).values_list('dropshipper_id', flat=True)
+    scopes.extend(f'dropshipper:{d}' for d in dropshipper_ids)
+    return scopes
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product(sender, instance, **kwargs):
+    bump_versions_on_commit(*product_cache_scopes(instance.pk, instance.vendor_id))
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def invalidate_product_image(sender, instance, **kwargs):
+    vendor_id = Product.objects.filter(pk=instance.product_id).values_list('vendor_id', flat=True).first()
+    bump_versions_on_commit(*product_cache_scopes(instance.product_id, vendor_id))
+
+def products_changed(products):
+    """What the Product receivers do for cache invalidation, for queryset updates of several products."""
+    scopes = ['catalog', 'shops']
+    scopes.extend(f'vendor:{product.vendor_id}' for product in products)
+    dropshipper_ids = (
+        DropshipImport.objects.filter(product__in=products).values_list('dropshipper_id', flat=True).distinct()
+    )
+    scopes.extend(f'dropshipper:{d}' for d in dropshipper_ids)
+    bump_versions_on_commit(*scopes)
+
+def product_images_changed(product):
+    """What the ProductImage receivers do, for bulk updates that send no signals."""
+    Product.objects.filter(pk=product.pk).update(updated_at=timezone.now())
+    bump_versions_on_commit(*product_cache_scopes(product.pk, product.vendor_id))
+
+def media_recorded(name):
+    """
+    What saving the products and shops showing ``name`` would do, for metadata
+    and thumbnails recorded after the upload committed: their payloads change
+    without a save.
+    """
+    now = timezone.now()
+    product_ids = set(Product.objects.filter(image=name).values_list('pk', flat=True))
+    product_ids.update(ProductImage.objects.filter(image=name).values_list('product_id', flat=True))
+    if product_ids:
+        products = Product.objects.filter(pk__in=product_ids)
+        products.update(updated_at=now)
+        products_changed(list(products.only('pk', 'vendor_id')))
+    shops = list(Shop.objects.filter(logo=name))
+    if shops:
+        Shop.objects.filter(pk__in=[shop.pk for shop in shops]).update(updated_at=now)
+        for shop in shops:
+            invalidate_shop(Shop, shop)
+
+def product_images_added(product, images):
+    """What the ProductImage post_save receivers do, for rows inserted with bulk_create."""
+    for image in images:
+        retain_blob(image.image.storage, image.image.name)
+        schedule_derivatives(image.image)
+    product_images_changed(product)
+
+@receiver(post_save, sender=Shop)
+@receiver(pre_delete, sender=Shop)
+def invalidate_shop(sender, instance, **kwargs):
+    # Shop name and logo are embedded in product payloads, including dropshipper
+    # storefronts, which fall back to the vendor shop of the products they import
+    # (looked up before a delete cascades to the imports)
+    scopes = ['catalog', 'shops', f'vendor:{instance.owner_id}', f'dropshipper:{instance.owner_id}']
+    dropshipper_ids = (
+        DropshipImport.objects.filter(product__shop=instance).values_list('dropshipper_id', flat=True).distinct()
+    )
+    scopes.extend(f'dropshipper:{d}' for d in dropshipper_ids)
+    bump_versions_on_commit(*scopes)
+
+@receiver(post_save, sender=DropshipImport)
+@receiver(post_delete, sender=DropshipImport)
+def invalidate_dropship_import(sender, instance, **kwargs):
+    bump_versions_on_commit(f'dropshipper:{instance.dropshipper_id}')
@@ -0,0 +1,222 @@
+"""
+Content-addressed media storage.
+
+Uploads are hashed (SHA-256) while they are streamed to a temporary file and
+then stored as ``<upload_to>/<sha256><ext>``. Identical uploads resolve to the
+same name, so each blob is written once and its URL never changes.
+
+``MediaBlob`` rows count how many model fields reference each blob; the
+signals in ``shop.signals`` call ``retain_blob()`` / ``release_blob()`` as
+references come and go, and a blob (with its thumbnails) is removed from disk
+only when the last reference is gone. Files stored before this backend was
+enabled have no ``MediaBlob`` row and are never deleted by it.
+
+Storing content that already exists skips the write, but the reference is only
+counted when the model is saved. So that the blob cannot be deleted in between,
+``_save()`` locks the blob's row and adds a ``pending`` store, which
+``retain_blob()`` turns into a reference; the deletion after the last release
+locks the same row and keeps the blob while it has references or pending stores.
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import Case, F, When
+
+from .thumbnails import derivative_names, is_derivative
+
+CONTENT_ADDRESSED_RE = re.compile(r'(^|/)[0-9a-f]{64}(\.[A-Za-z0-9]+)?$')
+
+def is_content_addressed(name):
+    return bool(CONTENT_ADDRESSED_RE.search(name or ''))
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that names files by the SHA-256 of their content."""
+
+    def get_available_name(self, name, max_length=None):
+        # The final name is only known once the content is hashed in _save();
+        # derivatives keep their fixed names (see shop.thumbnails)
+        if is_derivative(name):
+            return super().get_available_name(name, max_length)
+        return name
+
+    def _save(self, name, content):
+        if is_derivative(name):
+            return super()._save(name, content)
+        return self.store_staged(*self.stage(name, content))
+
+    def stage(self, name, content):
+        """
+        Hash ``content`` into a temporary file in its final directory. Returns
+        ``(temporary path, final name)`` for ``store_staged()``; needs no database,
+        so worker threads can do this part.
+        """
+        directory = os.path.dirname(name)
+        _, ext = os.path.splitext(name)
+        full_directory = self.path(directory)
+        os.makedirs(full_directory, exist_ok=True)
+
+        digest = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(dir=full_directory, prefix='.upload-', delete=False) as tmp:
+            try:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    digest.update(chunk)
+                    tmp.write(chunk)
+            except BaseException:
+                tmp.close()
+                os.unlink(tmp.name)
+                raise
+
+        final_name = os.path.join(directory, digest.hexdigest() + ext.lower()).replace('\\', '/')
+        return tmp.name, final_name
+
+    def store_staged(self, tmp_path, final_name):
+        """Move a staged file into place unless the content is already stored, and record a pending store of it."""
+        final_path = self.path(final_name)
+        try:
+            with transaction.atomic():
+                # Waits for a deletion of the same blob in progress
+                blob = _lock_blob(final_name)
+                if blob is not None and os.path.exists(final_path):
+                    # Same content is already stored
+                    os.unlink(tmp_path)
+                else:
+                    if self.file_permissions_mode is not None:
+                        os.chmod(tmp_path, self.file_permissions_mode)
+                    os.replace(tmp_path, final_path)
+                _add_pending(blob, final_name, os.path.splitext(os.path.basename(final_name))[0], os.path.getsize(final_path))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return final_name
+
+content_addressed_storage = ContentAddressedStorage()
+
+class NamedMediaStorage(FileSystemStorage):
+    """
+    FileSystemStorage with Django's default naming, which can hand a deleted
+    name to a different upload. Thumbnails and ``ImageMetadata`` are keyed by
+    name, so deleting an original deletes them too.
+    """
+
+    def delete(self, name):
+        from .models import ImageMetadata
+
+        super().delete(name)
+        if not name or is_derivative(name):
+            return
+        derivatives = [derivative for _, _, derivative in derivative_names(name)]
+        for derivative in derivatives:
+            super().delete(derivative)
+        ImageMetadata.objects.filter(name__in=[name] + derivatives).delete()
+
+named_media_storage = NamedMediaStorage()
+
+def select_media_storage():
+    """Storage for uploaded images; ``MEDIA_CONTENT_ADDRESSED=False`` restores Django's default naming."""
+    if getattr(settings, 'MEDIA_CONTENT_ADDRESSED', True):
+        return content_addressed_storage
+    return named_media_storage
+
+def upload_sha256(f):
+    """SHA-256 of an uploaded file, read in chunks; the file is rewound afterwards."""
+    digest = hashlib.sha256()
+    f.seek(0)
+    for chunk in f.chunks():
+        digest.update(chunk)
+    f.seek(0)
+    return digest.hexdigest()
+
+def stored_sha256(names):
+    """
+    ``{name: sha256}`` for stored files, taken from the name when it is
+    content-addressed and from ImageMetadata otherwise; unknown names are left out.
+    """
+    from .models import ImageMetadata
+
+    hashes = {}
+    legacy = []
+    for name in names:
+        if is_content_addressed(name):
+            hashes[name] = os.path.splitext(os.path.basename(name))[0]
+        elif name:
+            legacy.append(name)
+    if legacy:
+        rows = ImageMetadata.objects.filter(name__in=legacy, exists=True).exclude(sha256='')
+        hashes.update(rows.values_list('name', 'sha256'))
+    return hashes
+
+def _lock_blob(name):
+    from .models import MediaBlob
+
+    return MediaBlob.objects.select_for_update().filter(name=name).first()
+
+def _add_pending(blob, name, sha256, size):
+    from .models import MediaBlob
+
+    if blob is None:
+        blob, created = MediaBlob.objects.get_or_create(name=name, defaults={
+            'sha256': sha256, 'size': size, 'pending': 1,
+        })
+        if created:
+            return
+    MediaBlob.objects.filter(pk=blob.pk).update(pending=F('pending') + 1)
+
+def retain_blob(storage, name):
+    """Count a new reference to ``name``, taking the place of a pending store of it."""
+    from .models import MediaBlob
+
+    if not is_content_addressed(name):
+        return
+    with transaction.atomic():
+        blob = _lock_blob(name)
+        if blob is None:
+            blob, created = MediaBlob.objects.get_or_create(name=name, defaults={
+                'sha256': os.path.splitext(os.path.basename(name))[0],
+                'size': storage.size(name) if storage.exists(name) else 0,
+                'ref_count': 1,
+            })
+            if created:
+                return
+        MediaBlob.objects.filter(pk=blob.pk).update(
+            ref_count=F('ref_count') + 1,
+            pending=Case(When(pending__gt=0, then=F('pending') - 1), default=0),
+        )
+
+def release_blob(storage, name):
+    """Drop a reference to ``name``; the file is deleted after commit if it was the last one."""
+    if not is_content_addressed(name):
+        return
+    with transaction.atomic():
+        blob = _lock_blob(name)
+        if blob is None:
+            return
+        blob.ref_count = max(blob.ref_count - 1, 0)
+        blob.save(update_fields=['ref_count'])
+        if blob.ref_count or blob.pending:
+            return
+    transaction.on_commit(lambda: _delete_unreferenced(storage, name))
+
+def _delete_unreferenced(storage, name):
+    from .models import ImageMetadata
+
+    with transaction.atomic():
+        # Holding the row lock keeps a concurrent _save() from reusing the file meanwhile
+        blob = _lock_blob(name)
+        if blob is None or blob.ref_count or blob.pending:
+            # Uploaded again since the release, or already deleted
+            return
+        paths = [name] + [derivative for _, _, derivative in derivative_names(name)]
+        for path in paths:
+            storage.delete(path)
+        ImageMetadata.objects.filter(name__in=paths).delete()
+        blob.delete()
@@ -0,0 +1,1514 @@
+import csv
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
+
+from PIL import Image
+
+from django.apps import apps as django_apps
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.db.models import Count, Sum
+from django.db.models.signals import post_migrate
+from django.http import Http404
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.test import APIClient
+
+from .models import (
+    Shop, Product, ProductImage, DropshipImport, Order, OrderItem, MediaBlob, ImageMetadata, ImageUpload, IdempotencyKey,
+    VendorSalesDaily, VendorOrdersDaily, ShopSalesDaily, OrderEvent,
+)
+from .serializers import ProductSerializer, OrderSerializer
+from .cache import get_versions
+from .serving import serve_media
+from .uploads import spool_path
+from .idempotency import request_fingerprint
+from .events import SHOP_LOCK_ID, VENDOR_LOCK_ID, _lock
+from .search import search_products
+from .signals import install_search_index
+from .storage import ContentAddressedStorage, NamedMediaStorage
+from .thumbnails import derivative_name, generate_derivatives
+
+User = get_user_model()
+
+class CatalogTestCase(TestCase):
+    # The fixture images do not exist; MediaTestCase uploads real ones
+    generates_thumbnails = False
+
+    def setUp(self):
+        if not self.generates_thumbnails:
+            patcher = mock.patch('shop.signals.schedule_derivatives')
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        cache.clear()
+        self.client = APIClient()
+        self.vendor = User.objects.create_user(username='vendor', password='pw', role='vendor')
+        self.shop = Shop.objects.create(owner=self.vendor, name='Vendor Shop', logo='shop_logos/logo.png')
+
+    def make_products(self, count, images_per_product=2, vendor=None, shop=None):
+        products = []
+        # Cache versions are bumped when the (test case's) transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(count):
+                product = Product.objects.create(
+                    vendor=vendor or self.vendor,
+                    shop=shop or self.shop,
+                    title=f'Product {i}',
+                    price=Decimal('10.00'),
+                    image=f'products/main_{i}.png',
+                    stock=5,
+                )
+                for j in range(images_per_product):
+                    ProductImage.objects.create(product=product, image=f'products/extra_{i}_{j}.png', order=j + 1)
+                products.append(product)
+        return products
+
+class ProductListQueryCountTests(CatalogTestCase):
+    """
+    Product-returning endpoints must not issue per-product queries. Counts
+    include the ETag validator query and one image metadata query.
+    """
+
+    def assert_constant_queries(self, url, expected, user=None):
+        if user:
+            self.client.force_authenticate(user)
+        self.make_products(3)
+        with self.assertNumQueries(expected):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.make_products(12)
+        with self.assertNumQueries(expected):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_product_list(self):
+        self.assert_constant_queries('/api/shop/products/', 4)
+
+    def test_product_list_by_vendor(self):
+        self.assert_constant_queries(f'/api/shop/products/?vendor={self.vendor.id}', 4)
+
+    def test_my_products_vendor(self):
+        self.assert_constant_queries('/api/shop/products/my_products/', 4, user=self.vendor)
+
+    def test_shop_list(self):
+        self.assert_constant_queries('/api/shop/shops/', 6)
+
+    def test_images_keep_their_order(self):
+        product = self.make_products(1, images_per_product=0)[0]
+        ProductImage.objects.create(product=product, image='products/b.png', order=2)
+        ProductImage.objects.create(product=product, image='products/a.png', order=1)
+        response = self.client.get('/api/shop/products/')
+        self.assertEqual([img['order'] for img in response.json()[0]['images']], [1, 2])
+
+class DropshipperStorefrontTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.dropshipper = User.objects.create_user(username='dropper', password='pw', role='dropshipper')
+        self.dropship_shop = Shop.objects.create(
+            owner=self.dropshipper, name='Drop Shop', shop_type='dropshipper', logo='shop_logos/drop.png',
+        )
+
+    def import_products(self, count):
+        products = self.make_products(count)
+        with self.captureOnCommitCallbacks(execute=True):
+            for product in products:
+                DropshipImport.objects.create(dropshipper=self.dropshipper, shop=self.dropship_shop, product=product)
+
+    def test_storefront_resolves_shop_once(self):
+        url = f'/api/shop/products/?dropshipper={self.dropshipper.id}'
+        self.import_products(2)
+        with self.assertNumQueries(6):
+            self.client.get(url)
+        self.import_products(10)
+        with self.assertNumQueries(6):
+            response = self.client.get(url)
+        self.assertEqual({p['shop_name'] for p in response.json()}, {'Drop Shop'})
+
+    def test_my_products_dropshipper(self):
+        self.client.force_authenticate(self.dropshipper)
+        self.import_products(2)
+        with self.assertNumQueries(5):
+            self.client.get('/api/shop/products/my_products/')
+        self.import_products(10)
+        with self.assertNumQueries(5):
+            response = self.client.get('/api/shop/products/my_products/')
+        self.assertEqual(len(response.json()), 12)
+        self.assertEqual({p['shop_name'] for p in response.json()}, {'Drop Shop'})
+
+    def test_storefront_without_shop_follows_vendor_shop_changes(self):
+        dropshipper = User.objects.create_user(username='noshop', password='pw', role='dropshipper')
+        with self.captureOnCommitCallbacks(execute=True):
+            for product in self.make_products(2):
+                DropshipImport.objects.create(dropshipper=dropshipper, shop=self.dropship_shop, product=product)
+        url = f'/api/shop/products/?dropshipper={dropshipper.id}'
+        self.assertEqual({p['shop_name'] for p in self.client.get(url).json()}, {'Vendor Shop'})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shop.name = 'Renamed Shop'
+            self.shop.save()
+        self.assertEqual({p['shop_name'] for p in self.client.get(url).json()}, {'Renamed Shop'})
+
+class CursorPaginationTests(CatalogTestCase):
+    def test_unpaginated_without_params(self):
+        self.make_products(3, images_per_product=0)
+        response = self.client.get('/api/shop/products/')
+        self.assertIsInstance(response.json(), list)
+        self.assertEqual(len(response.json()), 3)
+
+    def test_walks_pages_by_id(self):
+        products = self.make_products(5, images_per_product=0)
+        expected = [p.id for p in reversed(products)]
+        seen = []
+        url = '/api/shop/products/?limit=2'
+        while url:
+            page = self.client.get(url).json()
+            self.assertLessEqual(len(page['results']), 2)
+            seen.extend(p['id'] for p in page['results'])
+            url = page['next']
+        self.assertEqual(seen, expected)
+
+    def test_filters_apply_to_pages(self):
+        other = User.objects.create_user(username='other', password='pw', role='vendor')
+        self.make_products(2, images_per_product=0, vendor=other, shop=self.shop)
+        mine = self.make_products(3, images_per_product=0)
+        page = self.client.get(f'/api/shop/products/?vendor={self.vendor.id}&limit=10').json()
+        self.assertEqual([p['id'] for p in page['results']], [p.id for p in reversed(mine)])
+        self.assertIsNone(page['next'])
+
+class ProductSearchTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.mug = Product.objects.create(
+            vendor=self.vendor, shop=self.shop, title='Ceramic coffee mug',
+            description='Dishwasher safe', price=Decimal('12.00'), category='kitchen', stock=4,
+        )
+        self.kettle = Product.objects.create(
+            vendor=self.vendor, shop=self.shop, title='Electric kettle',
+            description='Boils water for coffee and tea', price=Decimal('40.00'), category='kitchen', stock=0,
+        )
+        self.shirt = Product.objects.create(
+            vendor=self.vendor, shop=self.shop, title='Linen shirt',
+            description='', price=Decimal('30.00'), category='clothing', stock=2, is_active=False,
+        )
+
+    def ids(self, query):
+        response = self.client.get('/api/shop/products/' + query)
+        self.assertEqual(response.status_code, 200)
+        return {p['id'] for p in response.json()}
+
+    def test_search_title_and_description(self):
+        self.assertEqual(self.ids('?q=coffee'), {self.mug.id, self.kettle.id})
+        self.assertEqual(self.ids('?q=coffee mug'), {self.mug.id})
+
+    def test_index_follows_save_and_delete(self):
+        self.shirt.title = 'Linen coffee apron'
+        self.shirt.save()
+        self.assertIn(self.shirt.id, self.ids('?q=apron'))
+        self.assertEqual(self.ids('?q=shirt'), set())
+        self.mug.delete()
+        self.assertEqual(self.ids('?q=coffee'), {self.kettle.id, self.shirt.id})
+
+    def test_query_syntax_is_escaped(self):
+        self.assertEqual(self.ids('?q="mug OR NEAR('), set())
+
+    def test_facets(self):
+        self.assertEqual(self.ids('?category=kitchen'), {self.mug.id, self.kettle.id})
+        self.assertEqual(self.ids('?min_price=20&max_price=35'), {self.shirt.id})
+        self.assertEqual(self.ids('?in_stock=true'), {self.mug.id, self.shirt.id})
+        self.assertEqual(self.ids('?is_active=false'), {self.shirt.id})
+        self.assertEqual(self.ids('?q=coffee&in_stock=true'), {self.mug.id})
+
+    def test_invalid_filter_value(self):
+        response = self.client.get('/api/shop/products/?min_price=cheap')
+        self.assertEqual(response.status_code, 400)
+
+class AnonymousCatalogCacheTests(CatalogTestCase):
+    def assert_served_from_cache(self, url):
+        first = self.client.get(url).json()
+        with self.assertNumQueries(0):
+            second = self.client.get(url).json()
+        self.assertEqual(first, second)
+        return first
+
+    def test_product_list_cached_until_product_changes(self):
+        product = self.make_products(1)[0]
+        url = f'/api/shop/products/?vendor={self.vendor.id}'
+        self.assert_served_from_cache(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            product.title = 'Renamed'
+            product.save()
+        self.assertEqual(self.client.get(url).json()[0]['title'], 'Renamed')
+        self.assertEqual(self.client.get('/api/shop/products/').json()[0]['title'], 'Renamed')
+
+    def test_image_and_shop_changes_invalidate(self):
+        product = self.make_products(1, images_per_product=0)[0]
+        self.assert_served_from_cache('/api/shop/products/')
+        self.assert_served_from_cache('/api/shop/shops/')
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductImage.objects.create(product=product, image='products/new.png')
+        self.assertEqual(len(self.client.get('/api/shop/products/').json()[0]['images']), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shop.name = 'New name'
+            self.shop.save()
+        self.assertEqual(self.client.get('/api/shop/shops/').json()[0]['name'], 'New name')
+
+    def test_dropship_import_invalidates_storefront(self):
+        dropshipper = User.objects.create_user(username='d', password='pw', role='dropshipper')
+        dropship_shop = Shop.objects.create(owner=dropshipper, name='D', shop_type='dropshipper')
+        product = self.make_products(1)[0]
+        url = f'/api/shop/products/?dropshipper={dropshipper.id}'
+        self.assertEqual(self.assert_served_from_cache(url), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            DropshipImport.objects.create(dropshipper=dropshipper, shop=dropship_shop, product=product)
+        self.assertEqual(len(self.client.get(url).json()), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            product.price = Decimal('99.00')
+            product.save()
+        self.assertEqual(self.client.get(url).json()[0]['price'], '99.00')
+
+    def test_versions_bumped_after_commit(self):
+        product = self.make_products(1)[0]
+        before = get_versions(['catalog', f'vendor:{self.vendor.id}'])
+        with self.captureOnCommitCallbacks() as callbacks:
+            product.title = 'Renamed'
+            product.save()
+        # A read before the commit must not cache the old rows under a new version
+        self.assertEqual(get_versions(['catalog', f'vendor:{self.vendor.id}']), before)
+        for callback in callbacks:
+            callback()
+        after = get_versions(['catalog', f'vendor:{self.vendor.id}'])
+        self.assertTrue(all(new != old for new, old in zip(after, before)))
+
+    def test_authenticated_requests_bypass_cache(self):
+        self.make_products(1)
+        self.client.get('/api/shop/products/')
+        self.client.force_authenticate(self.vendor)
+        with self.assertNumQueries(4):
+            self.client.get('/api/shop/products/')
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    'LOCATION': os.path.join(tempfile.gettempdir(), 'ecom-test-cache'),
+}})
+class FileBasedCatalogCacheTests(AnonymousCatalogCacheTests):
+    pass
+
+class ConditionalGetTests(CatalogTestCase):
+    def assert_revalidates(self, url, change, queries=0):
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        etag = first['ETag']
+        self.assertFalse(first.has_header('Last-Modified'))
+        self.client.credentials(HTTP_IF_NONE_MATCH=etag)
+        with self.assertNumQueries(queries):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_product_list(self):
+        product = self.make_products(2)[0]
+        self.assert_revalidates('/api/shop/products/', lambda: product.delete())
+
+    def test_if_modified_since_is_ignored(self):
+        product = self.make_products(2)[0]
+        self.client.get('/api/shop/products/')
+        with self.captureOnCommitCallbacks(execute=True):
+            product.delete()
+        # The newest updated_at is unchanged, so a date could not show the deletion
+        self.client.credentials(HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60))
+        response = self.client.get('/api/shop/products/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 1)
+
+    def test_shop_list_follows_product_changes(self):
+        product = self.make_products(1)[0]
+        def change():
+            product.title = 'Changed'
+            product.save()
+        self.assert_revalidates('/api/shop/shops/', change)
+
+    def test_my_products_follows_image_changes(self):
+        self.client.force_authenticate(self.vendor)
+        product = self.make_products(1)[0]
+        # Authenticated responses are not cached, only the validator query runs
+        self.assert_revalidates(
+            '/api/shop/products/my_products/',
+            lambda: product.product_images.first().delete(),
+            queries=1,
+        )
+
+    def test_my_shop_follows_shop_changes(self):
+        self.client.force_authenticate(self.vendor)
+        def change():
+            self.shop.name = 'Renamed'
+            self.shop.save()
+        first = self.client.get('/api/shop/shops/my_shop/')
+        self.client.credentials(HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(self.client.get('/api/shop/shops/my_shop/').status_code, 304)
+        change()
+        self.assertEqual(self.client.get('/api/shop/shops/my_shop/').status_code, 200)
+
+class ShopSummaryTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        other_vendor = User.objects.create_user(username='other', password='pw', role='vendor')
+        self.other_shop = Shop.objects.create(owner=other_vendor, name='Other')
+        self.products = self.make_products(4, images_per_product=1)
+        self.make_products(1, vendor=other_vendor, shop=self.other_shop)
+
+    def test_summary_counts_without_products(self):
+        shops = self.client.get('/api/shop/shops/?summary=true').json()
+        self.assertEqual({s['name']: s['product_count'] for s in shops}, {'Vendor Shop': 4, 'Other': 1})
+        self.assertNotIn('products', shops[0])
+        self.assertNotIn('products_preview', shops[0])
+
+    def test_preview_is_capped(self):
+        with self.assertNumQueries(6):
+            shops = self.client.get('/api/shop/shops/?summary=true&preview=2').json()
+        by_name = {s['name']: s for s in shops}
+        self.assertEqual(
+            [p['id'] for p in by_name['Vendor Shop']['products_preview']],
+            [self.products[3].id, self.products[2].id],
+        )
+        self.assertTrue(by_name['Vendor Shop']['has_more'])
+        self.assertEqual(len(by_name['Other']['products_preview']), 1)
+        self.assertFalse(by_name['Other']['has_more'])
+
+    def test_shop_products_are_paginated(self):
+        page = self.client.get(f'/api/shop/shops/{self.shop.id}/products/?limit=3').json()
+        self.assertEqual([p['id'] for p in page['results']], [p.id for p in reversed(self.products)][:3])
+        rest = self.client.get(page['next']).json()
+        self.assertEqual([p['id'] for p in rest['results']], [self.products[0].id])
+        self.assertIsNone(rest['next'])
+        default = self.client.get(f'/api/shop/shops/{self.shop.id}/products/').json()
+        self.assertIn('results', default)
+
+class SparseFieldsetTests(CatalogTestCase):
+    def test_fields_limits_payload_and_queries(self):
+        self.make_products(3)
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/shop/products/?fields=id,title,price,image_url')
+        self.assertEqual(set(response.json()[0]), {'id', 'title', 'price', 'image_url'})
+
+    def test_omit_skips_method_fields(self):
+        self.make_products(2)
+        with mock.patch.object(ProductSerializer, 'get_all_images') as get_all_images:
+            response = self.client.get('/api/shop/products/?omit=all_images,images')
+        get_all_images.assert_not_called()
+        self.assertNotIn('images', response.json()[0])
+        self.assertIn('vendor_name', response.json()[0])
+
+    def test_nested_products_keep_their_fields(self):
+        self.make_products(1)
+        shop = self.client.get('/api/shop/shops/?fields=id,products').json()[0]
+        self.assertEqual(set(shop), {'id', 'products'})
+        self.assertIn('all_images', shop['products'][0])
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get('/api/shop/products/?fields=id,secret')
+        self.assertEqual(response.status_code, 400)
+
+class ListProjectionTests(CatalogTestCase):
+    """The .values() fast path must render exactly what the serializers do."""
+
+    def setUp(self):
+        super().setUp()
+        # Some files "exist" so URLs and the all_images filtering are exercised
+        patcher = mock.patch(
+            'django.core.files.storage.FileSystemStorage.exists',
+            side_effect=lambda name: not name.endswith('_1.png'),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def assert_same_output(self, url, user=None):
+        if user:
+            self.client.force_authenticate(user)
+        with override_settings(LIST_PROJECTIONS_ENABLED=False):
+            expected = self.client.get(url)
+        cache.clear()
+        with override_settings(LIST_PROJECTIONS_ENABLED=True):
+            actual = self.client.get(url)
+        self.assertEqual(actual.status_code, expected.status_code)
+        self.assertEqual(actual.json(), expected.json())
+        return actual.json()
+
+    def test_product_lists(self):
+        self.vendor.company_name = 'Vendor Co'
+        self.vendor.save()
+        self.make_products(3)
+        product = Product.objects.create(vendor=self.vendor, title='Bare', price=Decimal('1.50'))
+        ProductImage.objects.create(product=product, image='products/unordered.png', order=0)
+        data = self.assert_same_output('/api/shop/products/')
+        self.assertEqual(len(data), 4)
+        self.assertTrue(any(p['image_url'] for p in data))
+        self.assert_same_output('/api/shop/products/?limit=2&in_stock=true')
+        self.assert_same_output('/api/shop/products/?fields=id,shop_name,shop_logo_url,all_images')
+        self.assert_same_output(f'/api/shop/shops/{self.shop.id}/products/?limit=2')
+        self.assert_same_output('/api/shop/products/my_products/?omit=images', user=self.vendor)
+
+    def test_dropshipper_storefront(self):
+        dropshipper = User.objects.create_user(username='dropper', password='pw', role='dropshipper')
+        dropship_shop = Shop.objects.create(
+            owner=dropshipper, name='Drop Shop', shop_type='dropshipper', logo='shop_logos/drop.png',
+        )
+        for product in self.make_products(2):
+            DropshipImport.objects.create(dropshipper=dropshipper, shop=dropship_shop, product=product)
+        data = self.assert_same_output(f'/api/shop/products/?dropshipper={dropshipper.id}')
+        self.assertEqual({p['shop_name'] for p in data}, {'Drop Shop'})
+        self.assert_same_output('/api/shop/products/my_products/', user=dropshipper)
+
+    def test_orders(self):
+        other_vendor = User.objects.create_user(username='other', password='pw', role='vendor')
+        mine = self.make_products(2, images_per_product=0)
+        theirs = self.make_products(1, images_per_product=0, vendor=other_vendor)
+        for i in range(3):
+            order = Order.objects.create(
+                guest_name=f'Guest {i}', guest_email='g@example.com', guest_phone='1', guest_address='Street',
+                shipping_phone='1', shipping_address='Street', total_amount=Decimal('30.00'),
+            )
+            for product in mine + theirs:
+                OrderItem.objects.create(order=order, product=product, quantity=i + 1)
+        data = self.assert_same_output('/api/shop/orders/list/', user=self.vendor)
+        self.assertEqual(len(data), 3)
+        self.assert_same_output('/api/shop/orders/list/?fields=id,status,items', user=self.vendor)
+
+class VendorOrdersTestCase(CatalogTestCase):
+    """Four orders with lines of this vendor and another's, and one with the other vendor's only."""
+
+    def setUp(self):
+        super().setUp()
+        self.other_vendor = User.objects.create_user(username='other', password='pw', role='vendor')
+        mine = self.make_products(2, images_per_product=0)
+        theirs = self.make_products(1, images_per_product=0, vendor=self.other_vendor)
+        self.orders = []
+        for i in range(5):
+            order = Order.objects.create(
+                guest_name=f'Guest {i}', guest_email='g@example.com', guest_phone='1', guest_address='Street',
+                shipping_phone='1', shipping_address='Street', total_amount=Decimal('30.00'),
+            )
+            # The last order has none of this vendor's products
+            for product in (mine + theirs if i < 4 else theirs):
+                OrderItem.objects.create(order=order, product=product, quantity=1)
+            self.orders.append(order)
+        self.client.force_authenticate(self.vendor)
+
+class VendorOrderListTests(VendorOrdersTestCase):
+    def test_only_own_orders_and_lines(self):
+        for enabled in (True, False):
+            with self.subTest(projections=enabled), override_settings(LIST_PROJECTIONS_ENABLED=enabled):
+                data = self.client.get('/api/shop/orders/list/').json()
+                self.assertEqual([o['id'] for o in data], [o.id for o in reversed(self.orders[:4])])
+                self.assertEqual({i['product_title'] for o in data for i in o['items']}, {'Product 0', 'Product 1'})
+
+    def test_keyset_pages_without_distinct(self):
+        with CaptureQueriesContext(connection) as queries:
+            first = self.client.get('/api/shop/orders/list/?limit=3').json()
+        self.assertEqual(len(queries), 2)  # one page, one items query
+        self.assertNotIn('DISTINCT', queries[0]['sql'])
+        self.assertIn('EXISTS', queries[0]['sql'])
+        self.assertEqual([o['id'] for o in first['results']], [o.id for o in reversed(self.orders[1:4])])
+        second = self.client.get(first['next']).json()
+        self.assertEqual([o['id'] for o in second['results']], [self.orders[0].id])
+        self.assertIsNone(second['next'])
+
+class OrderStatusTests(VendorOrdersTestCase):
+    def bulk(self, ids, status):
+        return self.client.patch('/api/shop/orders/status/', {'ids': ids, 'status': status}, format='json')
+
+    def test_bulk_update_reports_each_id(self):
+        Order.objects.filter(pk=self.orders[1].pk).update(status='cancelled')
+        Order.objects.filter(pk=self.orders[2].pk).update(status='shipped')
+        ids = [o.id for o in self.orders] + [999999]
+        with self.assertNumQueries(6):  # savepoint, ownership query, one UPDATE, event recipients and insert, release
+            response = self.bulk(ids, 'shipped')
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['updated'], 2)
+        self.assertEqual([r['result'] for r in body['results']], [
+            'updated', 'invalid_transition', 'unchanged', 'updated', 'not_found', 'not_found',
+        ])
+        self.assertEqual(
+            list(Order.objects.order_by('pk').values_list('status', flat=True)),
+            ['shipped', 'cancelled', 'shipped', 'shipped', 'pending'],
+        )
+
+    def test_bulk_rejects_unknown_status(self):
+        self.assertEqual(self.bulk([self.orders[0].id], 'lost').status_code, 400)
+        self.client.force_authenticate(User.objects.create_user(username='d', password='pw', role='dropshipper'))
+        self.assertEqual(self.bulk([self.orders[0].id], 'shipped').status_code, 403)
+
+    def test_single_update_checks_transition(self):
+        url = f'/api/shop/orders/{self.orders[0].id}/'
+        self.assertEqual(self.client.patch(url, {'status': 'completed'}, format='json').status_code, 200)
+        self.assertEqual(self.client.patch(url, {'status': 'pending'}, format='json').status_code, 200)
+        self.assertEqual(self.client.patch(url, {'status': 'cancelled'}, format='json').status_code, 200)
+        self.assertEqual(self.client.patch(url, {'status': 'pending'}, format='json').status_code, 400)
+        other = f'/api/shop/orders/{self.orders[4].id}/'
+        self.assertEqual(self.client.patch(other, {'status': 'completed'}, format='json').status_code, 404)
+
+    def test_single_update_conflicts_with_concurrent_change(self):
+        # Another request shipped the order after this one read it as pending
+        stale = Order.objects.get(pk=self.orders[0].pk)
+        Order.objects.filter(pk=stale.pk).update(status='shipped')
+        orders = mock.Mock()
+        orders.select_for_update.return_value.filter.return_value.first.return_value = stale
+        with mock.patch('shop.views.vendor_orders', return_value=orders):
+            response = self.client.patch(f'/api/shop/orders/{stale.id}/', {'status': 'cancelled'}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Order.objects.get(pk=stale.pk).status, 'shipped')
+        self.assertFalse(OrderEvent.objects.filter(order=stale, type='status').exists())
+
+class OrderExportTests(VendorOrdersTestCase):
+    def export(self, query=''):
+        response = self.client.get(f'/api/shop/orders/export/{query}')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_csv_of_own_lines(self):
+        Order.objects.filter(pk=self.orders[0].pk).update(guest_name='=HYPERLINK("x")')
+        with override_settings(ORDER_EXPORT_CHUNK_SIZE=3):
+            response, body = self.export()
+            chunks = len(list(self.client.get('/api/shop/orders/export/').streaming_content))
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('attachment; filename="orders-', response['Content-Disposition'])
+        rows = list(csv.DictReader(StringIO(body)))
+        self.assertEqual(len(rows), 8)
+        self.assertEqual([int(row['order_id']) for row in rows], [o.id for o in self.orders[:4] for _ in range(2)])
+        self.assertEqual({row['product_title'] for row in rows}, {'Product 0', 'Product 1'})
+        self.assertEqual(rows[0]['line_total'], '10.00')
+        self.assertEqual(rows[0]['guest_name'], '\'=HYPERLINK("x")')
+        self.assertEqual(chunks, 3)  # rows are flushed every 3 lines
+
+    def test_jsonl_with_filters(self):
+        Order.objects.filter(pk__in=[self.orders[0].pk, self.orders[1].pk]).update(status='shipped')
+        Order.objects.filter(pk=self.orders[1].pk).update(created_at=timezone.now() - timedelta(days=10))
+        response, body = self.export(f'?output=jsonl&status=shipped&status=completed&start={timezone.localdate()}')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual({row['order_id'] for row in rows}, {self.orders[0].id})
+        self.assertEqual(rows[0]['price'], '10.00')
+        _, body = self.export(f'?output=jsonl&end={timezone.localdate() - timedelta(days=1)}')
+        self.assertEqual({json.loads(line)['order_id'] for line in body.splitlines()}, {self.orders[1].id})
+
+    def test_dropshipper_and_errors(self):
+        dropshipper = User.objects.create_user(username='d', password='pw', role='dropshipper')
+        shop = Shop.objects.create(owner=dropshipper, name='Drop Shop')
+        Order.objects.filter(pk=self.orders[4].pk).update(dropshipper_shop=shop)
+        self.client.force_authenticate(dropshipper)
+        _, body = self.export()
+        self.assertEqual([row['order_id'] for row in csv.DictReader(StringIO(body))], [str(self.orders[4].id)])
+        self.assertEqual(self.client.get('/api/shop/orders/export/?output=xml').status_code, 400)
+        self.assertEqual(self.client.get('/api/shop/orders/export/?start=2024-02-02&end=2024-02-01').status_code, 400)
+        self.client.force_authenticate(User.objects.create_user(username='c', password='pw'))
+        self.assertEqual(self.client.get('/api/shop/orders/export/').status_code, 403)
+
+class OrderEventFeedTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other_vendor = User.objects.create_user(username='other', password='pw', role='vendor')
+        self.mine, = self.make_products(1, images_per_product=0)
+        self.theirs, = self.make_products(1, images_per_product=0, vendor=self.other_vendor)
+        self.dropshipper = User.objects.create_user(username='dropper', password='pw', role='dropshipper')
+        self.drop_shop = Shop.objects.create(owner=self.dropshipper, name='Drop Shop')
+        DropshipImport.objects.create(dropshipper=self.dropshipper, shop=self.drop_shop, product=self.mine)
+
+    def order(self, quantity=1):
+        return self.client.post('/api/shop/orders/', {
+            'customer_name': 'Ann',
+            'items': [{'product': self.mine.id, 'quantity': quantity}, {'product': self.theirs.id, 'quantity': 1}],
+        }, format='json')
+
+    def feed(self, user, after=0, **params):
+        self.client.force_authenticate(user)
+        response = self.client.get('/api/shop/orders/events/', {'after': after, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def changes(self, feed):
+        return [(e['order'], e['type'], e['previous_status'], e['status']) for e in feed['results']]
+
+    def test_each_recipient_gets_changes(self):
+        order_id = self.order().json()['id']
+        self.assertEqual(self.order(quantity=6).status_code, 400)  # rolled back, no event
+        for user in (self.vendor, self.other_vendor, self.dropshipper):
+            self.assertEqual(self.changes(self.feed(user)), [(order_id, 'created', '', 'pending')])
+        cursor = self.feed(self.vendor)['next']
+
+        self.client.patch('/api/shop/orders/status/', {'ids': [order_id], 'status': 'processing'}, format='json')
+        self.client.patch(f'/api/shop/orders/{order_id}/', {'status': 'processing'}, format='json')  # unchanged
+        self.client.force_authenticate(self.other_vendor)
+        self.client.patch(f'/api/shop/orders/{order_id}/', {'status': 'shipped'}, format='json')
+        expected = [(order_id, 'status', 'pending', 'processing'), (order_id, 'status', 'processing', 'shipped')]
+        self.assertEqual(self.changes(self.feed(self.vendor, cursor)), expected)
+        self.assertEqual(self.changes(self.feed(self.dropshipper))[1:], expected)
+
+    def test_empty_poll_is_one_query(self):
+        for _ in range(3):
+            self.order()
+        first = self.feed(self.vendor, limit=2)
+        self.assertTrue(first['has_more'])
+        second = self.feed(self.vendor, first['next'], limit=2)
+        self.assertEqual((len(second['results']), second['has_more']), (1, False))
+        with self.assertNumQueries(1):
+            empty = self.feed(self.vendor, second['next'])
+        self.assertEqual((empty['results'], empty['next']), ([], second['next']))
+
+        self.client.force_authenticate(User.objects.create_user(username='c', password='pw'))
+        self.assertEqual(self.client.get('/api/shop/orders/events/').status_code, 403)
+        self.client.force_authenticate(self.vendor)
+        self.assertEqual(self.client.get('/api/shop/orders/events/?after=-1').status_code, 400)
+
+    def test_postgres_locks_each_recipient_feed(self):
+        events = [
+            OrderEvent(vendor_id=self.other_vendor.id), OrderEvent(shop_id=self.drop_shop.id),
+            OrderEvent(vendor_id=self.vendor.id),
+        ]
+        with mock.patch.object(connection, 'vendor', 'postgresql'), \
+                mock.patch.object(connection, 'cursor') as cursor:
+            _lock(events)
+        calls = cursor.return_value.__enter__.return_value.execute.call_args_list
+        self.assertEqual([params for _, params in (c.args for c in calls)], [
+            (VENDOR_LOCK_ID, self.vendor.id), (VENDOR_LOCK_ID, self.other_vendor.id),
+            (SHOP_LOCK_ID, self.drop_shop.id),
+        ])
+
+def png_upload(name='photo.png', size=(1200, 600), mode='RGB'):
+    buf = BytesIO()
+    Image.new(mode, size, (200, 30, 30, 128) if mode == 'RGBA' else (200, 30, 30)).save(buf, 'PNG')
+    return SimpleUploadedFile(name, buf.getvalue(), content_type='image/png')
+
+class OrderCreationTests(CatalogTestCase):
+    def order(self, products, **extra):
+        return self.client.post('/api/shop/orders/', {
+            'customer_name': 'Ann', 'customer_email': 'ann@example.com',
+            'items': [{'product': product.id, 'quantity': 2} for product in products],
+            **extra,
+        }, format='json')
+
+    def test_constant_queries(self):
+        products = self.make_products(50, images_per_product=0)
+        with self.assertNumQueries(12) as small:
+            self.assertEqual(self.order(products[:2]).status_code, 201)
+        with self.assertNumQueries(len(small.captured_queries)):
+            response = self.order(products)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['total_amount'], '1000.00')
+        order = Order.objects.get(pk=response.json()['id'])
+        self.assertEqual(order.items.count(), 50)
+        self.assertEqual(set(order.items.values_list('vendor', flat=True)), {self.vendor.id})
+
+    def test_unknown_product_creates_nothing(self):
+        product, = self.make_products(1, images_per_product=0)
+        response = self.order([product, Product(id=999999)])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['items'][1]['product'], ['Invalid pk "999999" - object does not exist.'])
+        self.assertFalse(Order.objects.exists())
+
+    def test_attributed_to_importing_dropshipper(self):
+        product, = self.make_products(1, images_per_product=0)
+        dropshipper = User.objects.create_user(username='dropper', password='pw', role='dropshipper')
+        shop = Shop.objects.create(owner=dropshipper, name='Drop Shop')
+        DropshipImport.objects.create(dropshipper=dropshipper, shop=shop, product=product)
+        response = self.order([product])
+        self.assertEqual(response.json()['dropshipper_shop'], shop.id)
+        self.assertEqual(response.json()['dropshipper_shop_name'], 'Drop Shop')
+
+class StockReservationTests(CatalogTestCase):
+    def order(self, lines):
+        return self.client.post('/api/shop/orders/', {
+            'customer_name': 'Ann',
+            'items': [{'product': product.id, 'quantity': quantity} for product, quantity in lines],
+        }, format='json')
+
+    def test_stock_is_taken(self):
+        first, second = self.make_products(2, images_per_product=0)
+        self.assertEqual(self.order([(first, 2), (second, 5), (first, 1)]).status_code, 201)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.stock, second.stock), (2, 0))
+
+    def test_unfulfillable_line_fails_whole_order(self):
+        first, second = self.make_products(2, images_per_product=0)
+        response = self.order([(first, 1), (second, 6)])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['items'], [{}, {'quantity': ['Only 5 left in stock.']}])
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(list(Product.objects.order_by('pk').values_list('stock', flat=True)), [5, 5])
+
+class SalesRollupTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.first, self.second = self.make_products(2, images_per_product=0)
+        self.dropshipper = User.objects.create_user(username='dropper', password='pw', role='dropshipper')
+        self.drop_shop = Shop.objects.create(owner=self.dropshipper, name='Drop Shop')
+        DropshipImport.objects.create(dropshipper=self.dropshipper, shop=self.drop_shop, product=self.first)
+
+    def order(self, lines):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/shop/orders/', {
+                'customer_name': 'Ann',
+                'items': [{'product': product.id, 'quantity': quantity} for product, quantity in lines],
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()['id']
+
+    def vendor_rows(self):
+        return {
+            product: (units, revenue, orders)
+            for product, units, revenue, orders in VendorSalesDaily.objects.filter(vendor=self.vendor).values_list(
+                'product', 'units', 'revenue', 'orders',
+            )
+        }
+
+    def shop_rows(self):
+        return list(ShopSalesDaily.objects.values_list('shop', 'units', 'revenue', 'orders'))
+
+    def vendor_orders(self):
+        return list(VendorOrdersDaily.objects.filter(vendor=self.vendor).values_list('orders', flat=True))
+
+    def test_orders_and_cancellations_adjust_rollups(self):
+        first_order = self.order([(self.first, 2), (self.second, 1)])
+        second_order = self.order([(self.first, 1)])
+        self.assertEqual(self.vendor_rows(), {
+            self.first.id: (3, Decimal('30.00'), 2),
+            self.second.id: (1, Decimal('10.00'), 1),
+        })
+        self.assertEqual(self.shop_rows(), [(self.drop_shop.id, 4, Decimal('40.00'), 2)])
+        self.assertEqual(self.vendor_orders(), [2])
+        self.assertEqual(VendorSalesDaily.objects.get(product=self.first).day, timezone.localdate())
+
+        self.client.force_authenticate(self.vendor)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch('/api/shop/orders/status/', {'ids': [first_order], 'status': 'cancelled'}, format='json')
+        self.assertEqual(self.vendor_rows(), {
+            self.first.id: (1, Decimal('10.00'), 1),
+            self.second.id: (0, Decimal('0.00'), 0),
+        })
+        self.assertEqual(self.shop_rows(), [(self.drop_shop.id, 1, Decimal('10.00'), 1)])
+        self.assertEqual(self.vendor_orders(), [1])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/shop/orders/{second_order}/', {'status': 'cancelled'}, format='json')
+        self.assertEqual(self.vendor_rows()[self.first.id], (0, Decimal('0.00'), 0))
+        self.assertEqual(self.shop_rows(), [(self.drop_shop.id, 0, Decimal('0.00'), 0)])
+
+    def test_rebuild_matches_incremental_rollups(self):
+        self.order([(self.first, 2), (self.second, 1)])
+        self.order([(self.second, 3)])
+        cancelled = self.order([(self.first, 1)])
+        self.client.force_authenticate(self.vendor)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch('/api/shop/orders/status/', {'ids': [cancelled], 'status': 'cancelled'}, format='json')
+        vendor_rows, shop_rows = self.vendor_rows(), self.shop_rows()
+        self.assertEqual(self.vendor_orders(), [2])
+        VendorSalesDaily.objects.update(units=0)
+        VendorOrdersDaily.objects.update(orders=0)
+        call_command('rebuild_sales_rollups', chunk_size=1, stdout=StringIO())
+        self.assertEqual(self.vendor_rows(), {key: row for key, row in vendor_rows.items() if row[0]})
+        self.assertEqual(self.vendor_orders(), [2])
+        self.assertEqual(self.shop_rows(), [row for row in shop_rows if row[1]])
+
+    def test_analytics_endpoint(self):
+        self.order([(self.first, 2), (self.second, 1)])
+        self.order([(self.second, 2)])
+        today = timezone.localdate()
+        VendorSalesDaily.objects.create(
+            vendor=self.vendor, product=self.first, day=today - timedelta(days=40), units=7, revenue=70, orders=7,
+        )
+
+        self.client.force_authenticate(self.vendor)
+        data = self.client.get('/api/shop/analytics/sales/').json()
+        # Two orders, one of them with both products
+        self.assertEqual(data['totals'], {'units': 5, 'revenue': '50.00', 'orders': 2})
+        self.assertEqual(data['days'], [{'day': str(today), 'units': 5, 'revenue': '50.00', 'orders': 2}])
+        self.assertEqual([p['orders'] for p in data['products']], [1, 2])
+        self.assertEqual([(p['product_title'], p['units']) for p in data['products']], [('Product 0', 2), ('Product 1', 3)])
+        start = today - timedelta(days=60)
+        data = self.client.get(f'/api/shop/analytics/sales/?start={start}&end={today}').json()
+        self.assertEqual(data['totals']['units'], 12)
+        self.assertEqual(self.client.get(f'/api/shop/analytics/sales/?start={today}&end={start}').status_code, 400)
+
+        self.client.force_authenticate(self.dropshipper)
+        data = self.client.get('/api/shop/analytics/sales/').json()
+        self.assertEqual(data['totals'], {'units': 3, 'revenue': '30.00', 'orders': 1})
+        self.assertNotIn('products', data)
+        self.client.force_authenticate(User.objects.create_user(username='c', password='pw'))
+        self.assertEqual(self.client.get('/api/shop/analytics/sales/').status_code, 403)
+
+class IdempotentOrderTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product, = self.make_products(1, images_per_product=0)
+        self.body = {'customer_name': 'Ann', 'items': [{'product': self.product.id, 'quantity': 1}]}
+
+    def order(self, key, body=None):
+        return self.client.post('/api/shop/orders/', body or self.body, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_first_response(self):
+        first = self.order('abc')
+        self.assertEqual(first.status_code, 201)
+        with mock.patch.object(OrderSerializer, 'create') as create:
+            retry = self.order('abc')
+        create.assert_not_called()
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 4)
+
+    def test_key_reused_with_other_body(self):
+        self.order('abc')
+        other = dict(self.body, customer_name='Bob')
+        self.assertEqual(self.order('abc', other).status_code, 422)
+
+    def test_failed_request_releases_key(self):
+        too_many = {'customer_name': 'Ann', 'items': [{'product': self.product.id, 'quantity': 50}]}
+        self.assertEqual(self.order('abc', too_many).status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    @override_settings(IDEMPOTENCY_WAIT=1)
+    def test_concurrent_duplicate_waits_for_first_response(self):
+        record = IdempotencyKey.objects.create(
+            scope='orders', key='abc', request_hash=self.fingerprint(),
+            expires_at=timezone.now() + timedelta(minutes=1),
+        )
+
+        def first_request_finishes(seconds):
+            IdempotencyKey.objects.filter(pk=record.pk).update(status_code=201, response_body={'id': 42})
+
+        with mock.patch('shop.idempotency.time.sleep', side_effect=first_request_finishes):
+            response = self.order('abc')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {'id': 42})
+        self.assertFalse(Order.objects.exists())
+
+    @override_settings(IDEMPOTENCY_WAIT=0)
+    def test_duplicate_of_request_in_progress(self):
+        IdempotencyKey.objects.create(
+            scope='orders', key='abc', request_hash=self.fingerprint(),
+            expires_at=timezone.now() + timedelta(minutes=1),
+        )
+        response = self.order('abc')
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Order.objects.exists())
+
+    @override_settings(IDEMPOTENCY_CLAIM_TIMEOUT=60)
+    def test_abandoned_claim_is_taken_over(self):
+        # The worker holding this claim died before releasing it
+        IdempotencyKey.objects.create(
+            scope='orders', key='abc', request_hash=self.fingerprint(),
+            expires_at=timezone.now() + timedelta(days=1),
+        )
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(seconds=61))
+        response = self.order('abc')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(IdempotencyKey.objects.get().status_code, 201)
+        self.assertEqual(self.order('abc')['Idempotent-Replayed'], 'true')
+
+    def test_request_superseded_by_takeover_rolls_back(self):
+        create = OrderSerializer.create
+
+        def taken_over(serializer, validated_data):
+            order = create(serializer, validated_data)
+            # A retry takes the claim over while this request is still running
+            IdempotencyKey.objects.all().delete()
+            return order
+
+        with mock.patch.object(OrderSerializer, 'create', taken_over):
+            response = self.order('abc')
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Order.objects.exists())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+
+    def test_expired_keys(self):
+        self.order('abc')
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.order('abc').status_code, 201)
+        self.assertEqual(Order.objects.count(), 2)
+
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        out = StringIO()
+        call_command('purge_idempotency_keys', stdout=out)
+        self.assertIn('Deleted 1 expired', out.getvalue())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def fingerprint(self):
+        # The fingerprint of self.body as the view computes it
+        request = mock.Mock(method='POST', path='/api/shop/orders/', data=self.body)
+        return request_fingerprint(request)
+
+class MigrationTests(TransactionTestCase):
+    """
+    The test database is built from the models (the early migrations only run
+    on the production PostgreSQL schema), so unapply and reapply the
+    migrations from the search index on to check they still run here.
+    """
+
+    def test_search_index_and_later_migrations_apply(self):
+        # Without the post_migrate hook only the migration creates the search index
+        shop_config = django_apps.get_app_config('shop')
+        post_migrate.disconnect(install_search_index, sender=shop_config)
+        self.addCleanup(post_migrate.connect, install_search_index, sender=shop_config)
+        call_command('migrate', fake=True, verbosity=0)
+        call_command('migrate', 'shop', '0009', verbosity=0)
+        self.assertNotIn('shop_product_fts', connection.introspection.table_names())
+
+        vendor = User.objects.create_user(username='vendor', password='pw', role='vendor')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO shop_product (vendor_id, title, description, price, stock, is_active, category,"
+                " created_at, updated_at) VALUES (%s, 'Blue mug', '', 5, 1, 1, '', %s, %s)",
+                [vendor.pk, timezone.now(), timezone.now()],
+            )
+        call_command('migrate', 'shop', verbosity=0)
+        self.assertIn('shop_product_fts', connection.introspection.table_names())
+        self.assertEqual(
+            list(search_products(Product.objects.all(), 'mugs').values_list('title', flat=True)), ['Blue mug'],
+        )
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    """Simultaneous checkouts of the same low-stock products never oversell."""
+
+    def test_parallel_orders_never_oversell(self):
+        vendor = User.objects.create_user(username='vendor', password='pw', role='vendor')
+        shop = Shop.objects.create(owner=vendor, name='Vendor Shop')
+        products = [
+            Product.objects.create(vendor=vendor, shop=shop, title=f'P{i}', price=Decimal('5.00'), stock=stock)
+            for i, stock in enumerate((3, 4))
+        ]
+        threads = 16
+        barrier = threading.Barrier(threads)
+        statuses = []
+
+        def checkout(i):
+            # Threads order the products in different sequences with different quantities
+            lines = [(products[0], 1 + i % 2), (products[1], 1)]
+            if i % 3:
+                lines.reverse()
+            client = APIClient()
+            barrier.wait()
+            try:
+                for attempt in range(100):
+                    try:
+                        response = client.post('/api/shop/orders/', {
+                            'customer_name': f'Buyer {i}',
+                            'items': [{'product': product.id, 'quantity': quantity} for product, quantity in lines],
+                        }, format='json')
+                    except OperationalError:
+                        # SQLite's shared in-memory test database fails contended writes
+                        # with "table is locked" instead of waiting; the client retries
+                        time.sleep(0.005 * (attempt + 1))
+                        continue
+                    statuses.append(response.status_code)
+                    break
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(checkout, range(threads)))
+
+        # A retried request may have failed after its order committed, so the
+        # database, not the status codes, is the record of what was sold
+        self.assertEqual(len(statuses), threads)
+        self.assertTrue(set(statuses) <= {201, 400}, statuses)
+        self.assertIn(400, statuses)
+        self.assertTrue(Order.objects.exists())
+        self.assertFalse(Order.objects.annotate(lines=Count('items')).exclude(lines=2).exists())
+        for product, initial in zip(products, (3, 4)):
+            product.refresh_from_db()
+            self.assertGreaterEqual(product.stock, 0)
+            sold = OrderItem.objects.filter(product=product).aggregate(total=Sum('quantity'))['total'] or 0
+            self.assertEqual(initial - product.stock, sold)
+
+@override_settings(THUMBNAILS_ASYNC=False, THUMBNAIL_WIDTHS=(160, 960))
+class MediaTestCase(CatalogTestCase):
+    """Uploads go to a temporary MEDIA_ROOT; thumbnails are generated inline."""
+    generates_thumbnails = True
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def create_product(self, upload):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Product.objects.create(vendor=self.vendor, shop=self.shop, title='Photo', price=1, image=upload)
+
+class ThumbnailTests(MediaTestCase):
+    def test_derivatives_written_on_upload(self):
+        product = self.create_product(png_upload(size=(800, 400)))
+        for width, ext, expected_width in ((160, 'webp', 160), (160, 'jpg', 160), (960, 'jpg', 800)):
+            with default_storage.open(derivative_name(product.image.name, width, ext)) as fh:
+                self.assertEqual(Image.open(fh).width, expected_width)
+
+    def test_transparent_png(self):
+        product = self.create_product(png_upload(mode='RGBA'))
+        with default_storage.open(derivative_name(product.image.name, 160, 'jpg')) as fh:
+            self.assertEqual(Image.open(fh).mode, 'RGB')
+
+    def test_serializers_expose_thumbnails(self):
+        product = self.create_product(png_upload())
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductImage.objects.create(product=product, image=png_upload('extra.png'), order=1)
+        data = self.client.get('/api/shop/products/').json()[0]
+        self.assertEqual([t['width'] for t in data['thumbnails']], [160, 960])
+        self.assertTrue(data['thumbnails'][0]['webp'].endswith('__w160.webp'))
+        self.assertTrue(data['images'][0]['thumbnails'][1]['jpeg'].endswith('__w960.jpg'))
+        self.assertEqual(len(data['all_images'][0]['thumbnails']), 2)
+        # The missing shop logo file has no derivatives
+        self.assertEqual(self.client.get('/api/shop/shops/').json()[0]['logo_thumbnails'], [])
+
+    def test_generation_changes_etag_and_cached_lists(self):
+        with mock.patch('shop.signals.schedule_derivatives'):
+            product = self.create_product(png_upload())
+        first = self.client.get('/api/shop/products/')
+        self.assertEqual(first.json()[0]['thumbnails'], [])
+        with self.captureOnCommitCallbacks(execute=True):
+            generate_derivatives(default_storage, product.image.name)
+        response = self.client.get('/api/shop/products/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()[0]['thumbnails']), 2)
+        self.assertEqual(response.json()[0]['image_width'], 1200)
+
+    def test_thumbnails_listed_from_metadata(self):
+        product = self.create_product(png_upload())
+        metadata = ImageMetadata.objects.get(name=product.image.name)
+        self.assertEqual(metadata.derivatives, [[160, 'webp'], [160, 'jpeg'], [960, 'webp'], [960, 'jpeg']])
+        # Only what was recorded is listed; storage is not asked per derivative
+        metadata.derivatives = [[160, 'jpeg']]
+        metadata.save()
+        with mock.patch.object(ContentAddressedStorage, 'exists') as exists:
+            data = self.client.get('/api/shop/products/').json()[0]
+        self.assertNotIn(mock.call(derivative_name(product.image.name, 160, 'jpg')), exists.call_args_list)
+        self.assertEqual(len(data['thumbnails']), 1)
+        self.assertIsNone(data['thumbnails'][0]['webp'])
+
+    def test_backfill_command(self):
+        product = Product.objects.create(vendor=self.vendor, title='Old', price=1, image=png_upload())
+        name = derivative_name(product.image.name, 160, 'webp')
+        self.assertFalse(default_storage.exists(name))
+        out = StringIO()
+        with self.assertLogs('shop.thumbnails', 'WARNING') as logs:
+            call_command('generate_thumbnails', workers=1, stdout=out)
+        self.assertTrue(default_storage.exists(name))
+        self.assertIn('Wrote 4 derivative(s)', out.getvalue())
+        # The shop logo file was never uploaded
+        self.assertIn('shop_logos/logo.png', logs.output[0])
+        with self.assertLogs('shop.thumbnails', 'WARNING'):
+            call_command('generate_thumbnails', workers=1, stdout=out)
+        self.assertIn('Wrote 0 derivative(s)', out.getvalue())
+
+class ContentAddressedStorageTests(MediaTestCase):
+    def blob(self, name):
+        return MediaBlob.objects.filter(name=name).first()
+
+    def test_identical_uploads_share_one_blob(self):
+        first = self.create_product(png_upload('Screenshot.png'))
+        second = self.create_product(png_upload('Screenshot_uoi7ZBp.PNG'))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name, r'^products/[0-9a-f]{64}\.png$')
+        self.assertEqual(self.blob(first.image.name).ref_count, 2)
+        self.assertEqual(len([n for n in os.listdir(default_storage.path('products')) if n.endswith('.png')]), 1)
+
+        other = self.create_product(png_upload(size=(10, 10)))
+        self.assertNotEqual(other.image.name, first.image.name)
+
+    def test_blob_deleted_with_last_reference(self):
+        first = self.create_product(png_upload())
+        second = self.create_product(png_upload())
+        name = first.image.name
+        thumbnail = derivative_name(name, 160, 'webp')
+        self.assertTrue(default_storage.exists(thumbnail))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(self.blob(name).ref_count, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertIsNone(self.blob(name))
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(default_storage.exists(thumbnail))
+
+    def test_replacing_an_image_releases_the_old_one(self):
+        product = self.create_product(png_upload())
+        old_name = product.image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            product.image = png_upload(size=(20, 20))
+            product.save()
+        self.assertIsNone(self.blob(old_name))
+        self.assertFalse(default_storage.exists(old_name))
+        self.assertEqual(self.blob(product.image.name).ref_count, 1)
+
+    def test_reused_blob_survives_release_of_last_reference(self):
+        first = self.create_product(png_upload())
+        name = first.image.name
+        # Another upload of the same content is stored but its product not saved yet
+        storage = first.image.storage
+        self.assertEqual(storage.save('products/again.png', png_upload()), name)
+        self.assertEqual(self.blob(name).pending, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(default_storage.exists(name))
+        second = Product.objects.create(vendor=self.vendor, title='Again', price=1, image=name)
+        self.assertEqual((self.blob(name).ref_count, self.blob(name).pending), (1, 0))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(default_storage.exists(name))
+
+    def test_files_stored_before_are_left_alone(self):
+        default_storage.save('products/legacy.png', png_upload())
+        product = Product.objects.create(vendor=self.vendor, title='Old', price=1, image='products/legacy.png')
+        with self.captureOnCommitCallbacks(execute=True):
+            product.delete()
+        self.assertTrue(default_storage.exists('products/legacy.png'))
+
+class ImageMetadataTests(MediaTestCase):
+    def test_recorded_on_upload(self):
+        product = self.create_product(png_upload(size=(800, 400)))
+        metadata = ImageMetadata.objects.get(name=product.image.name)
+        self.assertEqual((metadata.width, metadata.height), (800, 400))
+        self.assertEqual(metadata.size, default_storage.size(product.image.name))
+        self.assertIn(metadata.sha256, product.image.name)
+        self.assertTrue(metadata.placeholder.startswith('data:image/jpeg;base64,'))
+        thumbnail = ImageMetadata.objects.get(name=derivative_name(product.image.name, 160, 'webp'))
+        self.assertEqual((thumbnail.width, thumbnail.height), (160, 80))
+
+    def test_reused_name_gets_fresh_metadata_and_thumbnails(self):
+        # Django's default naming hands a deleted name to the next upload
+        storage = NamedMediaStorage()
+        name = storage.save('products/photo.png', png_upload(size=(800, 400)))
+        generate_derivatives(storage, name)
+        thumbnail = derivative_name(name, 160, 'webp')
+        self.assertTrue(storage.exists(thumbnail))
+        storage.delete(name)
+        self.assertFalse(storage.exists(thumbnail))
+        self.assertFalse(ImageMetadata.objects.filter(name__in=[name, thumbnail]).exists())
+
+        self.assertEqual(storage.save('products/photo.png', png_upload(size=(300, 600))), name)
+        generate_derivatives(storage, name)
+        self.assertEqual(ImageMetadata.objects.get(name=name).width, 300)
+        with storage.open(thumbnail) as fh:
+            self.assertEqual(Image.open(fh).size, (160, 320))
+
+    def test_lists_do_not_touch_storage(self):
+        product = self.create_product(png_upload(size=(800, 400)))
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductImage.objects.create(product=product, image=png_upload(size=(300, 600)), order=1)
+        # The shop logo fixture was never uploaded
+        ImageMetadata.objects.create(name=self.shop.logo.name, exists=False)
+        with mock.patch.object(ContentAddressedStorage, 'exists') as exists:
+            data = self.client.get('/api/shop/products/').json()[0]
+        exists.assert_not_called()
+        self.assertEqual((data['image_width'], data['image_height']), (800, 400))
+        self.assertTrue(data['image_placeholder'].startswith('data:image/jpeg'))
+        self.assertEqual((data['images'][0]['width'], data['images'][0]['height']), (300, 600))
+        self.assertEqual([img['width'] for img in data['all_images']], [800, 300])
+        self.assertEqual(len(data['thumbnails']), 2)
+
+    def test_unreadable_file_recorded_as_missing(self):
+        Product.objects.create(vendor=self.vendor, title='Gone', price=1, image='products/gone.png')
+        with self.assertLogs('shop.thumbnails', 'WARNING'):
+            call_command('generate_thumbnails', workers=1, stdout=StringIO())
+        self.assertFalse(ImageMetadata.objects.get(name='products/gone.png').exists)
+        data = self.client.get('/api/shop/products/').json()[0]
+        self.assertIsNone(data['image_url'])
+        self.assertIsNone(data['image_width'])
+
+    def test_forgotten_with_the_blob(self):
+        product = self.create_product(png_upload())
+        name = product.image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            product.delete()
+        self.assertFalse(ImageMetadata.objects.filter(name__startswith=name.rsplit('.', 1)[0]).exists())
+
+class ProductImageManagementTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.vendor)
+        self.product = self.create_product(png_upload())
+        self.images = [
+            ProductImage.objects.create(product=self.product, image=png_upload(size=(10 + i, 10)), order=i + 1)
+            for i in range(3)
+        ]
+        self.url = f'/api/shop/products/{self.product.id}/images/'
+
+    def image_ids(self):
+        return list(self.product.product_images.order_by('order').values_list('id', flat=True))
+
+    def test_add_appends(self):
+        response = self.client.post(self.url, {'images': [png_upload(size=(40, 40)), png_upload(size=(50, 50))]})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([item['image']['order'] for item in response.json()['images']], [4, 5])
+        self.assertEqual(len(self.client.get(self.url).json()), 5)
+
+    def test_delete_one(self):
+        response = self.client.delete(f'{self.url}{self.images[1].id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.image_ids(), [self.images[0].id, self.images[2].id])
+
+    def test_other_vendors_cannot_edit(self):
+        other = User.objects.create_user(username='other', password='pw', role='vendor')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.delete(f'{self.url}{self.images[0].id}/').status_code, 404)
+        self.assertEqual(self.client.patch(f'{self.url}reorder/', {'order': []}, format='json').status_code, 404)
+
+    def test_reorder_is_one_update(self):
+        new_order = [self.images[2].id, self.images[0].id, self.images[1].id]
+        with mock.patch.object(ProductImage, 'save') as save:
+            response = self.client.patch(f'{self.url}reorder/', {'order': new_order}, format='json')
+        save.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([img['id'] for img in response.json()], new_order)
+        self.assertEqual(self.image_ids(), new_order)
+
+    def test_reorder_must_list_every_image(self):
+        response = self.client.patch(f'{self.url}reorder/', {'order': [self.images[0].id]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_update_only_writes_new_images(self):
+        unchanged = [png_upload(size=(12, 10)), png_upload(size=(10, 10))]  # images[2], images[0]
+        with mock.patch.object(ContentAddressedStorage, 'stage', wraps=self.product.image.storage.stage) as save:
+            response = self.client.patch(
+                f'/api/shop/products/{self.product.id}/update/',
+                {'additional_images': unchanged + [png_upload(size=(60, 60))]},
+            )
+        self.assertEqual(response.status_code, 200)
+        ids = self.image_ids()
+        self.assertEqual(ids[:2], [self.images[2].id, self.images[0].id])
+        self.assertNotIn(self.images[1].id, ids)
+        self.assertEqual(len(ids), 3)
+        self.assertEqual(save.call_count, 1)
+
+class ImageUploadTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.vendor)
+        self.product = self.create_product(png_upload())
+        self.url = f'/api/shop/products/{self.product.id}/images/'
+
+    def test_small_batch_reports_each_image(self):
+        # A valid header passes the request's check; the rest is verified in the pool
+        broken = SimpleUploadedFile('broken.png', png_upload().read()[:200], content_type='image/png')
+        with mock.patch.object(ProductImage, 'save') as save:
+            response = self.client.post(self.url, {'images': [png_upload(size=(40, 40)), broken]})
+        save.assert_not_called()  # rows come from one bulk_create
+        self.assertEqual(response.status_code, 201)
+        body = response.json()
+        self.assertEqual(body['status'], 'done')
+        self.assertEqual([item['status'] for item in body['images']], ['stored', 'failed'])
+        self.assertEqual(body['images'][0]['image']['width'], None)  # metadata follows after commit
+        self.assertIsNone(body['images'][1]['image'])
+        self.assertTrue(body['images'][1]['error'])
+        self.assertEqual(self.product.product_images.count(), 1)
+        self.assertEqual(MediaBlob.objects.get(name=self.product.product_images.get().image.name).ref_count, 1)
+
+    @override_settings(IMAGE_UPLOAD_SYNC_LIMIT=1, IMAGE_UPLOADS_ASYNC=False)
+    def test_large_batch_is_processed_after_response(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            response = self.client.post(self.url, {'images': [png_upload(size=(40, 40)), png_upload(size=(50, 50))]})
+        self.assertEqual(response.status_code, 202)
+        body = response.json()
+        self.assertEqual(body['status'], 'pending')
+        self.assertEqual(self.product.product_images.count(), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for callback in callbacks:
+                callback()
+        status = self.client.get(f'/api/shop/products/uploads/{body["batch"]}/').json()
+        self.assertEqual(status['status'], 'done')
+        self.assertEqual([item['image']['order'] for item in status['images']], [1, 2])
+
+    @override_settings(IMAGE_UPLOAD_SYNC_LIMIT=1)
+    def test_interrupted_batches_are_resumed(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            # The process restarts before the batch runs after commit
+            response = self.client.post(self.url, {'images': [png_upload(size=(40, 40)), png_upload(size=(50, 50))]})
+        batch = response.json()['batch']
+        lost = ImageUpload.objects.get(batch=batch, position=2)
+        os.unlink(spool_path(lost))
+
+        call_command('resume_image_uploads', stdout=StringIO())
+        self.assertEqual(ImageUpload.objects.filter(status='pending').count(), 2)  # not stale yet
+        ImageUpload.objects.update(created_at=timezone.now() - timedelta(hours=2))
+        out = StringIO()
+        call_command('resume_image_uploads', stdout=out)
+        self.assertIn('Processed 1 interrupted batch(es); marked 1 upload(s) failed', out.getvalue())
+        status = self.client.get(f'/api/shop/products/uploads/{batch}/').json()
+        self.assertEqual([item['status'] for item in status['images']], ['stored', 'failed'])
+        self.assertEqual(self.product.product_images.count(), 1)
+
+    def test_status_is_private_to_uploader(self):
+        response = self.client.post(self.url, {'images': [png_upload()]})
+        other = User.objects.create_user(username='other', password='pw', role='vendor')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(f'/api/shop/products/uploads/{response.json()["batch"]}/').status_code, 404)
+
+    def test_create_product_reports_additional_images(self):
+        response = self.client.post('/api/shop/products/create/', {
+            'title': 'Lamp', 'description': 'd', 'price': '10.00', 'stock': 1,
+            'additional_images': [png_upload(size=(30, 30)), png_upload(size=(31, 30))],
+        })
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual([item['status'] for item in response.json()['image_upload']['images']], ['stored', 'stored'])
+
+    def test_non_images_are_rejected_with_the_request(self):
+        not_image = SimpleUploadedFile('notes.png', b'not an image', content_type='image/png')
+        response = self.client.post('/api/shop/products/create/', {
+            'title': 'Lamp', 'description': 'd', 'price': '10.00', 'stock': 1,
+            'additional_images': [png_upload(size=(30, 30)), not_image],
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('additional_images', response.json())
+        self.assertFalse(Product.objects.filter(title='Lamp').exists())
+        not_image.seek(0)
+        self.assertEqual(self.client.post(self.url, {'images': [not_image]}).status_code, 400)
+
+class GcMediaTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = self.create_product(png_upload())
+        self.orphan = self.write_file('products/' + 'a' * 64 + '.png', age=7200)
+        self.legacy = self.write_file('shops/old-logo.png', age=7200)
+        self.recent = self.write_file('products/recent.png')
+        self.partial = self.write_file('products/.upload-abc123')
+        image = ProductImage.objects.create(product=self.product, image=png_upload(size=(20, 20)), order=1)
+        self.missing = image.image.name
+        os.remove(default_storage.path(self.missing))
+
+    def write_file(self, name, age=0):
+        path = default_storage.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as fh:
+            fh.write(b'x')
+        if age:
+            past = os.path.getmtime(path) - age
+            os.utime(path, (past, past))
+        return name
+
+    def gc(self, *args):
+        out = StringIO()
+        call_command('gc_media', *args, '--workers', '2', stdout=out)
+        return out.getvalue()
+
+    def test_reports_orphans_and_dangling_references(self):
+        output = self.gc()
+        self.assertIn(f'orphan {self.orphan}', output)
+        self.assertIn(f'orphan {self.legacy}', output)
+        self.assertIn('dangling shop.ProductImage', output)
+        self.assertIn(self.missing, output)
+        for kept in (self.product.image.name, derivative_name(self.product.image.name, 160, 'webp'), self.recent, self.partial):
+            self.assertNotIn(kept, output)
+        self.assertIn('Found 2 orphaned file(s)', output)
+        self.assertTrue(default_storage.exists(self.orphan))
+
+    def test_delete_keeps_referenced_files_and_thumbnails(self):
+        ImageMetadata.objects.create(name=self.orphan, exists=True)
+        self.gc('--delete', '--clear-dangling')
+        self.assertFalse(default_storage.exists(self.orphan))
+        self.assertFalse(default_storage.exists(self.legacy))
+        self.assertFalse(ImageMetadata.objects.filter(name=self.orphan).exists())
+        self.assertTrue(default_storage.exists(self.product.image.name))
+        self.assertTrue(default_storage.exists(derivative_name(self.product.image.name, 160, 'webp')))
+        self.assertTrue(default_storage.exists(self.recent))
+        self.assertTrue(default_storage.exists(self.partial))
+        self.assertFalse(self.product.product_images.exists())
+
+    def test_delete_skips_files_referenced_since_the_scan(self):
+        # An identical upload during the scan reused the orphan's name
+        MediaBlob.objects.create(name=self.orphan, sha256='a' * 64, size=1, pending=1)
+        thumbnail = self.write_file(derivative_name(self.orphan, 160, 'webp'), age=7200)
+        output = self.gc('--delete')
+        self.assertIn(f'kept {self.orphan}', output)
+        self.assertTrue(default_storage.exists(self.orphan))
+        self.assertTrue(default_storage.exists(thumbnail))
+        self.assertTrue(MediaBlob.objects.filter(name=self.orphan).exists())
+        self.assertFalse(default_storage.exists(self.legacy))
+
+class MediaServingTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = self.create_product(png_upload(size=(300, 200)))
+        self.name = self.product.image.name
+        with default_storage.open(self.name) as fh:
+            self.content = fh.read()
+
+    def get(self, name, **headers):
+        request = RequestFactory().get(f'/media/{name}', **headers)
+        response = serve_media(request, name)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_content_addressed_files_are_immutable(self):
+        response, body = self.get(self.name)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.content)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        # Thumbnails are rewritten in place by generate_thumbnails --force
+        thumbnail, _ = self.get(derivative_name(self.name, 160, 'webp'))
+        self.assertEqual(thumbnail['Cache-Control'], 'public, max-age=3600')
+
+        with open(default_storage.path('products/legacy.png'), 'wb') as fh:
+            fh.write(self.content)
+        legacy, _ = self.get('products/legacy.png')
+        self.assertEqual(legacy['Cache-Control'], 'public, max-age=3600')
+
+    def test_etag_revalidation(self):
+        response, _ = self.get(self.name)
+        again, body = self.get(self.name, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(body, b'')
+
+    def test_range_request(self):
+        response, body = self.get(self.name, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.content)}')
+        self.assertEqual(body, self.content[10:20])
+        response, body = self.get(self.name, HTTP_RANGE='bytes=-5')
+        self.assertEqual(body, self.content[-5:])
+        response, _ = self.get(self.name, HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, 416)
+
+    def test_precompressed_variant(self):
+        with open(default_storage.path(self.name) + '.gz', 'wb') as fh:
+            fh.write(gzip.compress(self.content))
+        response, body = self.get(self.name, HTTP_ACCEPT_ENCODING='br, gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(body), self.content)
+        self.assertIn('Accept-Encoding', response['Vary'])
+        plain, _ = self.get(self.name)
+        self.assertFalse(plain.has_header('Content-Encoding'))
+
+    def test_hidden_and_outside_files_are_not_served(self):
+        for name in ('products/.upload-abc', '../settings.py', 'products/nope.png'):
+            with self.assertRaises(Http404):
+                self.get(name)
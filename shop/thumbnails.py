@@ -0,0 +1,197 @@
+"""
+Fixed-width derivatives of product images and shop logos.
+
+Every original gets a WebP and a JPEG copy at each of ``THUMBNAIL_WIDTHS``,
+stored next to it as ``<stem>__w<width>.<ext>`` (``products/mug.png`` ->
+``products/mug__w160.webp``). Images narrower than a width are not upscaled.
+
+Saving a model schedules generation after the transaction commits; the work
+runs in a small thread pool so the request that uploaded the file does not
+wait for it. The same pass records ``ImageMetadata`` for the original and its
+derivatives, and lists the derivatives on the original's row, which is what
+serializers read: listing thumbnails never checks storage per derivative.
+``manage.py generate_thumbnails`` backfills existing media.
+"""
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WIDTHS = (160, 480, 960)
+
+# (output key, file extension, Pillow format)
+FORMATS = (
+    ('webp', 'webp', 'WEBP'),
+    ('jpeg', 'jpg', 'JPEG'),
+)
+EXTENSIONS = {key: ext for key, ext, _ in FORMATS}
+
+DERIVATIVE_RE = re.compile(r'__w\d+\.(webp|jpg)$')
+
+_executor = None
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'THUMBNAIL_WORKERS', 2),
+            thread_name_prefix='thumbnails',
+        )
+    return _executor
+
+def get_widths():
+    return tuple(getattr(settings, 'THUMBNAIL_WIDTHS', DEFAULT_WIDTHS))
+
+def derivative_name(name, width, ext):
+    stem, _ = os.path.splitext(name)
+    return f'{stem}__w{width}.{ext}'
+
+def is_derivative(name):
+    return bool(DERIVATIVE_RE.search(name or ''))
+
+def derivative_names(name):
+    """``(width, key, name)`` for every derivative of ``name``."""
+    if not name or is_derivative(name):
+        return []
+    return [
+        (width, key, derivative_name(name, width, ext))
+        for width in get_widths()
+        for key, ext, _ in FORMATS
+    ]
+
+def thumbnail_pairs(f):
+    """
+    ``(storage, name)`` pairs to prime with MediaResolver.prime_names() for
+    ``thumbnail_urls()``: only the original, whose metadata lists its derivatives.
+    """
+    if not f:
+        return []
+    return [(f.storage, f.name)]
+
+def thumbnail_urls(resolver, storage, name):
+    """
+    ``[{'width': 160, 'webp': url, 'jpeg': url}, ...]`` for the derivatives
+    recorded on ``name``'s metadata, narrowest first.
+    """
+    metadata = resolver.name_metadata(storage, name)
+    if metadata is None or not metadata.exists or not metadata.derivatives:
+        return []
+    by_width = {}
+    for width, key in metadata.derivatives:
+        url = resolver.stored_url(storage, derivative_name(name, width, EXTENSIONS[key]))
+        if url:
+            by_width.setdefault(width, {'width': width, 'webp': None, 'jpeg': None})[key] = url
+    return [by_width[width] for width in sorted(by_width)]
+
+def _encode(image, width, pil_format):
+    copy = image.copy()
+    if copy.width > width:
+        copy.thumbnail((width, copy.height), Image.LANCZOS)
+    if pil_format == 'JPEG' and copy.mode == 'RGBA':
+        # JPEG has no alpha channel: flatten transparent areas onto white
+        flat = Image.new('RGB', copy.size, (255, 255, 255))
+        flat.paste(copy, mask=copy.getchannel('A'))
+        copy = flat
+    buf = BytesIO()
+    copy.save(buf, pil_format, quality=getattr(settings, 'THUMBNAIL_QUALITY', 82), optimize=True)
+    return buf.getvalue()
+
+def open_image(storage, name):
+    """Decode ``name`` as RGB/RGBA, or return None (and log) if it cannot be read."""
+    try:
+        with storage.open(name, 'rb') as fh:
+            image = Image.open(fh)
+            image.load()
+    except (FileNotFoundError, UnidentifiedImageError, OSError) as e:
+        logger.warning('Cannot create thumbnails for %s: %s', name, e)
+        return None
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        has_alpha = image.mode in ('LA', 'PA') or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+    return image
+
+def generate_derivatives(storage, name, force=False):
+    """
+    Write the missing derivatives of ``name`` (all of them with ``force``) and
+    record image metadata for the original and every derivative that lacks it.
+    The products and shops showing ``name`` are then touched so their ETags and
+    cached responses change. Returns the names written; unreadable images are
+    recorded as missing.
+    """
+    from .metadata import missing_metadata, record_derivatives, recorded_derivatives, record_metadata, record_missing
+    from .signals import media_recorded
+
+    derivatives = derivative_names(name)
+    if not derivatives:
+        return []
+    pending = [
+        (width, key, derivative)
+        for width, key, derivative in derivatives
+        if force or not storage.exists(derivative)
+    ]
+    all_names = [name] + [derivative for _, _, derivative in derivatives]
+    unrecorded = set(all_names) if force else missing_metadata(all_names)
+    listed = [[width, key] for width, key, _ in derivatives]
+    if not pending and not unrecorded and recorded_derivatives(name) == listed:
+        return []
+
+    image = open_image(storage, name)
+    if image is None:
+        record_missing(name)
+        return []
+    if name in unrecorded:
+        record_metadata(storage, name, image)
+
+    written = []
+    pil_formats = {key: pil_format for key, _, pil_format in FORMATS}
+    for width, key, derivative in pending:
+        content = _encode(image, width, pil_formats[key])
+        if storage.exists(derivative):
+            storage.delete(derivative)
+        saved = storage.save(derivative, ContentFile(content))
+        record_metadata(storage, saved, Image.open(BytesIO(content)), placeholder=False)
+        written.append(saved)
+    for derivative in sorted(unrecorded - set(written) - {name}):
+        record_metadata(storage, derivative, placeholder=False)
+    # Every derivative now exists: the ones found above and the ones just written
+    record_derivatives(name, listed)
+    media_recorded(name)
+    return written
+
+def _generate_logged(storage, name):
+    try:
+        generate_derivatives(storage, name)
+    except Exception:
+        logger.exception('Thumbnail generation failed for %s', name)
+
+def generate_in_worker(storage, name, force=False):
+    """``generate_derivatives()`` for pool threads, which must close their own database connection."""
+    try:
+        return generate_derivatives(storage, name, force=force)
+    finally:
+        connection.close()
+
+def _generate_in_background(storage, name):
+    try:
+        _generate_logged(storage, name)
+    finally:
+        connection.close()
+
+def schedule_derivatives(f):
+    """Generate derivatives of the file ``f`` once the current transaction commits."""
+    if not f or is_derivative(f.name):
+        return
+    storage, name = f.storage, f.name
+    if getattr(settings, 'THUMBNAILS_ASYNC', True):
+        transaction.on_commit(lambda: _get_executor().submit(_generate_in_background, storage, name))
+    else:
+        transaction.on_commit(lambda: _generate_logged(storage, name))
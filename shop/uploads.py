@@ -0,0 +1,199 @@
+"""
+Multi-image product uploads.
+
+Request bodies are streamed to temporary files (``FILE_UPLOAD_HANDLERS``); each
+file is then moved into a spool directory so it outlives the request, and an
+``ImageUpload`` row records its status. Validation with Pillow and writing to
+storage run in a bounded thread pool, and the resulting ``ProductImage`` rows
+are inserted with one ``bulk_create`` in a transaction.
+
+Batches up to ``IMAGE_UPLOAD_SYNC_LIMIT`` images are processed before the
+response is sent. Larger ones are processed in the background after commit;
+clients poll ``GET /api/shop/products/uploads/<batch>/`` for per-image status.
+
+Background batches live in this process and the local spool directory, so a
+restart or deploy interrupts them; ``manage.py resume_image_uploads`` processes
+stale pending images again from the spool, or marks them failed when their
+file is gone.
+"""
+import logging
+import os
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.move import file_move_safe
+from django.db import connection, transaction
+from PIL import Image
+
+from .models import ProductImage, ImageUpload
+from .signals import product_images_added
+
+logger = logging.getLogger(__name__)
+
+_image_executor = None
+_batch_executor = None
+
+def _get_image_executor():
+    global _image_executor
+    if _image_executor is None:
+        _image_executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'IMAGE_UPLOAD_WORKERS', 4),
+            thread_name_prefix='image-upload',
+        )
+    return _image_executor
+
+def _get_batch_executor():
+    global _batch_executor
+    if _batch_executor is None:
+        _batch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='image-upload-batch')
+    return _batch_executor
+
+def spool_dir():
+    path = getattr(settings, 'IMAGE_UPLOAD_SPOOL_DIR', None) or os.path.join(tempfile.gettempdir(), 'ecom-uploads')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def spool_path(item):
+    return os.path.join(spool_dir(), f'{item.batch}-{item.position}')
+
+def _spool(upload, path):
+    if hasattr(upload, 'temporary_file_path'):
+        # Already streamed to disk by TemporaryFileUploadHandler: just move it
+        file_move_safe(upload.temporary_file_path(), path, allow_overwrite=True)
+        return
+    with open(path, 'wb') as out:
+        for chunk in upload.chunks():
+            out.write(chunk)
+
+def start_image_upload(product, uploads, user, positions):
+    """
+    Record and spool ``uploads`` as images of ``product`` at the matching
+    ``positions`` (their ``order``) and process them, now or after commit
+    depending on the batch size. Returns the batch id.
+    """
+    batch = uuid.uuid4()
+    items = [
+        ImageUpload(
+            batch=batch, product=product, uploaded_by=user, position=position,
+            original_name=os.path.basename(upload.name or '')[:255],
+        )
+        for upload, position in zip(uploads, positions)
+    ]
+    for item, upload in zip(items, uploads):
+        _spool(upload, spool_path(item))
+    ImageUpload.objects.bulk_create(items)
+
+    if len(items) <= getattr(settings, 'IMAGE_UPLOAD_SYNC_LIMIT', 4):
+        # Small batches are processed before answering; the pool still runs them in parallel
+        process_batch(batch)
+    elif getattr(settings, 'IMAGE_UPLOADS_ASYNC', True):
+        transaction.on_commit(lambda: _get_batch_executor().submit(_process_in_background, batch))
+    else:
+        transaction.on_commit(lambda: process_batch(batch))
+    return batch
+
+def _validate_and_store(item):
+    """
+    Runs in the image pool: returns ``(stored, error)``, ``stored`` being the
+    stored name or, with content-addressed storage, the staged file for
+    ``_finish_store()``. Never touches the database.
+    """
+    path = spool_path(item)
+    try:
+        with Image.open(path) as image:
+            image.verify()
+    except Exception:
+        return None, 'Upload a valid image. The file you uploaded was either not an image or a corrupted image.'
+    field = ProductImage._meta.get_field('image')
+    name = field.generate_filename(None, item.original_name or 'image')
+    try:
+        with open(path, 'rb') as fh:
+            if hasattr(field.storage, 'stage'):
+                return field.storage.stage(name, File(fh)), ''
+            return field.storage.save(name, File(fh)), ''
+    except OSError as e:
+        logger.exception('Storing upload %s failed', item.pk)
+        return None, f'Could not store the file: {e}'
+
+def _finish_store(item, stored):
+    """``(stored name, error)`` once a staged file is moved into place (in the caller's transaction)."""
+    if not isinstance(stored, tuple):
+        return stored, ''
+    try:
+        return ProductImage._meta.get_field('image').storage.store_staged(*stored), ''
+    except OSError as e:
+        logger.exception('Storing upload %s failed', item.pk)
+        return None, f'Could not store the file: {e}'
+
+def process_batch(batch):
+    """Validate and store every pending image of ``batch``, then create their ProductImage rows at once."""
+    items = list(ImageUpload.objects.filter(batch=batch, status='pending').select_related('product').order_by('position'))
+    if not items:
+        return
+    try:
+        results = list(_get_image_executor().map(_validate_and_store, items))
+    finally:
+        for item in items:
+            try:
+                os.unlink(spool_path(item))
+            except FileNotFoundError:
+                pass
+
+    with transaction.atomic():
+        results = [_finish_store(item, stored) if stored else (stored, error) for item, (stored, error) in zip(items, results)]
+        stored = [(item, name) for item, (name, _) in zip(items, results) if name]
+        images = ProductImage.objects.bulk_create([
+            ProductImage(product_id=item.product_id, image=name, order=item.position, is_primary=False)
+            for item, name in stored
+        ])
+        for (item, _), image in zip(stored, images):
+            item.status = 'stored'
+            item.image = image
+        for item, (name, error) in zip(items, results):
+            if not name:
+                item.status = 'failed'
+                item.error = error[:255]
+        ImageUpload.objects.bulk_update(items, ['status', 'error', 'image'])
+        if images:
+            product_images_added(items[0].product, images)
+
+def _process_in_background(batch):
+    try:
+        process_batch(batch)
+    except Exception:
+        logger.exception('Processing upload batch %s failed', batch)
+        ImageUpload.objects.filter(batch=batch, status='pending').update(
+            status='failed', error='Processing failed',
+        )
+    finally:
+        connection.close()
+
+def batch_status(batch, user, request=None):
+    """Per-image status of a batch, or None if it does not exist for ``user``."""
+    from .serializers import ProductImageSerializer
+
+    items = list(ImageUpload.objects.filter(batch=batch, uploaded_by=user).select_related('image').order_by('position'))
+    if not items:
+        return None
+    images = ProductImageSerializer(
+        [item.image for item in items if item.image], many=True, context={'request': request},
+    ).data
+    images_by_id = {image['id']: image for image in images}
+    return {
+        'batch': str(batch),
+        'product': items[0].product_id,
+        'status': 'pending' if any(item.status == 'pending' for item in items) else 'done',
+        'images': [
+            {
+                'position': item.position,
+                'name': item.original_name,
+                'status': item.status,
+                'error': item.error or None,
+                'image': images_by_id.get(item.image_id),
+            }
+            for item in items
+        ],
+    }
@@ -1,14 +1,17 @@
 from django.urls import path
 from .views import (
-    ShopListView, my_shop, update_my_shop,
+    ShopListView, ShopProductsView, my_shop, update_my_shop,
     ProductListView, MyProductsView, CreateProductView, UpdateProductView, DeleteProductView, import_to_my_shop,
-    CreateOrderView, ListOrdersView, update_order_status,
+    ProductImagesView, ProductImageDeleteView, reorder_product_images, image_upload_status,
+    CreateOrderView, ListOrdersView, update_order_status, bulk_update_order_status,
+    export_orders, order_events, sales_analytics,
 )
 from .admin_views import clear_database_admin, database_status
 
 urlpatterns = [
     # Shops
     path('shops/', ShopListView.as_view()),
+    path('shops/<int:pk>/products/', ShopProductsView.as_view()),  # GET paginated products of one shop
     path('shops/my_shop/', my_shop),          # GET
     path('shops/my_shop/update/', update_my_shop),  # POST to update
 
@@ -18,12 +21,22 @@ urlpatterns = [
     path('products/create/', CreateProductView.as_view()),
     path('products/<int:pk>/update/', UpdateProductView.as_view()),
     path('products/<int:pk>/delete/', DeleteProductView.as_view()),
+    path('products/<int:pk>/images/', ProductImagesView.as_view()),  # GET list, POST add images
+    path('products/<int:pk>/images/reorder/', reorder_product_images),  # PATCH {"order": [ids]}
+    path('products/<int:pk>/images/<int:image_id>/', ProductImageDeleteView.as_view()),  # DELETE one image
+    path('products/uploads/<uuid:batch>/', image_upload_status),  # GET per-image upload status
     path('products/<int:pk>/import_to_my_shop/', import_to_my_shop),
 
     # Orders
     path('orders/', CreateOrderView.as_view()),  # POST create guest order
     path('orders/list/', ListOrdersView.as_view()),  # GET list for vendor/dropshipper
+    path('orders/events/', order_events),  # GET ?after=<id> changes to the caller's orders
+    path('orders/export/', export_orders),  # GET ?output=csv|jsonl&start=&end=&status= streamed lines
+    path('orders/status/', bulk_update_order_status),  # PATCH vendor updates status of many orders
     path('orders/<int:pk>/', update_order_status),  # PATCH vendor updates status
+
+    # Analytics
+    path('analytics/sales/', sales_analytics),  # GET ?start=&end= daily sales totals
     
     # Admin endpoints for database management
     path('admin/clear-database/', clear_database_admin),  # POST with secret to clear all data
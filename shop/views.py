@@ -1,24 +1,138 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
 from rest_framework import generics, permissions, status, serializers
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes
-from django.db.models import Q
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.db.models import Count, Exists, F, Max, OuterRef, Prefetch, Q, Sum, Window
+from django.db.models.functions import RowNumber
 from django.contrib.auth import get_user_model
-from .models import Shop, Product, DropshipImport, Order
+from django.shortcuts import get_object_or_404
+from .models import (
+    Shop, Product, ProductImage, DropshipImport, Order, OrderItem, OrderEvent, VendorSalesDaily, VendorOrdersDaily,
+    ShopSalesDaily,
+)
 from .serializers import (
     ShopSerializer,
+    ShopSummarySerializer,
     ProductSerializer,
     ProductCreateSerializer,
+    ProductImageSerializer,
+    ProductImageUploadSerializer,
+    ProductImageOrderSerializer,
     OrderSerializer,
+    OrderStatusBulkSerializer,
+    OrderExportSerializer,
+    OrderEventFeedSerializer,
+    OrderEventSerializer,
+    SalesRangeSerializer,
     OrderListSerializer,
+    set_dropshipper_shop,
+)
+from .pagination import IdCursorPagination, RequiredIdCursorPagination
+from .plans import PRODUCT_PLAN, SHOP_PLAN, ORDER_PLAN, vendor_order_plan
+from .fieldsets import SparseFieldsetViewMixin
+from .projections import ProjectionListMixin, ProductProjection, OrderProjection
+from .search import filter_products
+from .signals import product_images_changed
+from .uploads import start_image_upload, batch_status
+from .idempotency import IdempotentCreateMixin
+from .rollups import record_status_change
+from .events import record_status_changes
+from .exports import STREAMS, order_lines
+from .cache import AnonymousResponseCacheMixin
+from .conditional import (
+    ConditionalListMixin,
+    aggregate_validator,
+    compute_validators,
+    not_modified,
+    set_validators,
 )
 
 User = get_user_model()
 
 # Shops
-class ShopListView(generics.ListAPIView):
-    queryset = Shop.objects.prefetch_related('products', 'owner').all()
+class ShopListView(AnonymousResponseCacheMixin, ConditionalListMixin, SparseFieldsetViewMixin, generics.ListAPIView):
+    """
+    All shops with every product embedded. ``?summary=true`` returns
+    ``product_count`` instead, plus up to ``?preview=<k>`` newest products per
+    shop; the full product list is paginated under ``shops/<id>/products/``.
+    """
     serializer_class = ShopSerializer
     permission_classes = [permissions.AllowAny]
+    pagination_class = IdCursorPagination
+    max_preview_size = 20
+
+    def is_summary(self):
+        return self.request.query_params.get('summary', '').lower() in ('1', 'true', 'yes')
+
+    def get_preview_size(self):
+        value = self.request.query_params.get('preview')
+        if not value or not self.is_summary():
+            return None
+        try:
+            size = int(value)
+        except ValueError:
+            raise serializers.ValidationError({'preview': 'Expected a number'})
+        return max(0, min(size, self.max_preview_size))
+
+    def get_serializer_class(self):
+        return ShopSummarySerializer if self.is_summary() else ShopSerializer
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['preview_size'] = self.get_preview_size()
+        return context
+
+    def get_queryset(self):
+        fields = self.get_requested_fields()
+        if not self.is_summary():
+            return SHOP_PLAN.apply(Shop.objects.all(), fields)
+
+        qs = SHOP_PLAN.apply(Shop.objects.all(), ['owner'] if fields is None or 'owner' in fields else [])
+        qs = qs.annotate(product_count=Count('products'))
+        preview_size = self.get_preview_size()
+        if preview_size is not None and (fields is None or 'products_preview' in fields):
+            # Newest products per shop via ROW_NUMBER(), one row past the
+            # preview so the serializer can tell whether there are more
+            ranked = Product.objects.annotate(
+                shop_rank=Window(RowNumber(), partition_by=F('shop_id'), order_by=F('id').desc()),
+            ).filter(shop_rank__lte=preview_size + 1).order_by('-id')
+            qs = qs.prefetch_related(
+                Prefetch('products', queryset=PRODUCT_PLAN.apply(ranked), to_attr='preview_products'),
+            )
+        return qs
+
+    def get_cache_scopes(self):
+        return ['shops']
+
+    def get_validator_parts(self, queryset):
+        # Shops embed their products, so both tables feed the validator
+        shop_times, shop_counts = aggregate_validator(queryset)
+        product_times, product_counts = aggregate_validator(Product.objects.filter(shop__isnull=False))
+        return shop_times + product_times, shop_counts + product_counts
+
+class ShopProductsView(
+    AnonymousResponseCacheMixin, ConditionalListMixin, SparseFieldsetViewMixin, ProjectionListMixin, generics.ListAPIView,
+):
+    """One shop's products, always paginated; accepts the product list filters."""
+    serializer_class = ProductSerializer
+    projection_class = ProductProjection
+    permission_classes = [permissions.AllowAny]
+    pagination_class = RequiredIdCursorPagination
+
+    def get_queryset(self):
+        qs = PRODUCT_PLAN.apply(Product.objects.filter(shop_id=self.kwargs['pk']), self.get_requested_fields())
+        return filter_products(qs, self.request.query_params).order_by('-id')
+
+    def get_cache_scopes(self):
+        return ['shops']
+
+    def get_validator_parts(self, queryset):
+        return aggregate_validator(queryset, 'shop__updated_at')
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
@@ -29,7 +143,12 @@ def my_shop(request):
             'company_name': request.user.company_name or '',
             'shop_type': 'dropshipper' if request.user.role == 'dropshipper' else 'vendor',
         })
-        return Response(ShopSerializer(shop, context={'request': request}).data)
+        product_times, product_counts = aggregate_validator(shop.products.all())
+        etag = compute_validators(request, [shop.updated_at] + product_times, product_counts)
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        return set_validators(Response(ShopSerializer(shop, context={'request': request}).data), etag)
     except Exception as e:
         return Response({'detail': 'Failed to retrieve shop information'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -74,16 +193,32 @@ def update_my_shop(request):
         return Response({'detail': 'Failed to update shop'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 # Products
-class ProductListView(generics.ListAPIView):
+class ProductListView(
+    AnonymousResponseCacheMixin, ConditionalListMixin, SparseFieldsetViewMixin, ProjectionListMixin, generics.ListAPIView,
+):
     serializer_class = ProductSerializer
+    projection_class = ProductProjection
     permission_classes = [permissions.AllowAny]
+    pagination_class = IdCursorPagination
+
+    def get_cache_scopes(self):
+        # Same precedence as get_queryset(); ids are normalised so that "07"
+        # and "7" share the version that the signals bump
+        for param, scope in (('vendor', 'vendor'), ('dropshipper', 'dropshipper')):
+            value = self.request.query_params.get(param)
+            if value:
+                try:
+                    return [f'{scope}:{int(value)}']
+                except ValueError:
+                    break
+        return ['catalog']
 
     def get_queryset(self):
         vendor_id = self.request.query_params.get('vendor')
         dropshipper_id = self.request.query_params.get('dropshipper')
         
-        qs = Product.objects.select_related('vendor', 'shop')
-        
+        qs = PRODUCT_PLAN.apply(Product.objects.all(), self.get_requested_fields())
+
         if vendor_id:
             qs = qs.filter(vendor_id=vendor_id)
         elif dropshipper_id:
@@ -92,35 +227,58 @@ class ProductListView(generics.ListAPIView):
                 dropshipper_id=dropshipper_id
             ).values_list('product_id', flat=True)
             qs = qs.filter(id__in=imported_product_ids)
-        
+
+        # Full-text search and facet filters (q, category, price, stock, is_active)
+        qs = filter_products(qs, self.request.query_params)
+
         return qs.order_by('-id')
 
+    def get_dropshipper(self):
+        """``(user, shop)`` of the dropshipper storefront being browsed, loaded once per request."""
+        if not hasattr(self, '_dropshipper'):
+            self._dropshipper = (None, None)
+            dropshipper_id = self.request.query_params.get('dropshipper')
+            if dropshipper_id:
+                try:
+                    dropshipper_user = User.objects.get(id=dropshipper_id, role='dropshipper')
+                    self._dropshipper = (
+                        dropshipper_user,
+                        Shop.objects.filter(owner=dropshipper_user, shop_type='dropshipper').first(),
+                    )
+                except User.DoesNotExist:
+                    pass
+        return self._dropshipper
+
+    def get_validator_parts(self, queryset):
+        timestamps, counts = aggregate_validator(queryset, 'shop__updated_at')
+        _, dropshipper_shop = self.get_dropshipper()
+        if dropshipper_shop:
+            timestamps.append(dropshipper_shop.updated_at)
+        return timestamps, counts
+
     def get_serializer_context(self):
         context = super().get_serializer_context()
         
         # If browsing by dropshipper, add dropshipper context
-        dropshipper_id = self.request.query_params.get('dropshipper')
-        if dropshipper_id:
-            try:
-                from django.contrib.auth import get_user_model
-                User = get_user_model()
-                dropshipper_user = User.objects.get(id=dropshipper_id, role='dropshipper')
-                context['dropshipper_user'] = dropshipper_user
-            except User.DoesNotExist:
-                pass
+        dropshipper_user, dropshipper_shop = self.get_dropshipper()
+        if dropshipper_user:
+            context['dropshipper_user'] = dropshipper_user
+            set_dropshipper_shop(context, dropshipper_shop)
         
         return context
 
-class MyProductsView(generics.ListAPIView):
+class MyProductsView(ConditionalListMixin, SparseFieldsetViewMixin, ProjectionListMixin, generics.ListAPIView):
     serializer_class = ProductSerializer
+    projection_class = ProductProjection
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = IdCursorPagination
 
     def get_queryset(self):
         user = self.request.user
         
         # For vendors: show products they created
         if user.role == 'vendor':
-            return Product.objects.filter(vendor=user).select_related('vendor', 'shop').order_by('-id')
+            return PRODUCT_PLAN.apply(Product.objects.filter(vendor=user), self.get_requested_fields()).order_by('-id')
         
         # For dropshippers: show products they imported
         elif user.role == 'dropshipper':
@@ -129,18 +287,33 @@ class MyProductsView(generics.ListAPIView):
                 dropshipper=user
             ).values_list('product_id', flat=True)
             
-            return Product.objects.filter(
+            return PRODUCT_PLAN.apply(Product.objects.filter(
                 id__in=imported_product_ids
-            ).select_related('vendor', 'shop').order_by('-id')
+            ), self.get_requested_fields()).order_by('-id')
         
         # Default: empty queryset for other roles
         return Product.objects.none()
 
+    def get_dropshipper_shop(self):
+        if not hasattr(self, '_dropshipper_shop'):
+            self._dropshipper_shop = None
+            if self.request.user.role == 'dropshipper':
+                self._dropshipper_shop = Shop.objects.filter(owner=self.request.user, shop_type='dropshipper').first()
+        return self._dropshipper_shop
+
+    def get_validator_parts(self, queryset):
+        timestamps, counts = aggregate_validator(queryset, 'shop__updated_at')
+        dropshipper_shop = self.get_dropshipper_shop()
+        if dropshipper_shop:
+            timestamps.append(dropshipper_shop.updated_at)
+        return timestamps, counts
+
     def get_serializer_context(self):
         context = super().get_serializer_context()
         # If this is a dropshipper viewing their products, add dropshipper context
         if self.request.user.role == 'dropshipper':
             context['dropshipper_user'] = self.request.user
+            set_dropshipper_shop(context, self.get_dropshipper_shop())
         return context
 
 class CreateProductView(generics.CreateAPIView):
@@ -171,6 +344,64 @@ class DeleteProductView(generics.DestroyAPIView):
         # Only allow vendors to delete their own products
         return Product.objects.filter(vendor=self.request.user)
 
+# Product images
+class ProductImagesView(generics.ListCreateAPIView):
+    """The additional images of one of the vendor's products: GET lists them, POST appends new ones."""
+    serializer_class = ProductImageSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_product(self):
+        if not hasattr(self, '_product'):
+            self._product = get_object_or_404(Product, pk=self.kwargs['pk'], vendor=self.request.user)
+        return self._product
+
+    def get_queryset(self):
+        return ProductImage.objects.filter(product=self.get_product()).order_by('order', 'created_at')
+
+    def create(self, request, *args, **kwargs):
+        # Answers with the upload batch status; 202 while a large batch is still processed
+        product = self.get_product()
+        upload = ProductImageUploadSerializer(data=request.data)
+        upload.is_valid(raise_exception=True)
+        images = upload.validated_data['images']
+        with transaction.atomic():
+            last = product.product_images.aggregate(last=Max('order'))['last'] or 0
+            batch = start_image_upload(product, images, request.user, range(last + 1, last + 1 + len(images)))
+        data = batch_status(batch, request.user, request)
+        code = status.HTTP_202_ACCEPTED if data['status'] == 'pending' else status.HTTP_201_CREATED
+        return Response(data, status=code)
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def image_upload_status(request, batch):
+    data = batch_status(batch, request.user, request)
+    if data is None:
+        return Response({'detail': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(data)
+
+class ProductImageDeleteView(generics.DestroyAPIView):
+    permission_classes = [permissions.IsAuthenticated]
+    lookup_url_kwarg = 'image_id'
+
+    def get_queryset(self):
+        return ProductImage.objects.filter(product_id=self.kwargs['pk'], product__vendor=self.request.user)
+
+@api_view(['PATCH'])
+@permission_classes([permissions.IsAuthenticated])
+def reorder_product_images(request, pk: int):
+    # {"order": [<image id>, ...]} listing every image of the product once
+    product = get_object_or_404(Product, pk=pk, vendor=request.user)
+    with transaction.atomic():
+        images = {img.id: img for img in ProductImage.objects.select_for_update().filter(product=product)}
+        serializer = ProductImageOrderSerializer(data=request.data, context={'product': product})
+        serializer.is_valid(raise_exception=True)
+        ordered = [images[image_id] for image_id in serializer.validated_data['order']]
+        for position, image in enumerate(ordered, start=1):
+            image.order = position
+        ProductImage.objects.bulk_update(ordered, ['order'])
+        product_images_changed(product)
+    return Response(ProductImageSerializer(ordered, many=True, context={'request': request}).data)
+
 # Dropshipper import
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
@@ -207,41 +438,234 @@ def import_to_my_shop(request, pk: int):
         return Response({'detail': 'Failed to import product'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 # Orders
-class CreateOrderView(generics.CreateAPIView):
+class CreateOrderView(IdempotentCreateMixin, generics.CreateAPIView):
     serializer_class = OrderSerializer
     permission_classes = [permissions.AllowAny]  # Guest checkout allowed
+    idempotency_scope = 'orders'
+
+def vendor_orders(vendor):
+    """Orders with at least one line of ``vendor``'s products."""
+    return Order.objects.filter(Exists(OrderItem.objects.filter(order=OuterRef('pk'), vendor=vendor)))
 
-class ListOrdersView(generics.ListAPIView):
+class ListOrdersView(SparseFieldsetViewMixin, ProjectionListMixin, generics.ListAPIView):
     serializer_class = OrderListSerializer
+    projection_class = OrderProjection
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = IdCursorPagination
+
+    def get_projection(self):
+        projection = super().get_projection()
+        if self.request.user.role == 'vendor':
+            projection.items_queryset = OrderItem.objects.filter(vendor=self.request.user)
+        return projection
 
     def get_queryset(self):
+        fields = self.get_requested_fields()
         try:
             user = self.request.user
-            # Vendors see orders that contain their products
+            # Vendors see orders that contain their products, and only their own lines of them.
+            # EXISTS uses the (vendor, order) index and needs no DISTINCT over the join.
             if user.role == 'vendor':
-                return Order.objects.filter(items__vendor=user).distinct().order_by('-id')
+                return vendor_order_plan(user).apply(vendor_orders(user), fields).order_by('-id')
             # Dropshippers see orders made via their shop
             if user.role == 'dropshipper':
-                return Order.objects.filter(dropshipper_shop__owner=user).order_by('-id')
+                return ORDER_PLAN.apply(Order.objects.filter(dropshipper_shop__owner=user), fields).order_by('-id')
             # Fallback: empty for other roles
             return Order.objects.none()
         except Exception as e:
             return Order.objects.none()
 
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def export_orders(request):
+    """
+    Stream the caller's order lines as CSV or JSON Lines (``?output=csv|jsonl``),
+    optionally limited to orders created between ``start`` and ``end``
+    (inclusive dates) and with one of the ``status`` values.
+    """
+    if request.user.role not in ('vendor', 'dropshipper'):
+        return Response({'detail': 'Only vendors and dropshippers can export orders'}, status=status.HTTP_403_FORBIDDEN)
+    serializer = OrderExportSerializer(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+    params = serializer.validated_data
+
+    def day_start(day):
+        return timezone.make_aware(datetime.combine(day, time.min))
+
+    lines = order_lines(
+        request.user,
+        start=day_start(params['start']) if 'start' in params else None,
+        end=day_start(params['end'] + timedelta(days=1)) if 'end' in params else None,
+        statuses=params.get('status'),
+    )
+    stream, content_type = STREAMS[params['output']]
+    response = StreamingHttpResponse(stream(lines), content_type=content_type)
+    filename = f'orders-{timezone.localdate():%Y%m%d}.{params["output"]}'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def order_events(request):
+    """
+    Changes to the caller's orders after the ``after`` cursor, oldest first.
+    Poll with the returned ``next`` as ``after``; ``has_more`` means another
+    page is ready. Vendors get events of orders with their products,
+    dropshippers those of orders made through their shops.
+    """
+    user = request.user
+    if user.role == 'vendor':
+        events = OrderEvent.objects.filter(vendor=user)
+    elif user.role == 'dropshipper':
+        events = OrderEvent.objects.filter(shop__owner=user)
+    else:
+        return Response({'detail': 'Only vendors and dropshippers have an order feed'}, status=status.HTTP_403_FORBIDDEN)
+    serializer = OrderEventFeedSerializer(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+    after, limit = serializer.validated_data['after'], serializer.validated_data['limit']
+
+    page = list(events.filter(id__gt=after).order_by('id')[:limit + 1])
+    has_more = len(page) > limit
+    page = page[:limit]
+    return Response({
+        'results': OrderEventSerializer(page, many=True).data,
+        'next': page[-1].id if page else after,
+        'has_more': has_more,
+    })
+
+def statuses_leading_to(target):
+    return [current for current, targets in Order.ALLOWED_TRANSITIONS.items() if target in targets]
+
 @api_view(['PATCH'])
 @permission_classes([permissions.IsAuthenticated])
 def update_order_status(request, pk: int):
     # Only vendors can update status on orders associated with their products
     if request.user.role != 'vendor':
         return Response({'detail': 'Only vendors can update status'}, status=status.HTTP_403_FORBIDDEN)
-    try:
-        order = Order.objects.get(pk=pk, items__vendor=request.user)
-    except Order.DoesNotExist:
-        return Response({'detail': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
-    status_value = request.data.get('status')
-    if status_value not in ['pending', 'completed']:
-        return Response({'detail': 'Invalid status'}, status=status.HTTP_400_BAD_REQUEST)
-    order.status = status_value
-    order.save(update_fields=['status'])
-    return Response({'detail': 'Status updated'})
\ No newline at end of file
+    with transaction.atomic():
+        # The transition is checked against the locked row, so concurrent
+        # updates cannot both move the order out of the same status
+        order = vendor_orders(request.user).select_for_update().filter(pk=pk).first()
+        if order is None:
+            return Response({'detail': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
+        status_value = request.data.get('status')
+        if status_value not in Order.ALLOWED_TRANSITIONS:
+            return Response({'detail': 'Invalid status'}, status=status.HTTP_400_BAD_REQUEST)
+        old_status = order.status
+        if status_value == old_status:
+            return Response({'detail': 'Status updated'})
+        if status_value not in Order.ALLOWED_TRANSITIONS[old_status]:
+            return Response(
+                {'detail': f'Cannot change status from {old_status} to {status_value}'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        # The status condition repeats the check for databases without row locks
+        if not Order.objects.filter(pk=order.pk, status=old_status).update(status=status_value):
+            return Response(
+                {'detail': 'The order was changed by another request; reload it and retry.'},
+                status=status.HTTP_409_CONFLICT,
+            )
+        record_status_change([order.pk], old_status, status_value)
+        record_status_changes({order.pk: old_status}, status_value)
+    return Response({'detail': 'Status updated'})
+
+@api_view(['PATCH'])
+@permission_classes([permissions.IsAuthenticated])
+def bulk_update_order_status(request):
+    """
+    Set ``status`` on every order in ``ids`` that belongs to the vendor and may
+    make that transition, with one ownership query and one UPDATE. Each id is
+    reported as ``updated``, ``unchanged``, ``not_found`` or ``invalid_transition``.
+    """
+    if request.user.role != 'vendor':
+        return Response({'detail': 'Only vendors can update status'}, status=status.HTTP_403_FORBIDDEN)
+    serializer = OrderStatusBulkSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    ids = serializer.validated_data['ids']
+    target = serializer.validated_data['status']
+    allowed_from = statuses_leading_to(target)
+
+    with transaction.atomic():
+        current = dict(
+            vendor_orders(request.user).select_for_update().filter(pk__in=ids).values_list('pk', 'status')
+        )
+        to_update = [pk for pk in ids if current.get(pk) in allowed_from]
+        if to_update:
+            # The status condition repeats the check for databases without row locks
+            Order.objects.filter(pk__in=to_update, status__in=allowed_from).update(status=target)
+            for old_status in set(current[pk] for pk in to_update):
+                record_status_change([pk for pk in to_update if current[pk] == old_status], old_status, target)
+            record_status_changes({pk: current[pk] for pk in to_update}, target)
+
+    results = []
+    for pk in ids:
+        if pk not in current:
+            results.append({'id': pk, 'result': 'not_found'})
+        elif current[pk] == target:
+            results.append({'id': pk, 'result': 'unchanged', 'status': target})
+        elif current[pk] in allowed_from:
+            results.append({'id': pk, 'result': 'updated', 'status': target})
+        else:
+            results.append({
+                'id': pk, 'result': 'invalid_transition', 'status': current[pk],
+                'detail': f'Cannot change status from {current[pk]} to {target}',
+            })
+    return Response({'status': target, 'updated': len(to_update), 'results': results})
+
+def _money(value):
+    return str((value or Decimal('0')).quantize(Decimal('0.01')))
+
+def _sales_totals(rows):
+    totals = rows.aggregate(units=Sum('units'), revenue=Sum('revenue'), orders=Sum('orders'))
+    return {
+        'units': totals['units'] or 0,
+        'revenue': _money(totals['revenue']),
+        'orders': totals['orders'] or 0,
+    }
+
+def _sales_series(rows, *group_by):
+    return [
+        {**{name: row[name] for name in group_by}, 'units': row['units'], 'revenue': _money(row['revenue']), 'orders': row['orders']}
+        for row in rows.values(*group_by).annotate(
+            units=Sum('units'), revenue=Sum('revenue'), orders=Sum('orders'),
+        ).order_by(*group_by)
+    ]
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def sales_analytics(request):
+    """
+    Units, revenue and orders between ``start`` and ``end`` (inclusive, default
+    the last 30 days) from the daily rollups, with a per-day series; vendors
+    also get a per-product breakdown, whose ``orders`` are the orders
+    containing that product. Cancelled orders are not counted.
+    """
+    user = request.user
+    if user.role not in ('vendor', 'dropshipper'):
+        return Response({'detail': 'Only vendors and dropshippers have sales analytics'}, status=status.HTTP_403_FORBIDDEN)
+    serializer = SalesRangeSerializer(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+    start, end = serializer.validated_data['start'], serializer.validated_data['end']
+
+    if user.role == 'vendor':
+        rows = VendorSalesDaily.objects.filter(vendor=user, day__range=(start, end))
+    else:
+        rows = ShopSalesDaily.objects.filter(shop__owner=user, day__range=(start, end))
+    data = {
+        'start': start,
+        'end': end,
+        'totals': _sales_totals(rows),
+        'days': _sales_series(rows, 'day'),
+    }
+    if user.role == 'vendor':
+        # Summing the per-product rows would count an order once per product in it
+        orders = dict(
+            VendorOrdersDaily.objects.filter(vendor=user, day__range=(start, end)).values_list('day', 'orders')
+        )
+        data['totals']['orders'] = sum(orders.values())
+        for row in data['days']:
+            row['orders'] = orders.get(row['day'], 0)
+        data['products'] = _sales_series(rows, 'product', 'product__title')
+        for row in data['products']:
+            row['product_title'] = row.pop('product__title')
+    return Response(data)